@@ -9,7 +9,7 @@ import hashlib
 
 from ws.client import API
 import ws.ArchWiki.lang
-from ws.utils import is_ascii, list_chunks
+from ws.utils import is_ascii
 
 class Downloader:
     extension = "mediawiki"
@@ -96,15 +96,21 @@ class Downloader:
         # sort by title (first item in tuple)
         to_be_updated.sort()
 
-        for snippet in list_chunks(to_be_updated, api.max_ids_per_query):
-            # unzip the list of tuples
-            titles, pageids, fnames = zip(*snippet)
-            print("  [downloading]   '{}' ... '{}'".format(titles[0], titles[-1]))
-            result = api.call_api(action="query", pageids="|".join(str(pid) for pid in pageids), prop="revisions", rvprop="content")
+        if not to_be_updated:
+            return
 
+        # unzip the list of tuples
+        titles, pageids, fnames = zip(*to_be_updated)
+        fnames = dict(zip(pageids, fnames))
+        print("  [downloading]   '{}' ... '{}'".format(titles[0], titles[-1]))
+
+        for result in api.fetch_by_ids("pageids", pageids, {"prop": "revisions", "rvprop": "content"}):
             for page in result["pages"].values():
+                # the content of other pages comes in the continued queries
+                if "revisions" not in page:
+                    continue
                 pageid = page["pageid"]
-                fname = fnames[pageids.index(pageid)]
+                fname = fnames[pageid]
                 text = page["revisions"][0]["*"]
 
                 # ensure that target directory exists (necessary for subpages)
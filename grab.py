@@ -555,10 +555,16 @@ if __name__ == "__main__":
             help="synchronize the SQL database with the remote wiki API (default: %(default)s)")
     argparser.add_argument("--no-sync", dest="sync", action="store_false",
             help="opposite of --sync")
+    argparser.add_argument("--sync-workers", metavar="N", type=int, default=4,
+            help="maximum number of grabbers running concurrently during the synchronization (default: %(default)s)")
+    argparser.add_argument("--full-content", action="store_true", default=False,
+            help="synchronize the content of all revisions, not only the latest ones (default: %(default)s)")
     argparser.add_argument("--parser-cache", dest="parser_cache", action="store_true", default=False,
             help="update parser cache (default: %(default)s)")
     argparser.add_argument("--no-parser-cache", dest="parser_cache", action="store_false",
             help="opposite of --parser-cache")
+    argparser.add_argument("--parser-cache-workers", metavar="N", type=int, default=1,
+            help="number of worker processes for updating the parser cache (default: %(default)s)")
 
     args = argparser.parse_args()
 
@@ -571,8 +577,10 @@ if __name__ == "__main__":
     if args.sync:
         require_login(api)
 
-        db.sync_with_api(api)
+        db.sync_with_api(api, workers=args.sync_workers)
         db.sync_latest_revisions_content(api)
+        if args.full_content:
+            db.sync_revisions_content(api, workers=args.sync_workers)
 
         check_titles(api, db)
         check_specific_titles(api, db)
@@ -590,7 +598,7 @@ if __name__ == "__main__":
         check_revisions_of_main_page(api, db)
 
     if args.parser_cache:
-        db.update_parser_cache()
+        db.update_parser_cache(workers=args.parser_cache_workers, cache_dir=args.cache_dir)
 
         # fails due to https://github.com/earwig/mwparserfromhell/issues/198
         # ([[Template:META Error]] gets expanded because of it)
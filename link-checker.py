@@ -209,14 +209,39 @@ class WikilinkRules:
 
         # mapping of canonical titles to displaytitles
         self.displaytitles = {}
-        for ns in self.api.site.namespaces.keys():
-            if ns < 0:
-                continue
-            for page in self.api.generator(generator="allpages", gaplimit="max", gapnamespace=ns, prop="info", inprop="displaytitle"):
-                self.displaytitles[page["title"]] = page["displaytitle"]
+        params_list = [dict(generator="allpages", gaplimit="max", gapnamespace=ns, prop="info", inprop="displaytitle")
+                       for ns in self.api.site.namespaces.keys() if ns >= 0]
+        for page in self.api.generator_parallel(params_list):
+            self.displaytitles[page["title"]] = page["displaytitle"]
 
         self.void_update_cache = set()
 
+        # sections of the pages targeted by the wikilinks on the current page,
+        # see prefetch_sections
+        self.sections = {}
+
+    def prefetch_sections(self, src_title, wikicode):
+        """
+        Fetches the sections of all pages targeted by the wikilinks with a
+        section fragment at once, so that :py:meth:`check_anchor` does not have
+        to query the database for each wikilink.
+        """
+        targets = set()
+        for wikilink in wikicode.ifilter_wikilinks(recursive=True):
+            try:
+                title = self.api.Title(wikilink.title)
+                if title.iwprefix or not title.sectionname:
+                    continue
+                target = title.make_absolute(src_title)
+                if target.namespacenumber < 0:
+                    continue
+                if target.fullpagename in self.api.redirects.map:
+                    target = self.api.Title(self.api.redirects.resolve(target.fullpagename))
+            except TitleError:
+                continue
+            targets.add(target.fullpagename)
+        self.sections = self.db.get_sections(targets)
+
     def check_trivial(self, wikilink, title):
         """
         Perform trivial simplification, replace `[[Foo|foo]]` with `[[foo]]`.
@@ -427,14 +452,15 @@ class WikilinkRules:
                 anchor_on_redirect_to_section = True
 
         # get lists of section headings and anchors
-        _result = self.db.query(titles=_target_title.fullpagename, prop="sections", secprop={"title", "anchor"})
-        _result = list(_result)
-        assert len(_result) == 1
-        if "missing" in _result[0]:
+        # (the wikilink might have been changed since the sections were prefetched)
+        if _target_title.fullpagename not in self.sections:
+            self.sections.update(self.db.get_sections([_target_title.fullpagename]))
+        sections = self.sections[_target_title.fullpagename]
+        if sections is None:
             logger.error("could not find content of page: '{}' (wikilink {})".format(_target_title.fullpagename, wikilink))
             return None
-        headings = [section["title"] for section in _result[0].get("sections", [])]
-        anchors = [section["anchor"] for section in _result[0].get("sections", [])]
+        headings = [section["title"] for section in sections]
+        anchors = [section["anchor"] for section in sections]
 
         if len(headings) == 0:
             logger.warning("wikilink with broken section fragment: {}".format(wikilink))
@@ -770,6 +796,7 @@ class LinkChecker(ExtlinkRules, WikilinkRules, ManTemplateRules):
             with summary("replaced external links"):
                 self.update_extlink(wikicode, extlink)
 
+        self.prefetch_sections(src_title, wikicode)
         for wikilink in wikicode.ifilter_wikilinks(recursive=True):
             # skip links inside article status templates
             parent = wikicode.get(wikicode.index(wikilink, recursive=True))
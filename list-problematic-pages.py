@@ -7,7 +7,7 @@ from ws.db.database import Database
 from ws.parser_helpers.encodings import dotencode
 import ws.ArchWiki.lang as lang
 
-def valid_sectionname(db, title):
+def valid_sectionname(db, title, sections=None):
     """
     Checks if the ``sectionname`` property of given title is valid, i.e. if a
     corresponding section exists on a page with given title.
@@ -19,6 +19,9 @@ def valid_sectionname(db, title):
     :param ws.db.database.Database db: database object
     :param title: parsed title of the wikilink to be checked
     :type title: ws.parser_helpers.title.Title
+    :param dict sections:
+        sections of the target pages prefetched by
+        :py:meth:`ws.db.database.Database.get_sections`
     :returns: ``True`` if the anchor corresponds to an existing section
     """
     # we can't check interwiki links
@@ -30,9 +33,9 @@ def valid_sectionname(db, title):
         return True
 
     # get list of valid anchors
-    result = db.query(titles=title.fullpagename, prop="sections", secprop={"anchor"})
-    page = next(result)
-    anchors = [section["anchor"] for section in page.get("sections", [])]
+    if sections is None or title.fullpagename not in sections:
+        sections = db.get_sections([title.fullpagename])
+    anchors = [section["anchor"] for section in sections[title.fullpagename] or []]
 
     # encode the given anchor and validate
     return dotencode(title.sectionname) in anchors
@@ -45,12 +48,15 @@ def list_redirects_broken_fragments(api, db):
     # limit to redirects pointing to the content namespaces
     redirects = api.redirects.fetch(target_namespaces=[0, 4, 12])
 
+    # fetch the sections of all targets at once
+    sections = db.get_sections({api.Title(target).fullpagename for target in redirects.values()})
+
     for source in sorted(redirects.keys()):
         target = redirects[source]
         title = api.Title(target)
 
         # limit to redirects with broken fragment
-        if valid_sectionname(db, title):
+        if valid_sectionname(db, title, sections):
             continue
 
         print("* [[{}]] --> [[{}]]".format(source, target))
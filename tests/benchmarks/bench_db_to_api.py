@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+
+"""
+Micro-benchmark comparing the conversion of result rows into the API format
+by :py:meth:`ws.db.selects.RecentChanges.db_to_api` with the previous
+implementation, which rebuilt the mappings of columns and iterated over
+``row.items()`` for every row.
+
+The rows are produced by an in-memory SQLite database, so that the benchmark
+works with the same row objects as the real queries.
+
+Run from the repository root as ``python tests/benchmarks/bench_db_to_api.py``.
+"""
+
+import datetime
+import os.path
+import sys
+import timeit
+
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from ws.db.selects import RecentChanges
+import ws.db.mw_constants as mwconst
+
+def old_db_to_api(row):
+    flags = RecentChanges.FLAGS
+    bool_flags = RecentChanges.BOOL_FLAGS
+    zeroable_flags = RecentChanges.ZEROABLE_FLAGS
+
+    api_entry = {}
+    for key, value in row.items():
+        if key in flags:
+            api_key = flags[key]
+            # normal keys are not added if the value is None
+            if value is not None:
+                api_entry[api_key] = value
+            # some keys produce 0 instead of None
+            elif key in zeroable_flags:
+                api_entry[api_key] = 0
+        elif key in bool_flags:
+            if value:
+                api_key = bool_flags[key]
+                api_entry[api_key] = ""
+
+    # add special values
+    if "nss_name" in row:
+        if row["nss_name"]:
+            api_entry["title"] = "{}:{}".format(row["nss_name"], row["rc_title"])
+        else:
+            api_entry["title"] = row["rc_title"]
+    if api_entry.get("userid") == 0:
+        api_entry["anon"] = ""
+    # parse rc_deleted
+    if row["rc_deleted"] & mwconst.DELETED_TEXT and row["rc_type"] != "log":
+        api_entry["sha1hidden"] = ""
+    if row["rc_deleted"] & mwconst.DELETED_ACTION and row["rc_type"] == "log":
+        api_entry["actionhidden"] = ""
+    if row["rc_deleted"] & mwconst.DELETED_COMMENT:
+        api_entry["commenthidden"] = ""
+    if row["rc_deleted"] & mwconst.DELETED_USER:
+        api_entry["userhidden"] = ""
+    if row["rc_deleted"] & mwconst.DELETED_RESTRICTED:
+        api_entry["suppressed"] = ""
+
+    return api_entry
+
+def make_rows(count=100000):
+    """
+    Returns a list of rows similar to the result of list=recentchanges with
+    the default props.
+    """
+    engine = sa.create_engine("sqlite://")
+    metadata = sa.MetaData()
+    rc = sa.Table("recentchanges", metadata,
+        sa.Column("rc_id", sa.Integer, primary_key=True),
+        sa.Column("rc_timestamp", sa.DateTime),
+        sa.Column("rc_user", sa.Integer),
+        sa.Column("rc_user_text", sa.UnicodeText),
+        sa.Column("rc_namespace", sa.Integer),
+        sa.Column("rc_title", sa.UnicodeText),
+        sa.Column("rc_comment", sa.UnicodeText),
+        sa.Column("rc_minor", sa.Boolean),
+        sa.Column("rc_bot", sa.Boolean),
+        sa.Column("rc_new", sa.Boolean),
+        sa.Column("rc_cur_id", sa.Integer),
+        sa.Column("rc_this_oldid", sa.Integer),
+        sa.Column("rc_last_oldid", sa.Integer),
+        sa.Column("rc_type", sa.UnicodeText),
+        sa.Column("rc_patrolled", sa.Boolean),
+        sa.Column("rc_old_len", sa.Integer),
+        sa.Column("rc_new_len", sa.Integer),
+        sa.Column("rc_deleted", sa.Integer),
+        sa.Column("nss_name", sa.UnicodeText),
+    )
+    metadata.create_all(engine)
+    timestamp = datetime.datetime(2018, 1, 2, 3, 4, 5)
+    engine.execute(rc.insert(), [{
+            "rc_id": i,
+            "rc_timestamp": timestamp,
+            "rc_user": i % 17 or None,
+            "rc_user_text": "User {}".format(i % 17),
+            "rc_namespace": i % 2,
+            "rc_title": "Page {}".format(i),
+            "rc_comment": "comment {}".format(i),
+            "rc_minor": i % 3 == 0,
+            "rc_bot": False,
+            "rc_new": i % 5 == 0,
+            "rc_cur_id": i,
+            "rc_this_oldid": 1000 + i,
+            "rc_last_oldid": 999 + i,
+            "rc_type": "edit",
+            "rc_patrolled": True,
+            "rc_old_len": 100,
+            "rc_new_len": 120,
+            "rc_deleted": 0,
+            "nss_name": "Talk" if i % 2 else "",
+        } for i in range(count)])
+    return engine.execute(rc.select().order_by(rc.c.rc_id)).fetchall()
+
+def main():
+    rows = make_rows()
+
+    # check that both implementations give the same results
+    assert [old_db_to_api(row) for row in rows] == [RecentChanges.db_to_api(row) for row in rows]
+
+    number = 3
+    for name, func in [
+            ("db_to_api (old)", old_db_to_api),
+            ("db_to_api (new)", RecentChanges.db_to_api),
+        ]:
+        time = min(timeit.repeat(lambda: [func(row) for row in rows], number=number, repeat=3)) / number
+        print("{:<25} {:10.0f} rows/s".format(name, len(rows) / time))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#! /usr/bin/env python3
+
+"""
+Micro-benchmark comparing :py:func:`ws.utils.parse_timestamps_in_struct` and
+:py:func:`ws.utils.serialize_timestamps` with the previous implementations
+based on :py:func:`ws.utils.gen_nested_values` and :py:func:`copy.deepcopy`.
+
+Run from the repository root as ``python tests/benchmarks/bench_timestamps.py``.
+"""
+
+import copy
+import datetime
+import json
+import os.path
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from ws.utils import gen_nested_values, parse_date, format_date, \
+                     parse_timestamps_in_struct, serialize_timestamps
+
+def old_parse_timestamps_in_struct(struct):
+    def set_ts(struct, keys, value):
+        for k in keys[:-1]:
+            struct = struct[k]
+        struct[keys[-1]] = value
+
+    for keys, value in gen_nested_values(struct):
+        if isinstance(value, str):
+            _strkeys = "".join(str(k) for k in keys)
+            if "timestamp" not in _strkeys and "registration" not in _strkeys and "expiry" not in _strkeys and "touched" not in _strkeys:
+                continue
+
+            if value.lower() == "infinity":
+                set_ts(struct, keys, datetime.datetime.max)
+            elif value.lower() == "-infinity":
+                set_ts(struct, keys, datetime.datetime.min)
+            elif value.lower() == "indefinite":
+                set_ts(struct, keys, None)
+            elif (len(value) == 20 and value[4] == "-" and value[7] == "-" and
+                    value[10] == "T" and value[13] == ":" and value[16] == ":"
+                    and value[19] == "Z"):
+                try:
+                    ts = parse_date(value)
+                except ValueError:
+                    continue
+                set_ts(struct, keys, ts)
+
+def old_serialize_params(params):
+    params = copy.deepcopy(params)
+    for keys, value in gen_nested_values(params):
+        if isinstance(value, datetime.datetime):
+            struct = params
+            for k in keys[:-1]:
+                struct = struct[k]
+            struct[keys[-1]] = format_date(value)
+    return params
+
+def make_response(revisions=500, content_size=2000):
+    """
+    Returns a JSON-encoded response similar to list=allrevisions with content.
+    """
+    pages = []
+    for i in range(revisions):
+        pages.append({
+            "pageid": i,
+            "ns": 0,
+            "title": "Page {}".format(i),
+            "revisions": [{
+                "revid": 1000 + i,
+                "parentid": 999 + i,
+                "user": "User {}".format(i % 17),
+                "userid": i % 17,
+                "timestamp": "2018-01-02T03:04:05Z",
+                "comment": "comment {}".format(i),
+                "size": content_size,
+                "sha1": "0123456789abcdef0123456789abcdef01234567",
+                "contentformat": "text/x-wiki",
+                "contentmodel": "wikitext",
+                "*": "x" * content_size,
+            }],
+        })
+    result = {
+        "continue": {"arvcontinue": "20180102030405|2000", "continue": "-||"},
+        "query": {"allrevisions": pages},
+    }
+    return json.dumps(result)
+
+def main():
+    response = make_response()
+    params = {
+        "action": "query",
+        "list": "allrevisions",
+        "arvprop": "ids|timestamp|user|comment|size|sha1|content",
+        "arvlimit": "max",
+        "arvstart": datetime.datetime(2018, 1, 1),
+        "text": "x" * 100000,
+    }
+
+    # check that both implementations give the same results
+    old = json.loads(response)
+    new = json.loads(response)
+    old_parse_timestamps_in_struct(old)
+    parse_timestamps_in_struct(new)
+    assert old == new
+    assert old_serialize_params(params) == serialize_timestamps(params)
+
+    number = 20
+    for name, stmt in [
+            ("parse (old)", lambda: old_parse_timestamps_in_struct(json.loads(response))),
+            ("parse (new)", lambda: parse_timestamps_in_struct(json.loads(response))),
+            ("json.loads only", lambda: json.loads(response)),
+            ("serialize params (old)", lambda: old_serialize_params(params)),
+            ("serialize params (new)", lambda: serialize_timestamps(params)),
+        ]:
+        time = min(timeit.repeat(stmt, number=number, repeat=3)) / number
+        print("{:<25} {:8.3f} ms".format(name, time * 1000))
+
+if __name__ == "__main__":
+    main()
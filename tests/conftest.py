@@ -1,5 +1,7 @@
 #! /usr/bin/env python3
 
+import types
+
 import sqlalchemy as sa
 import pytest
 
@@ -59,3 +61,33 @@ def db(pg_engine):
     Return a Database instance bound to the engine fixture.
     """
     return TestingDatabase(pg_engine)
+
+@pytest.fixture(scope="session")
+def offline_db():
+    """
+    Return a namespace of the table definitions, which is sufficient for
+    building the queries without a database connection.
+    """
+    metadata = sa.MetaData()
+    schema.create_tables(metadata)
+    return types.SimpleNamespace(**metadata.tables)
+
+@pytest.fixture(scope="function")
+def wiki_pages(mediawiki, db):
+    """
+    Return a function which clears the wiki, creates pages "Test 0", "Test 1",
+    etc. and syncs the database.
+
+    The function takes the number of pages, the content (a format string with
+    the number of the page as the argument), and the ``sync`` and
+    ``with_content`` flags. It returns the API instance of the wiki.
+    """
+    def create(count, content="", *, sync=True, with_content=False):
+        mediawiki.clear()
+        api = mediawiki.api
+        for i in range(count):
+            api.create("Test {}".format(i), content.format(i), "summary")
+        if sync:
+            db.sync_with_api(api, with_content=with_content)
+        return api
+    return create
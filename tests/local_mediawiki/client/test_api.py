@@ -1,11 +1,13 @@
 #! /usr/bin/env python3
 
+import datetime
 import warnings
 
 import sqlalchemy as sa
 import pytest
 
 from ws.client.api import LoginFailed
+from ws.client.connection import APIError
 
 class test_simple_queries:
 # TODO: figure out how to restore the fixture state after the test
@@ -138,3 +140,88 @@ class test_query_continue:
     def test_query_continue_params_kwargs(self, mediawiki):
         with pytest.raises(ValueError):
             next(mediawiki.api.query_continue(params={"foo": 0}, bar=1))
+
+    def test_query_continue_parallel(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        params_list = [
+            {"list": "allpages", "aplimit": 1, "apto": "Test 4"},
+            {"list": "allpages", "aplimit": 1, "apfrom": "Test 5"},
+        ]
+        q = api.query_continue_parallel(params_list, max_workers=2)
+        titles = []
+        for chunk in q:
+            titles += [i["title"] for i in chunk["allpages"]]
+        assert titles == self.titles
+
+        titles = [page["title"] for page in api.list_parallel(params_list)]
+        assert titles == self.titles
+
+    def test_fetch_by_ids(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        pageids = [page["pageid"] for page in api.list(list="allpages", aplimit="max")]
+        fetched = []
+        for snippet in api.fetch_by_ids("pageids", pageids, {"prop": "info"}, prefetch=2):
+            fetched += snippet["pages"].values()
+        assert sorted(page["pageid"] for page in fetched) == sorted(pageids)
+        assert sorted(page["title"] for page in fetched) == self.titles
+
+    def test_fetch_by_ids_invalid_kind(self, mediawiki):
+        with pytest.raises(ValueError):
+            next(mediawiki.api.fetch_by_ids("users", ["Foo"], {}))
+
+    def test_list_parallel_different_modules(self, mediawiki):
+        params_list = [
+            {"list": "allpages"},
+            {"list": "allusers"},
+        ]
+        with pytest.raises(ValueError):
+            next(mediawiki.api.list_parallel(params_list))
+
+    def test_streaming(self, mediawiki):
+        mediawiki.clear()
+        api = mediawiki.api
+
+        for title in self.titles:
+            api.create(title, title, title)
+
+        titles = [page["title"] for page in api.list_streaming({"list": "allpages", "aplimit": 3})]
+        assert titles == self.titles
+
+        params = {"generator": "allpages", "gaplimit": 3, "prop": "revisions", "rvprop": "content|timestamp"}
+        pages = list(api.generator_streaming(params))
+        assert sorted(page["title"] for page in pages) == self.titles
+        for page in pages:
+            assert page["revisions"][0]["*"] == page["title"]
+            assert isinstance(page["revisions"][0]["timestamp"], datetime.datetime)
+
+    def test_streaming_error(self, mediawiki):
+        with pytest.raises(APIError):
+            next(mediawiki.api.list_streaming({"list": "allpages", "apnamespace": "foo"}))
+
+class test_title:
+    def test_title_context_is_shared(self, mediawiki):
+        api = mediawiki.api
+        assert api.Title("Foo").context is api.Title("Bar").context
+
+    def test_title_copy_on_return(self, mediawiki):
+        api = mediawiki.api
+        title = api.Title("Foo")
+        title.pagename = "Bar"
+        assert api.Title("Foo").pagename == "Foo"
+
+    def test_title_context_invalidation(self, mediawiki):
+        api = mediawiki.api
+        context = api.title_context
+        api.site.fetch("namespaces")
+        assert api.title_context is not context
+        assert api.title_context == context
@@ -60,3 +60,25 @@ class test_connection:
         api = mediawiki.api
         with pytest.raises(ValueError):
             api.call_api(params={"meta": "siteinfo"}, action="query")
+
+class test_cookies:
+    def test_save_only_changed(self, tmpdir):
+        import http.cookiejar as cookielib
+        import requests
+        cookie_file = str(tmpdir.join("test.cookie"))
+        session = ws.client.connection.Connection.make_session(cookie_file=cookie_file)
+        conn = ws.client.connection.Connection("http://localhost/api.php", "http://localhost/index.php", session)
+
+        mtime = tmpdir.join("test.cookie").mtime()
+        tmpdir.join("test.cookie").setmtime(mtime - 10)
+        conn.save_cookies(only_changed=True)
+        assert tmpdir.join("test.cookie").mtime() == mtime - 10
+
+        cookie = requests.cookies.create_cookie("foo", "bar", domain="localhost", expires=2**31 - 1, discard=False)
+        session.cookies.set_cookie(cookie)
+        conn.save_cookies(only_changed=True)
+        assert tmpdir.join("test.cookie").mtime() != mtime - 10
+
+        jar = cookielib.LWPCookieJar(cookie_file)
+        jar.load()
+        assert [c.value for c in jar] == ["bar"]
@@ -0,0 +1,35 @@
+#! /usr/bin/env python3
+
+import pytest
+
+from ws.db.compression import get_methods, compress_text, decompress_text
+from ws.db.selects.props.revisions import Revisions
+
+@pytest.mark.parametrize("method", get_methods())
+def test_roundtrip(method):
+    text = "== Heading ==\nSome [[link]] with ünïcödé.\n" * 100
+    blob, flags = compress_text(text, method)
+    assert flags == method
+    assert len(blob) < len(text)
+    assert decompress_text(blob, flags) == text
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        compress_text("foo", "bar")
+    with pytest.raises(ValueError):
+        decompress_text(b"foo", "bar")
+
+def test_db_to_api():
+    blob, flags = compress_text("content", "zlib")
+    row = {
+        "rev_id": 1,
+        "old_text": None,
+        "old_blob": blob,
+        "old_flags": flags,
+        "nss_name": "",
+        "page_title": "Foo",
+    }
+    assert Revisions.db_to_api(row) == {"revid": 1, "*": "content", "title": "Foo"}
+
+    row.update(old_text="plain", old_blob=None, old_flags="")
+    assert Revisions.db_to_api(row) == {"revid": 1, "*": "plain", "title": "Foo"}
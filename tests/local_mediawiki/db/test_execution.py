@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+
+import sqlalchemy as sa
+
+from sqlalchemy.dialects import postgresql
+
+from ws.db.execution import bulk_insert, _copy_format_value, StagedInsert
+
+def test_copy_format_value():
+    assert _copy_format_value(None) == "\\N"
+    assert _copy_format_value(True) == "t"
+    assert _copy_format_value(False) == "f"
+    assert _copy_format_value(42) == "42"
+    assert _copy_format_value("a\tb\nc\\d\re") == "a\\tb\\nc\\\\d\\re"
+
+def test_bulk_insert(db):
+    rows = [
+        {"iw_prefix": "foo", "iw_url": "http://foo/$1", "iw_local": True},
+        {"iw_prefix": "bar", "iw_url": "http://bar/\t$1\n", "iw_local": False, "iw_api": "http://bar/api.php"},
+    ]
+    with db.engine.begin() as conn:
+        bulk_insert(conn, db.interwiki, rows)
+
+    result = db.engine.execute(sa.select([db.interwiki]).order_by(db.interwiki.c.iw_prefix))
+    assert [tuple(row) for row in result] == [
+        ("bar", "http://bar/\t$1\n", "http://bar/api.php", False, False),
+        ("foo", "http://foo/$1", None, True, False),
+    ]
+
+def test_copy_format_bytes():
+    assert _copy_format_value(b"\x00\xff") == "\\\\x00ff"
+
+def test_staged_upsert_merge():
+    metadata = sa.MetaData()
+    table = sa.Table("foo", metadata,
+                     sa.Column("id", sa.Integer, primary_key=True),
+                     sa.Column("value", sa.UnicodeText))
+    staged = StagedInsert.upsert(table, index_elements=[table.c.id], update=["value"])
+    assert staged.staging.name == "staging_foo"
+    assert [c.name for c in staged.staging.columns] == ["id", "value", "staging_seq"]
+
+    merge = staged.merge(["id", "value"])
+    assert staged.merge(("id", "value")) is merge
+    sql = str(merge.compile(dialect=postgresql.dialect()))
+    assert "SELECT DISTINCT ON (staging_foo.id)" in sql
+    assert "ORDER BY staging_foo.id, staging_foo.staging_seq DESC" in sql
+    assert "ON CONFLICT (id) DO UPDATE SET value = excluded.value" in sql
+
+    sql = str(staged.merge(["id"]).compile(dialect=postgresql.dialect()))
+    assert "DISTINCT" not in sql
+    assert "ON CONFLICT (id) DO NOTHING" in sql
+
+def test_staged_insert(db):
+    staged = StagedInsert.upsert(db.interwiki, index_elements=[db.interwiki.c.iw_prefix], update=["iw_url"])
+    with db.engine.begin() as conn:
+        staged.execute(conn, [{"iw_prefix": "foo", "iw_url": "http://foo/$1", "iw_local": True}])
+        staged.execute(conn, [
+            {"iw_prefix": "foo", "iw_url": "http://foo.org/$1", "iw_local": True},
+            {"iw_prefix": "bar", "iw_url": "http://bar/$1", "iw_local": False},
+        ])
+
+    result = db.engine.execute(sa.select([db.interwiki.c.iw_prefix, db.interwiki.c.iw_url]).order_by(db.interwiki.c.iw_prefix))
+    assert [tuple(row) for row in result] == [
+        ("bar", "http://bar/$1"),
+        ("foo", "http://foo.org/$1"),
+    ]
+
+def test_staged_insert_duplicates(db):
+    staged = StagedInsert.upsert(db.interwiki, index_elements=[db.interwiki.c.iw_prefix], update=["iw_url"])
+    with db.engine.begin() as conn:
+        staged.execute(conn, [
+            {"iw_prefix": "foo", "iw_url": "http://foo/$1", "iw_local": True},
+            {"iw_prefix": "foo", "iw_url": "http://foo.org/$1", "iw_local": True},
+            {"iw_prefix": "foo", "iw_url": "http://foo.net/$1", "iw_local": True},
+        ])
+
+    # the last row wins
+    result = db.engine.execute(sa.select([db.interwiki.c.iw_prefix, db.interwiki.c.iw_url]))
+    assert [tuple(row) for row in result] == [("foo", "http://foo.net/$1")]
@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+
+import threading
+import time
+import types
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from ws.db.grabbers import GRABBERS, run_grabbers, GrabberLogging, GrabberRecentChanges, GrabberRevisions
+from ws.db.grabbers.GrabberBase import Checkpoint
+
+def make_grabber(name, dependencies):
+    return type(name, (), {"DEPENDENCIES": dependencies})
+
+class test_run_grabbers:
+    def test_declared_order(self):
+        # the grabbers must be listed in an order satisfying their dependencies
+        seen = set()
+        for klass in GRABBERS:
+            assert set(klass.DEPENDENCIES) <= seen
+            seen.add(klass.__name__)
+
+    def test_serial(self):
+        A = make_grabber("A", [])
+        B = make_grabber("B", [])
+        C = make_grabber("C", ["A"])
+        calls = []
+        tasks = [(klass, lambda klass=klass: calls.append(klass.__name__)) for klass in [A, B, C]]
+        timings = run_grabbers(tasks, workers=1)
+        assert calls == ["A", "B", "C"]
+        assert [name for name, _, _ in timings] == ["A", "B", "C"]
+
+    def test_dependencies(self):
+        A = make_grabber("A", [])
+        B = make_grabber("B", [])
+        C = make_grabber("C", ["A", "B"])
+        D = make_grabber("D", ["A"])
+        lock = threading.Lock()
+        events = []
+        def function(name):
+            with lock:
+                events.append(("start", name))
+            time.sleep(0.05)
+            with lock:
+                events.append(("end", name))
+        tasks = [(klass, lambda klass=klass: function(klass.__name__)) for klass in [A, B, C, D]]
+        run_grabbers(tasks, workers=4)
+        for name, deps in [("C", ["A", "B"]), ("D", ["A"])]:
+            for dep in deps:
+                assert events.index(("end", dep)) < events.index(("start", name))
+        # A and B are independent
+        assert events[:2] == [("start", "A"), ("start", "B")] or events[:2] == [("start", "B"), ("start", "A")]
+
+    def test_failure(self):
+        A = make_grabber("A", [])
+        B = make_grabber("B", ["A"])
+        calls = []
+        def fail():
+            raise RuntimeError("A failed")
+        tasks = [(A, fail), (B, lambda: calls.append("B"))]
+        with pytest.raises(RuntimeError):
+            run_grabbers(tasks, workers=2)
+        assert calls == []
+
+    def test_invalid_order(self):
+        A = make_grabber("A", ["B"])
+        B = make_grabber("B", [])
+        with pytest.raises(ValueError):
+            run_grabbers([(A, lambda: None), (B, lambda: None)])
+
+def test_construct_grabbers(offline_db):
+    # the queries are built in the constructors
+    api = types.SimpleNamespace(user=types.SimpleNamespace(rights=["patrol"]))
+    for klass in GRABBERS:
+        g = klass(api, offline_db)
+        for statement in g.bulk_sql:
+            assert statement in g.sql.values()
+
+def test_staged_tag_changes(offline_db):
+    g = GrabberLogging(types.SimpleNamespace(), offline_db)
+    staged = g.sql["sync", "tags"]
+    assert staged.target is offline_db.tagged_logevent
+    assert [c.name for c in staged.staging.columns] == ["b_log_id", "b_tag_id", "b_added"]
+    sql = [str(s.compile(dialect=postgresql.dialect())) for s in staged.merge(())]
+    assert len(sql) == 4
+    assert sql[0].startswith("DELETE FROM tagged_logevent USING")
+    assert sql[1].startswith("INSERT INTO tagged_logevent (tgle_log_id, tgle_tag_id) SELECT logging.log_id,")
+    assert sql[2].startswith("DELETE FROM tagged_recentchange USING")
+    assert "JOIN recentchanges ON recentchanges.rc_logid = staging_tagged_logevent_changes.b_log_id" in sql[3]
+
+def test_tag_aggregate_refresh(offline_db):
+    api = types.SimpleNamespace(user=types.SimpleNamespace(rights=[]))
+    g = GrabberRecentChanges(api, offline_db)
+    sql = [str(s.compile(dialect=postgresql.dialect())) for s in g.refresh_sql]
+    assert len(sql) == 2
+    assert sql[0].startswith("DELETE FROM tagged_recentchange_tgname WHERE NOT (EXISTS (SELECT")
+    assert sql[1].startswith("INSERT INTO tagged_recentchange_tgname (tgrc_rc_id, tag_names) "
+                             "SELECT tagged_recentchange.tgrc_rc_id, array_agg(tag.tag_name ORDER BY tag.tag_name)")
+    assert sql[1].endswith("ON CONFLICT (tgrc_rc_id) DO UPDATE SET tag_names = excluded.tag_names "
+                           "WHERE tagged_recentchange_tgname.tag_names != excluded.tag_names")
+
+    # updates refresh only the touched rows
+    sql = [str(s.compile(dialect=postgresql.dialect())) for s in g.refresh_touched_sql]
+    assert "tagged_recentchange_tgname.tgrc_rc_id IN ([EXPANDING_b_rc_ids])" in sql[0]
+    assert "WHERE tagged_recentchange.tgrc_rc_id IN ([EXPANDING_b_rc_ids]) GROUP BY" in sql[1]
+
+    g = GrabberLogging(types.SimpleNamespace(), offline_db)
+    assert g.refresh_sql == []
+    sql = [str(s.compile(dialect=postgresql.dialect())) for s in g.refresh_touched_sql]
+    assert "WHERE recentchanges.rc_logid IN ([EXPANDING_b_log_ids])" in sql[1]
+
+def test_collect_touched_ids(offline_db):
+    api = types.SimpleNamespace(user=types.SimpleNamespace(rights=[]))
+    g = GrabberRevisions(api, offline_db)
+    touched = {}
+    g._collect_touched_ids(touched, g.sql["insert", "tagged_revision"], {"b_rev_id": 1, "b_tag_id": 2})
+    g._collect_touched_ids(touched, g.sql["sync", "tags"], {"b_rev_id": 3, "b_tag_id": 2, "b_added": True})
+    g._collect_touched_ids(touched, g.sql["insert", "revision"], {"rev_id": 4})
+    assert touched == {"b_rev_ids": {1}, "b_changed_rev_ids": {3}}
+
+class test_resumable_insert:
+    class Interrupted(Exception):
+        pass
+
+    def test_logging(self, wiki_pages, db):
+        api = wiki_pages(5, sync=False)
+
+        # sync the dependencies of the logging grabber
+        for klass in GRABBERS:
+            if klass.__name__ in GrabberLogging.DEPENDENCIES:
+                klass(api, db).update()
+
+        def make_grabber(interrupt):
+            g = GrabberLogging(api, db)
+            g.INSERT_CHUNK_ROWS = 1
+            g.le_params = dict(g.le_params, lelimit=2)
+            gen_insert_resumable = g.gen_insert_resumable
+            def gen(last_continue):
+                checkpoints = 0
+                for item in gen_insert_resumable(last_continue):
+                    yield item
+                    if isinstance(item, Checkpoint):
+                        checkpoints += 1
+                        if interrupt and checkpoints == 2:
+                            raise self.Interrupted
+            g.gen_insert_resumable = gen
+            return g
+
+        with pytest.raises(self.Interrupted):
+            make_grabber(interrupt=True).update()
+        g = make_grabber(interrupt=False)
+        timestamp, last_continue = g._get_sync_state()
+        assert timestamp is not None
+        assert last_continue is not None
+        assert g._get_sync_timestamp() is None
+        committed = list(db.query(list="logevents"))
+        assert 0 < len(committed) < len(list(api.list(list="logevents", lelimit="max")))
+
+        g.update()
+        assert g._get_sync_state() == (timestamp, None)
+        logevents = list(db.query(list="logevents"))
+        assert sorted(le["logid"] for le in logevents) == \
+               sorted(le["logid"] for le in api.list(list="logevents", lelimit="max"))
+
+def test_concurrent_latest_revisions_content(wiki_pages, db):
+    api = wiki_pages(5, "content {}")
+
+    # the text IDs are allocated by the database, so concurrent fetchers
+    # must not collide
+    threads = [threading.Thread(target=db.sync_latest_revisions_content, args=(api,)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    pages = list(db.query(generator="allpages", prop="latestrevisions", rvprop="content"))
+    assert sorted(page["revisions"][0]["*"] for page in pages) == ["content {}".format(i) for i in range(5)]
+    result = db.engine.execute(sa.select([sa.func.count(), sa.func.count(sa.distinct(db.revision.c.rev_text_id))])
+                                 .where(db.revision.c.rev_text_id != None))
+    assert tuple(result.fetchone()) == (5, 5)
+
+def test_revisions_content(wiki_pages, db):
+    api = wiki_pages(1, "first", sync=False)
+    for text in ["second", "first", "second"]:
+        page = next(api.generator(titles="Test 0", prop="revisions", rvprop="timestamp|ids"))
+        api.edit("Test 0", page["pageid"], text, page["revisions"][0]["timestamp"], "summary")
+    db.sync_with_api(api, with_content=False)
+
+    g = GrabberRevisions(api, db)
+    g.CONTENT_RANGE_SIZE = 2
+    # concurrent ranges might store the same content twice
+    g.sync_revisions_content(workers=1)
+
+    revisions = list(db.query(prop="revisions", titles="Test 0", rvprop="ids|content", rvlimit="max", rvdir="newer"))[0]["revisions"]
+    assert [rev["*"] for rev in revisions] == ["first", "second", "first", "second"]
+    result = db.engine.execute(sa.select([sa.func.count(sa.distinct(db.revision.c.rev_text_id))]))
+    assert result.scalar() == 2
+
+def test_archived_revisions_content(wiki_pages, mediawiki, db):
+    api = wiki_pages(2, "content {}", sync=False)
+    api.call_with_csrftoken(action="delete", title="Test 1")
+    mediawiki.run_jobs()
+    db.sync_with_api(api, with_content=False)
+
+    g = GrabberRevisions(api, db)
+    g.sync_revisions_content(workers=1)
+    assert list(g._get_content_ranges("revision")) == []
+    assert list(g._get_content_ranges("archive")) == []
+
+    text = db.text
+    query = sa.select([text.c.old_text]).select_from(db.archive.join(text, db.archive.c.ar_text_id == text.c.old_id))
+    assert [row[0] for row in db.engine.execute(query)] == ["content 1"]
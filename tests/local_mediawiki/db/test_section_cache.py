@@ -0,0 +1,32 @@
+#! /usr/bin/env python3
+
+def test_get_sections(mediawiki, db):
+    mediawiki.clear()
+    api = mediawiki.api
+    api.create("Foo", "== First ==\n=== Second ===", "summary")
+    api.create("Bar", "no sections", "summary")
+    db.sync_with_api(api, with_content=True)
+    db.update_parser_cache()
+
+    sections = db.get_sections(["Foo", "Bar", "Baz"])
+    assert sections == {
+        "Foo": (
+            {"number": 1, "level": 2, "title": "First", "anchor": "First"},
+            {"number": 2, "level": 3, "title": "Second", "anchor": "Second"},
+        ),
+        "Bar": (),
+        "Baz": None,
+    }
+    assert db.get_sections([]) == {}
+
+    # cached entries are reused
+    hits = db.section_cache.cache_info().hits
+    assert db.get_sections(["Foo"])["Foo"] is sections["Foo"]
+    assert db.section_cache.cache_info().hits == hits + 1
+
+    # parsing a new revision invalidates the entry
+    page = next(api.generator(titles="Foo", prop="revisions", rvprop="timestamp|ids"))
+    api.edit("Foo", page["pageid"], "== Third ==", page["revisions"][0]["timestamp"], "summary")
+    db.sync_with_api(api, with_content=True)
+    db.update_parser_cache()
+    assert db.get_sections(["Foo"]) == {"Foo": ({"number": 1, "level": 2, "title": "Third", "anchor": "Third"},)}
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from ws.db.selects import RecentChanges, AllUsers, _get_cache_key, _build_pageset_query, _KeysetQuery
+
+def test_chunked_pageset(wiki_pages, db):
+    wiki_pages(5, "content {}", with_content=True)
+
+    params = {"generator": "allpages", "prop": {"info", "latestrevisions"}, "rvprop": {"ids", "content"}}
+    expected = list(db.query(params))
+    assert len(expected) == 5
+
+    # the props are attached to chunks of the pageset
+    db.chunk_size = 2
+    assert list(db.query(params)) == expected
+    assert [page["revisions"][0]["*"] for page in expected] == ["content {}".format(i) for i in range(5)]
+
+def test_paginated_list(wiki_pages, db):
+    wiki_pages(5)
+
+    # each chunk is selected by a separate query
+    db.chunk_size = 2
+    assert [page["title"] for page in db.query(list="allpages")] == ["Test {}".format(i) for i in range(5)]
+    assert [page["title"] for page in db.query(list="allpages", apdir="descending")] == ["Test {}".format(i) for i in reversed(range(5))]
+
+def test_raw_result_formats(wiki_pages, db):
+    wiki_pages(3, "content {}", with_content=True)
+
+    rows = list(db.query(list="allpages", result_format="tuples"))
+    assert [row.page_title for row in rows] == ["Test {}".format(i) for i in range(3)]
+
+    db.chunk_size = 2
+    chunks = list(db.query(list="allpages", result_format="columns"))
+    assert [chunk["page_title"] for chunk in chunks] == [("Test 0", "Test 1"), ("Test 2",)]
+
+    params = {"generator": "allpages", "prop": "latestrevisions", "rvprop": {"ids", "content"}}
+    pages = list(db.query(params, result_format="tuples"))
+    assert [page.page_title for page, _ in pages] == ["Test {}".format(i) for i in range(3)]
+    assert [props["latestrevisions"][0].old_text for _, props in pages] == ["content {}".format(i) for i in range(3)]
+
+    chunks = list(db.query(params, result_format="columns"))
+    assert [pages["page_title"] for pages, _ in chunks] == [("Test 0", "Test 1"), ("Test 2",)]
+    assert chunks[1][1]["latestrevisions"]["old_text"] == ("content 2",)
+
+    with pytest.raises(ValueError):
+        db.query(list="allpages", result_format="foo")
+
+def test_convert_flags(monkeypatch):
+    # the cache is shared by all queries in the session
+    monkeypatch.setattr(RecentChanges, "_converters", {}, raising=False)
+    monkeypatch.setattr(RecentChanges, "_last_converter", None, raising=False)
+    row = {
+        "rc_id": 1,
+        "rc_user": None,
+        "rc_comment": None,
+        "rc_minor": True,
+        "rc_bot": False,
+        "rc_title": "Foo",
+    }
+    assert RecentChanges.convert_flags(row) == {"rcid": 1, "userid": 0, "minor": ""}
+    # the converter is compiled once per list of columns
+    assert len(RecentChanges._converters) == 1
+    row.update(rc_user=2, rc_comment="comment", rc_minor=False)
+    assert RecentChanges.convert_flags(row) == {"rcid": 1, "userid": 2, "comment": "comment"}
+    assert len(RecentChanges._converters) == 1
+    assert RecentChanges.convert_flags({"rc_id": 1, "rc_title": "Foo"}) == {"rcid": 1}
+    assert len(RecentChanges._converters) == 2
+    # the classes do not share the cache
+    assert AllUsers.convert_flags({"user_id": 1, "ipb_deleted": True}) == {"userid": 1, "hidden": ""}
+    assert len(RecentChanges._converters) == 2
+
+def test_cache_key():
+    key = _get_cache_key({"titles": "Foo", "prop": {"sections"}, "secprop": {"title"}})
+    assert key == _get_cache_key({"titles": {"Bar", "Baz"}, "prop": {"sections"}, "secprop": {"title"}})
+    assert key != _get_cache_key({"pageids": {1}, "prop": {"sections"}, "secprop": {"title"}})
+    assert key != _get_cache_key({"titles": "Foo", "prop": {"sections"}, "secprop": {"anchor"}})
+    assert _get_cache_key({"titles": "Foo", "prop": {"sections"}, "secprop": [{}]}) is None
+
+def test_build_pageset_query(offline_db):
+    s, query, ex, props = _build_pageset_query(offline_db, {"titles": "Foo", "prop": {"sections"}, "secprop": {"title"}})
+    # the values are bound parameters
+    assert "[EXPANDING_titles]" in str(query.first.compile(dialect=postgresql.dialect()))
+    # the pages are paginated by (namespace, title, page ID)
+    sql = str(query.next.compile(dialect=postgresql.dialect()))
+    assert "(page.page_namespace, page.page_title, page.page_id) > (%(b_keyset_0)s, %(b_keyset_1)s, %(b_keyset_2)s)" in sql
+    assert "ORDER BY page.page_namespace ASC, page.page_title ASC, page.page_id ASC" in sql
+    assert "LIMIT %(b_keyset_limit)s" in sql
+    assert "[EXPANDING_titles]" in str(ex.compile(dialect=postgresql.dialect()))
+    [(name, _s, prop_query)] = props
+    assert name == "sections"
+    assert "[EXPANDING_chunk_pageids]" in str(prop_query.compile(dialect=postgresql.dialect()))
+
+def test_keyset_query(offline_db):
+    page = offline_db.page
+    # the tiebreaker follows the direction of the ordering
+    query = _KeysetQuery(sa.select([page.c.page_title]).order_by(page.c.page_title.desc()), tiebreaker=page.c.page_id)
+    sql = str(query.next.compile(dialect=postgresql.dialect()))
+    assert "(page.page_title, page.page_id) < (%(b_keyset_0)s, %(b_keyset_1)s)" in sql
+    assert "ORDER BY page.page_title DESC, page.page_id DESC" in sql
+    # mixed directions are compared column by column, bounded by the leading column
+    query = _KeysetQuery(sa.select([page.c.page_title]).order_by(page.c.page_namespace.asc(), page.c.page_title.desc()))
+    sql = str(query.next.compile(dialect=postgresql.dialect()))
+    assert "page.page_namespace >= %(b_keyset_0)s AND" in sql
+    assert "page.page_title < %(b_keyset_1)s" in sql
+    with pytest.raises(ValueError):
+        _KeysetQuery(sa.select([page.c.page_title]))
+
+def test_query_cache(wiki_pages, db):
+    wiki_pages(3, "== Section {} ==", with_content=True)
+    db.update_parser_cache()
+
+    db.query_cache.clear()
+    for i in range(3):
+        [page] = db.query(titles="Test {}".format(i), prop="sections", secprop={"title"})
+        assert page["sections"] == [{"title": "Section {}".format(i)}]
+    # the statements are built once
+    assert len(db.query_cache) == 1
+
+    [missing] = db.query(titles="Test 4", prop="sections", secprop={"title"})
+    assert "missing" in missing
+
+    # one-off list= statements are not compiled into the shared cache
+    db.compiled_cache.clear()
+    list(db.query(list="allpages", apfrom="Test 1"))
+    assert len(db.compiled_cache) == 0
@@ -0,0 +1,34 @@
+#! /usr/bin/env python3
+
+import pytest
+
+from ws.db.template_cache import TemplateCache
+
+class test_prepare:
+    def test_noinclude(self):
+        content = "foo<noinclude>{{Documentation}}</noinclude>"
+        assert TemplateCache._prepare(content) == "foo"
+
+    def test_onlyinclude(self):
+        content = "foo<onlyinclude>bar</onlyinclude>baz"
+        assert TemplateCache._prepare(content) == "bar"
+
+    def test_redirect(self):
+        content = "#REDIRECT [[Template:Foo]]<noinclude>{{Documentation}}</noinclude>"
+        assert TemplateCache._prepare(content) == content
+
+    def test_redirect_in_includeonly(self):
+        content = "<includeonly>#REDIRECT [[Template:Foo]]</includeonly>"
+        assert TemplateCache._prepare(content) == content
+
+def test_missing_page(db):
+    cache = TemplateCache(db)
+    with pytest.raises(ValueError):
+        cache.get("Template:Does not exist")
+
+def test_disk_store(db, tmpdir):
+    cache = TemplateCache(db, cache_dir=str(tmpdir))
+    assert cache._load("Template:Foo", 1) is None
+    cache._save("Template:Foo", 1, "content")
+    assert cache._load("Template:Foo", 1) == "content"
+    assert cache._load("Template:Foo", 2) is None
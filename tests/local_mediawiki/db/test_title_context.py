@@ -0,0 +1,13 @@
+#! /usr/bin/env python3
+
+def test_title_context_is_cached(db):
+    context = db.title_context
+    assert db.title_context is context
+    assert db.Title("Main page").context is context
+    assert all(t.context is context for t in db.Titles(["Foo", "Bar"]))
+
+def test_title_context_invalidation(db):
+    context = db.title_context
+    db.invalidate_title_context()
+    assert db.title_context is not context
+    assert db.title_context == context
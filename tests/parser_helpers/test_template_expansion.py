@@ -195,6 +195,17 @@ class test_expand_templates(common_base):
         expected = "bar"
         self._do_test(title_context, d, title, expected)
 
+    def test_prepared_content(self, title_context):
+        # the content getter returns content which was already prepared, so
+        # the partial transclusion tags are not handled again
+        d = {
+            "Template:A": "<noinclude>{{{1}}}</noinclude>",
+            "Title": "{{a|foo}}",
+        }
+        title = "Title"
+        expected = "<noinclude>foo</noinclude>"
+        self._do_test(title_context, d, title, expected, content_is_prepared=True)
+
     def test_nested_noinclude(self, title_context):
         d = {
             "Template:A": "<noinclude>foo <noinclude>{{{1}}}</noinclude></noinclude>bar",
@@ -529,3 +540,81 @@ class test_transclusion_modifiers(common_base):
         title = "Title"
         expected = d[title]
         self._do_test(title_context, d, title, expected)
+
+class cached_base:
+    """
+    Runs the tests with an expansion cache shared by all pages of each test.
+    Each page is expanded twice so that the cached expansions are used.
+    """
+    @pytest.fixture(autouse=True)
+    def expansion_cache(self):
+        self.cache = ExpansionCache()
+
+    def _do_test(self, title_context, d, title, expected, **kwargs):
+        for i in range(2):
+            common_base._do_test(title_context, d, title, expected, cache=self.cache, **kwargs)
+
+class test_expand_templates_cached(cached_base, test_expand_templates):
+    pass
+
+class test_magic_words_cached(cached_base, test_magic_words):
+    pass
+
+class test_expansion_cache:
+    @staticmethod
+    def _expand(title_context, d, title, cache):
+        requested = []
+        def content_getter(title):
+            requested.append(str(title))
+            try:
+                return d[str(title)]
+            except KeyError:
+                raise ValueError
+
+        wikicode = mwparserfromhell.parse(d[title])
+        expand_templates(Title(title_context, title), wikicode, content_getter, cache=cache)
+        return wikicode, requested
+
+    def test_hits(self, title_context):
+        d = {
+            "Template:A": "a: {{b|{{{1}}}}}",
+            "Template:B": "b: {{{1}}}",
+            "Title 1": "{{a|foo}} {{a|foo}}",
+            "Title 2": "{{a|foo}}",
+        }
+        cache = ExpansionCache()
+        wikicode, requested = self._expand(title_context, d, "Title 1", cache)
+        assert wikicode == "a: b: foo a: b: foo"
+        assert cache.cache_info().hits == 1
+        wikicode, requested = self._expand(title_context, d, "Title 2", cache)
+        assert wikicode == "a: b: foo"
+        assert cache.cache_info().hits == 2
+        # the content getter is called even for the cached expansions
+        assert requested == ["Template:A", "Template:B"]
+
+    def test_copies(self, title_context):
+        d = {
+            "Template:A": "[[Foo]]",
+            "Title": "{{a}}",
+        }
+        cache = ExpansionCache()
+        wikicode, _ = self._expand(title_context, d, "Title", cache)
+        wikicode.filter_wikilinks()[0].title = "Bar"
+        wikicode, _ = self._expand(title_context, d, "Title", cache)
+        assert wikicode == "[[Foo]]"
+
+    def test_title_dependent(self, title_context):
+        d = {
+            "Template:A": "{{PAGENAME}}",
+            "Template:B": "{{a}}",
+            "Title 1": "{{b}}",
+            "Title 2": "{{b}}",
+        }
+        cache = ExpansionCache()
+        wikicode, _ = self._expand(title_context, d, "Title 1", cache)
+        assert wikicode == "Title 1"
+        wikicode, _ = self._expand(title_context, d, "Title 2", cache)
+        assert wikicode == "Title 2"
+        wikicode, _ = self._expand(title_context, d, "Title 2", cache)
+        assert wikicode == "Title 2"
+        assert cache.cache_info().hits == 1
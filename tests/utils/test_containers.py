@@ -1,5 +1,7 @@
 #! /usr/bin/env python3
 
+import datetime
+
 import pytest
 
 from ws.utils import *
@@ -184,3 +186,60 @@ class test_gen_nested_values:
             ([1, "c", "f", 1, "j"], "k"),
         ]
         assert result == expected
+
+class test_parse_timestamps_in_struct:
+    def test_timestamp_keys(self):
+        struct = {
+            "timestamp": "2020-01-02T03:04:05Z",
+            "blockexpiry": "infinity",
+            "newexpiry": "-infinity",
+            "expiry": "indefinite",
+            "touched": "2020-01-02T03:04:05Z",
+        }
+        parse_timestamps_in_struct(struct)
+        assert struct == {
+            "timestamp": datetime.datetime(2020, 1, 2, 3, 4, 5),
+            "blockexpiry": datetime.datetime.max,
+            "newexpiry": datetime.datetime.min,
+            "expiry": None,
+            "touched": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        }
+
+    def test_other_keys(self):
+        struct = {
+            "user": "infinity",
+            "title": "2020-01-02T03:04:05Z",
+            "revisions": [{"comment": "indefinite", "timestamp": "2020-01-02T03:04:05Z"}],
+        }
+        parse_timestamps_in_struct(struct)
+        assert struct == {
+            "user": "infinity",
+            "title": "2020-01-02T03:04:05Z",
+            "revisions": [{"comment": "indefinite", "timestamp": datetime.datetime(2020, 1, 2, 3, 4, 5)}],
+        }
+
+    def test_nested_in_timestamp_key(self):
+        struct = {"timestamps": {"first": "2020-01-02T03:04:05Z", "all": ["infinity", "foo"]}}
+        parse_timestamps_in_struct(struct)
+        assert struct == {"timestamps": {"first": datetime.datetime(2020, 1, 2, 3, 4, 5), "all": [datetime.datetime.max, "foo"]}}
+
+    def test_invalid_timestamp(self):
+        struct = {"timestamp": "2020-13-02T03:04:05Z"}
+        parse_timestamps_in_struct(struct)
+        assert struct == {"timestamp": "2020-13-02T03:04:05Z"}
+
+class test_serialize_timestamps:
+    def test_in_struct(self):
+        struct = {"start": datetime.datetime(2020, 1, 2, 3, 4, 5), "list": [datetime.datetime(2020, 1, 2)]}
+        serialize_timestamps_in_struct(struct)
+        assert struct == {"start": "2020-01-02T03:04:05Z", "list": ["2020-01-02T00:00:00Z"]}
+
+    def test_copy(self):
+        ts = datetime.datetime(2020, 1, 2, 3, 4, 5)
+        titles = {"Foo", "Bar"}
+        struct = {"start": ts, "list": [ts, "foo"], "titles": titles}
+        result = serialize_timestamps(struct)
+        assert result == {"start": "2020-01-02T03:04:05Z", "list": ["2020-01-02T03:04:05Z", "foo"], "titles": titles}
+        # the original structure is not modified
+        assert struct == {"start": ts, "list": [ts, "foo"], "titles": {"Foo", "Bar"}}
+        assert result["titles"] is not titles
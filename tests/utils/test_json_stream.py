@@ -0,0 +1,78 @@
+#! /usr/bin/env python3
+
+import json
+
+import pytest
+
+from ws.utils import iter_json_stream
+
+DOCUMENT = {
+    "batchcomplete": "",
+    "continue": {"rvcontinue": "123|456", "continue": "||"},
+    "query": {
+        "normalized": [{"from": "foo", "to": "Foo"}],
+        "pages": {
+            "1": {"pageid": 1, "title": "Foo", "revisions": [{"revid": 456, "*": "text " * 100}]},
+            "2": {"pageid": 2, "title": "Bar \"baz\" é", "length": 1234567, "redirect": True},
+        },
+        "allpages": [{"title": "Foo"}, {"title": "Bar"}, 42, -1.5e10, None],
+    },
+}
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+def rebuild(events):
+    result = {}
+    for path, key, value in events:
+        container = result
+        for k in path:
+            container = container.setdefault(k, {})
+        container[key] = value
+    return result
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_chunks(size, indent):
+    text = json.dumps(DOCUMENT, indent=indent)
+    paths = {("query", "pages"), ("query", "allpages")}
+    events = list(iter_json_stream(chunked(text, size), paths))
+
+    pages = [(key, value) for path, key, value in events if path == ("query", "pages")]
+    assert pages == list(DOCUMENT["query"]["pages"].items())
+    allpages = [value for path, key, value in events if path == ("query", "allpages")]
+    assert allpages == DOCUMENT["query"]["allpages"]
+
+    result = rebuild(events)
+    result["query"]["allpages"] = list(result["query"]["allpages"].values())
+    assert result == DOCUMENT
+
+def test_no_paths():
+    text = json.dumps(DOCUMENT)
+    events = list(iter_json_stream(chunked(text, 5), set()))
+    assert events == [((), key, value) for key, value in DOCUMENT.items()]
+
+def test_unexpected_types():
+    # MediaWiki serializes empty associative arrays as []
+    text = '{"query": {"pages": [], "allpages": "foo"}, "x": 1}'
+    events = list(iter_json_stream(chunked(text, 4), {("query", "pages"), ("query", "allpages"), ("x", "y")}))
+    assert events == [(("query",), "allpages", "foo"), ((), "x", 1)]
+
+def test_number_at_chunk_boundary():
+    events = list(iter_json_stream(['{"a": 12', '34, "b": tr', 'ue}'], set()))
+    assert events == [((), "a", 1234), ((), "b", True)]
+
+@pytest.mark.parametrize("text", [
+    "",
+    "[1, 2]",
+    '{"a": 1',
+    '{"a": 1,}',
+    '{"a" 1}',
+    '{"a": 1 "b": 2}',
+    '{"a": [1, 2}',
+    '{"a": 1} x',
+    '{"query": {"pages": [1 2]}}',
+])
+def test_invalid(text):
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_stream(chunked(text, 3), {("query", "pages")}))
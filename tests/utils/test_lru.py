@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+import sys
+import threading
+
+import pytest
+
+from ws.utils import LRUCache
+
+class test_LRUCache:
+    def test_count_limit(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["c"] = 3
+        assert "a" not in cache
+        assert cache["b"] == 2
+        assert cache["c"] == 3
+        assert len(cache) == 2
+
+    def test_recently_used_is_kept(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        cache["b"] = 2
+        cache["a"]
+        cache["c"] = 3
+        assert "a" in cache
+        assert "b" not in cache
+
+    def test_sizeof(self):
+        cache = LRUCache(10, sizeof=len)
+        cache["a"] = "xxxx"
+        cache["b"] = "yyyy"
+        assert cache.size == 8
+        cache["c"] = "zzzz"
+        assert "a" not in cache
+        assert cache.size == 8
+
+    def test_oversized_value(self):
+        cache = LRUCache(3, sizeof=len)
+        cache["a"] = "xx"
+        cache["b"] = "yyyy"
+        assert "b" not in cache
+        assert cache["a"] == "xx"
+
+    def test_replace(self):
+        cache = LRUCache(10, sizeof=len)
+        cache["a"] = "xxxx"
+        cache["a"] = "yy"
+        assert cache["a"] == "yy"
+        assert cache.size == 2
+        del cache["a"]
+        assert cache.size == 0
+
+    def test_cache_info(self):
+        cache = LRUCache(2)
+        cache["a"] = 1
+        cache["a"]
+        assert cache.get("b") is None
+        with pytest.raises(KeyError):
+            cache["c"]
+        assert cache.cache_info() == (1, 2, 2, 1)
+
+    def test_invalid_max_size(self):
+        with pytest.raises(ValueError):
+            LRUCache(0)
+
+    def test_threads(self):
+        cache = LRUCache(64)
+        errors = []
+
+        def worker(offset):
+            try:
+                for i in range(10000):
+                    cache[offset + i] = i
+                    cache.get(offset + i // 2)
+            except Exception as e:
+                errors.append(e)
+
+        # switch the threads often to make the races likely
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=worker, args=(n * 100000,)) for n in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        assert errors == []
+        assert len(cache) == cache.size == 64
@@ -0,0 +1,57 @@
+#! /usr/bin/env python3
+
+import itertools
+import random
+import time
+
+import pytest
+
+from ws.utils import parallel_chain
+
+def _slow_range(start, stop):
+    for i in range(start, stop):
+        time.sleep(random.random() / 1000)
+        yield i
+
+class test_parallel_chain:
+    def test_order(self):
+        iterables = [_slow_range(i * 10, i * 10 + 10) for i in range(10)]
+        assert list(parallel_chain(iterables, max_workers=4, buffer_size=2)) == list(range(100))
+
+    def test_empty(self):
+        assert list(parallel_chain([])) == []
+        assert list(parallel_chain([[], [1], []])) == [1]
+
+    def test_single_worker(self):
+        iterables = [range(5), range(5, 10)]
+        assert list(parallel_chain(iterables, max_workers=1, buffer_size=1)) == list(range(10))
+
+    def test_exception(self):
+        def failing():
+            yield 1
+            raise KeyError("foo")
+        chain = parallel_chain([range(3), failing(), range(3)])
+        assert list(itertools.islice(chain, 4)) == [0, 1, 2, 1]
+        with pytest.raises(KeyError):
+            next(chain)
+
+    def test_early_close(self):
+        iterables = [itertools.count() for i in range(3)]
+        chain = parallel_chain(iterables, buffer_size=4)
+        assert list(itertools.islice(chain, 10)) == list(range(10))
+        chain.close()
+
+    def test_invalid_max_workers(self):
+        with pytest.raises(ValueError):
+            next(parallel_chain([range(3)], max_workers=0))
+
+    def test_lazy_iterables(self):
+        taken = []
+        def iterables():
+            for i in range(10):
+                taken.append(i)
+                yield [i]
+        chain = parallel_chain(iterables(), max_workers=2)
+        assert next(chain) == 0
+        assert len(taken) <= 3
+        assert list(chain) == list(range(1, 10))
@@ -1,37 +1,85 @@
 #! /usr/bin/env python3
 
-#from nose.tools import assert_equals, raises, timed, TimeExpired
-#
-#from ws.utils import RateLimited
-#
-#def _simple_gen():
-#    yield from range(100)
-#
-#class test_rate:
-#    rate = 10
-#    step = 0.01
-#
-#    def setup(self):
-#        self.func = RateLimited(self.rate, self.step * 1.5)(_simple_gen)
-#
-#    @timed(step)
-#    def test_1(self):
-#        for i in range(self.rate):
-#            self.func()
-#
-#    @raises(TimeExpired)
-#    @timed(step)
-#    def test_2(self):
-#        for i in range(round(self.rate * 1.5)):
-#            self.func()
-#
-#    @timed(step * 2)
-#    def test_3(self):
-#        for i in range(self.rate * 2):
-#            self.func()
-#
-#    @raises(TimeExpired)
-#    @timed(step * 2)
-#    def test_4(self):
-#        for i in range(round(self.rate * 2.5)):
-#            self.func()
+import time
+
+import pytest
+
+import ws
+from ws.utils import TokenBucket, RateLimiter
+
+class test_TokenBucket:
+    def test_burst(self):
+        bucket = TokenBucket(rate=1, burst=5)
+        for i in range(5):
+            assert bucket._reserve() == 0
+        assert bucket._reserve() == pytest.approx(1, abs=0.05)
+        assert bucket._reserve() == pytest.approx(2, abs=0.05)
+        assert bucket.throttled_count == 2
+        assert bucket.throttled_time == pytest.approx(3, abs=0.1)
+
+    def test_acquire(self, monkeypatch):
+        # freeze the clock, so the delays do not depend on the speed of the machine
+        monkeypatch.setattr(time, "monotonic", lambda: 100)
+        bucket = TokenBucket(rate=100, burst=1)
+        delays = [bucket._reserve() for i in range(6)]
+        assert delays == pytest.approx([0, 0.01, 0.02, 0.03, 0.04, 0.05])
+
+    def test_set_rate(self, monkeypatch):
+        now = [100]
+        monkeypatch.setattr(time, "monotonic", lambda: now[0])
+        bucket = TokenBucket(rate=1, burst=5)
+        for i in range(5):
+            bucket._reserve()
+        # the tokens added before the change are settled at the old rate
+        now[0] += 2
+        bucket.set_rate(10)
+        assert bucket._tokens == pytest.approx(2)
+        now[0] += 0.1
+        assert bucket._reserve() == 0
+        assert bucket._tokens == pytest.approx(2)
+        with pytest.raises(ValueError):
+            bucket.set_rate(0)
+
+    def test_block(self):
+        bucket = TokenBucket(rate=1, burst=5)
+        bucket.block(10)
+        assert bucket._reserve() == pytest.approx(10, abs=0.05)
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0, burst=1)
+        with pytest.raises(ValueError):
+            TokenBucket(rate=1, burst=0)
+
+class test_RateLimiter:
+    @pytest.fixture(autouse=True)
+    def enable_rate_limiting(self, monkeypatch):
+        monkeypatch.delattr(ws, "_tests_are_running", raising=False)
+
+    def test_separate_budgets(self):
+        limiter = RateLimiter(read_rate=1000, read_burst=2, write_rate=1, write_burst=1)
+        assert limiter.acquire("write") == 0
+        assert limiter.acquire("read") == 0
+        assert limiter.acquire("read") == 0
+        assert limiter.buckets["write"]._reserve() > 0.5
+
+    def test_backoff(self):
+        limiter = RateLimiter(read_rate=10, write_rate=2)
+        limiter.backoff(0.01)
+        assert limiter.buckets["read"].rate == 5
+        assert limiter.buckets["write"].rate == 1
+        for i in range(10):
+            limiter.backoff(0)
+        assert limiter.buckets["read"].rate == 10 * RateLimiter.min_rate_factor
+        for i in range(200):
+            limiter.success()
+        assert limiter.buckets["read"].rate == 10
+        stats = limiter.stats()
+        assert stats["backoff_count"] == 11
+        assert stats["backoff_time"] == pytest.approx(0.01)
+
+    def test_disabled_in_tests(self, monkeypatch):
+        monkeypatch.setattr(ws, "_tests_are_running", True, raising=False)
+        limiter = RateLimiter(read_rate=1, read_burst=1)
+        for i in range(5):
+            assert limiter.acquire("read") == 0
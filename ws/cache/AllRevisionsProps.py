@@ -81,14 +81,13 @@ class AllRevisionsProps(CacheDb):
         wrapped_revids = utils.ListOfDictsAttrWrapper(self.data["revisions"], "revid")
         wrapped_deletedrevids = utils.ListOfDictsAttrWrapper(self.data["deletedrevisions"], "revid")
 
-        for chunk in utils.list_chunks(range(first, last + 1), self.api.max_ids_per_query):
-            logger.info("Fetching revids %s-%s" % (chunk[0], chunk[-1]))
-            revids = "|".join(str(x) for x in chunk)
-            if self.deletedrevisions is True:
-                result = next(self.api.query_continue(action="query", revids=revids, prop="revisions|deletedrevisions", drvlimit="max"))
-            else:
-                result = self.api.call_api(action="query", revids=revids, prop="revisions")
+        logger.info("Fetching revids %s-%s" % (first, last))
+        if self.deletedrevisions is True:
+            params = {"prop": "revisions|deletedrevisions", "drvlimit": "max"}
+        else:
+            params = {"prop": "revisions"}
 
+        for result in self.api.fetch_by_ids("revids", range(first, last + 1), params):
             # TODO: what is the meaning of badrevids?
             badrevids = result.get("badrevids", {})
             for _, badrev in badrevids.items():
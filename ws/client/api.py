@@ -2,8 +2,10 @@
 
 import hashlib
 import logging
+from copy import copy
+from functools import lru_cache
 
-from ..utils import RateLimited, LazyProperty
+from ..utils import RateLimited, LazyProperty, parallel_chain, iter_chunks
 
 from .connection import Connection, APIError
 from .site import Site
@@ -22,6 +24,12 @@ class API(Connection):
     :param kwargs: any keyword arguments of the Connection object
     """
 
+    # maximum number of parsed titles cached by the :py:meth:`Title` method
+    title_cache_size = 4096
+    # default number of continuation streams fetched concurrently by the
+    # ``*_parallel`` methods (see also ``Connection.max_concurrent_requests``)
+    parallel_streams = 4
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -168,18 +176,64 @@ class API(Connection):
             return None
         return recentchanges[0]["timestamp"]
 
+    @LazyProperty
+    def title_context(self):
+        """
+        A :py:class:`ws.parser_helpers.title.Context` instance shared by all
+        titles created by :py:meth:`Title`.
+
+        The context is built lazily on the first access and it is reset only
+        when the relevant :py:attr:`site` properties are fetched again. It is
+        shared by many :py:class:`Title <ws.parser_helpers.title.Title>`
+        objects, so it must not be modified.
+        """
+        # lazy import - ws.parser_helpers.title imports mwparserfromhell which is
+        # an optional dependency
+        from ..parser_helpers.title import Context
+        return Context.from_api(self)
+
+    @LazyProperty
+    def _parsed_titles(self):
+        # lazy import - ws.parser_helpers.title imports mwparserfromhell which is
+        # an optional dependency
+        from ..parser_helpers.title import Title
+
+        @lru_cache(maxsize=self.title_cache_size)
+        def parse(title):
+            return Title(self.title_context, title)
+        return parse
+
+    def invalidate_title_context(self):
+        """
+        Reset the cached :py:attr:`title_context` and the cache of parsed
+        titles used by :py:meth:`Title`.
+        """
+        del self.title_context
+        self._parsed_titles.cache_clear()
+
     def Title(self, title):
         """
         Parse a MediaWiki title.
 
+        The parsed titles are cached, keyed by the string passed to this
+        method. Each call returns a new copy of the cached object, so the
+        result can be freely modified by the caller.
+
         :param str title: page title to be parsed
         :returns: a :py:class:`ws.parser_helpers.title.Title` object
         """
         # lazy import - ws.parser_helpers.title imports mwparserfromhell which is
         # an optional dependency
-        from ..parser_helpers.title import Context, Title
-        return Title(Context.from_api(self), title)
-
+        import mwparserfromhell
+        if isinstance(title, mwparserfromhell.wikicode.Wikicode):
+            title = str(title)
+        if not isinstance(title, str):
+            # let the Title class raise the appropriate exception
+            from ..parser_helpers.title import Title
+            return Title(self.title_context, title)
+        # shallow copy is sufficient - the attributes are immutable strings,
+        # except for the context which is intentionally shared
+        return copy(self._parsed_titles(title))
 
     def query_continue(self, params=None, **kwargs):
         """
@@ -200,12 +254,31 @@ class API(Connection):
             raise ValueError("params must be dict or None")
         elif kwargs and params:
             raise ValueError("specifying 'params' and 'kwargs' at the same time is not supported")
-        else:
-            # create copy before adding action=query
-            params = params.copy()
+
+        for snippet, _ in self.query_continue_resumable(params):
+            yield snippet
+
+    def query_continue_resumable(self, params, last_continue=None):
+        """
+        Variant of :py:meth:`query_continue` which exposes the continuation
+        parameters, so that an interrupted query can be resumed later (e.g.
+        in a different process).
+
+        :param dict params: same as for :py:meth:`query_continue`
+        :param dict last_continue:
+            the continuation parameters yielded by a previous call, or ``None``
+            to start from the beginning
+        :yields: ``(snippet, continue)`` tuples, where ``snippet`` is the
+            ``"query"`` part of the API response and ``continue`` is a dict of
+            the parameters for resuming the query after ``snippet``, or
+            ``None`` after the last snippet
+        """
+        # create copy before adding action=query
+        params = params.copy()
         params["action"] = "query"
 
-        last_continue = {"continue": ""}
+        if last_continue is None:
+            last_continue = {"continue": ""}
 
         while True:
             # clone the original params to clean up old continue params
@@ -215,12 +288,104 @@ class API(Connection):
             params_copy.update(last_continue)
             # call the API and handle the result
             result = self.call_api(params_copy, expand_result=False)
+            last_continue = result.get("continue")
             if "query" in result:
-                yield result["query"]
+                yield result["query"], last_continue
+            if last_continue is None:
+                break
+
+    def query_continue_streaming(self, params, paths):
+        """
+        Streaming variant of :py:meth:`query_continue`, see
+        :py:meth:`ws.client.connection.Connection.call_api_streaming`.
+
+        :param dict params: same as for :py:meth:`query_continue`
+        :param paths:
+            a set of tuples of keys locating the streamed containers in the
+            ``"query"`` part of the API response, e.g. ``{("pages",)}``
+        :yields: ``(path, value)`` tuples for the members of the streamed
+            containers
+        """
+        params = params.copy()
+        params["action"] = "query"
+        full_paths = {("query",) + tuple(path) for path in paths}
+
+        last_continue = {"continue": ""}
+
+        while True:
+            # clone the original params to clean up old continue params
+            params_copy = params.copy()
+            params_copy.update(last_continue)
+            stream = self.call_api_streaming(params_copy, full_paths)
+            while True:
+                try:
+                    path, value = next(stream)
+                except StopIteration as e:
+                    # the rest of the response is returned from the generator
+                    result = e.value
+                    break
+                yield path[1:], value
             if "continue" not in result:
                 break
             last_continue = result["continue"]
 
+    def query_continue_parallel(self, params_list, *, max_workers=None):
+        """
+        Concurrent variant of :py:meth:`query_continue` for multiple independent
+        queries, e.g. the same query for different namespaces.
+
+        Each query is continued in a separate thread, but the results are
+        yielded in a deterministic order: all snippets of the first query,
+        then all snippets of the second query, etc. See
+        :py:func:`ws.utils.parallel_chain` for details.
+
+        :param params_list: a list of ``params`` for :py:meth:`query_continue`
+        :param int max_workers:
+            maximum number of queries processed concurrently (default is
+            :py:attr:`parallel_streams`)
+        :yields: from ``"query"`` part of the API responses
+        """
+        if max_workers is None:
+            max_workers = self.parallel_streams
+        streams = [self.query_continue(params) for params in params_list]
+        yield from parallel_chain(streams, max_workers=max_workers)
+
+    def fetch_by_ids(self, kind, ids, params, *, prefetch=None):
+        """
+        Queries the API for a (possibly long) sequence of IDs or titles.
+
+        The sequence is split into chunks of :py:attr:`max_ids_per_query` items
+        and each chunk is queried with :py:meth:`query_continue`. While the
+        caller processes the results of the current chunk, the following
+        chunks are fetched concurrently. The results are yielded in the order
+        of the chunks.
+
+        :param str kind: ``"pageids"``, ``"revids"`` or ``"titles"``
+        :param ids:
+            an iterable of IDs or titles; it is consumed lazily, so it may be
+            e.g. a database cursor
+        :param dict params:
+            other parameters for :py:meth:`query_continue`, e.g. ``prop``
+        :param int prefetch:
+            number of chunks fetched ahead (default is one less than
+            :py:attr:`parallel_streams`)
+        :yields: from ``"query"`` part of the API responses
+        """
+        if kind not in {"pageids", "revids", "titles"}:
+            raise ValueError("unsupported kind: {}".format(kind))
+        if kind in params:
+            raise ValueError("param '{}' must not be supplied in params".format(kind))
+        if prefetch is None:
+            prefetch = self.parallel_streams - 1
+
+        def streams():
+            for chunk in iter_chunks(ids, self.max_ids_per_query):
+                chunk_params = params.copy()
+                chunk_params[kind] = "|".join(str(i) for i in chunk)
+                yield self.query_continue(chunk_params)
+
+        yield from parallel_chain(streams(), max_workers=prefetch + 1)
+
     def generator(self, params=None, **kwargs):
         """
         Interface to API:Generators, conveniently implemented as Python
@@ -251,12 +416,51 @@ class API(Connection):
             raise ValueError("param 'generator' must be supplied")
 
         for snippet in self.query_continue(params, **kwargs):
-            # API generator returns dict !!!
-            # for example:  snippet === {"pages":
-            #       {"9693": {"title": "Page title", "ns": 0, "pageid": "9693"},
-            #        "1165", {"title": ...
-            snippet = sorted(snippet["pages"].values(), key=lambda d: d["title"])
-            yield from snippet
+            yield from self._generator_pages(snippet)
+
+    def generator_streaming(self, params):
+        """
+        Streaming variant of :py:meth:`generator` for huge responses, e.g. for
+        queries with ``rvprop=content``. See
+        :py:meth:`ws.client.connection.Connection.call_api_streaming` for
+        details.
+
+        Unlike :py:meth:`generator`, the pages are yielded in the order of the
+        API response, because sorting them would require keeping the whole
+        response in memory.
+
+        :param dict params: same as for :py:meth:`generator`
+        :yields: from ``"pages"`` part of the API response
+        """
+        if params.get("generator") is None:
+            raise ValueError("param 'generator' must be supplied")
+
+        for _, page in self.query_continue_streaming(params, {("pages",)}):
+            yield page
+
+    @staticmethod
+    def _generator_pages(snippet):
+        # API generator returns dict !!!
+        # for example:  snippet === {"pages":
+        #       {"9693": {"title": "Page title", "ns": 0, "pageid": "9693"},
+        #        "1165", {"title": ...
+        return sorted(snippet["pages"].values(), key=lambda d: d["title"])
+
+    def generator_parallel(self, params_list, *, max_workers=None):
+        """
+        Concurrent variant of :py:meth:`generator` for multiple independent
+        queries, see :py:meth:`query_continue_parallel`.
+
+        :param params_list: a list of ``params`` for :py:meth:`generator`
+        :param int max_workers: same as :py:meth:`query_continue_parallel`
+        :yields: from ``"pages"`` part of the API responses
+        """
+        for params in params_list:
+            if params.get("generator") is None:
+                raise ValueError("param 'generator' must be supplied")
+
+        for snippet in self.query_continue_parallel(params_list, max_workers=max_workers):
+            yield from self._generator_pages(snippet)
 
     def list(self, params=None, **kwargs):
         """
@@ -273,20 +477,66 @@ class API(Connection):
             raise ValueError("param 'list' must be supplied")
 
         for snippet in self.query_continue(params, **kwargs):
-            if list_ == "querypage":
-                # list=querypage needs special treatment, the structure is:
-                #     snippet === {"querypage": {
-                #         "results": [{"title": "Page title", "ns": 0, "pageid": "9693"},
-                #                     {"title": ...}]
-                #         "name": "Uncategorizedcategories"}, ...}
-                yield from snippet[list_]["results"]
-            else:
-                # other list modules return entries directly in a list
-                # example for list="allpages":
-                #     snippet === {"allpages":
-                #         [{"title": "Page title", "ns": 0, "pageid": "9693"},
-                #          {"title": ...}]
-                yield from snippet[list_]
+            yield from self._list_items(list_, snippet)
+
+    def list_streaming(self, params):
+        """
+        Streaming variant of :py:meth:`list` for huge responses. See
+        :py:meth:`ws.client.connection.Connection.call_api_streaming` for
+        details.
+
+        :param dict params: same as for :py:meth:`list`
+        :yields: from ``"list"`` part of the API response
+        """
+        list_ = params.get("list")
+        if list_ is None:
+            raise ValueError("param 'list' must be supplied")
+
+        if list_ == "querypage":
+            path = (list_, "results")
+        else:
+            path = (list_,)
+        for _, item in self.query_continue_streaming(params, {path}):
+            yield item
+
+    @staticmethod
+    def _list_items(list_, snippet):
+        if list_ == "querypage":
+            # list=querypage needs special treatment, the structure is:
+            #     snippet === {"querypage": {
+            #         "results": [{"title": "Page title", "ns": 0, "pageid": "9693"},
+            #                     {"title": ...}]
+            #         "name": "Uncategorizedcategories"}, ...}
+            return snippet[list_]["results"]
+        else:
+            # other list modules return entries directly in a list
+            # example for list="allpages":
+            #     snippet === {"allpages":
+            #         [{"title": "Page title", "ns": 0, "pageid": "9693"},
+            #          {"title": ...}]
+            return snippet[list_]
+
+    def list_parallel(self, params_list, *, max_workers=None):
+        """
+        Concurrent variant of :py:meth:`list` for multiple independent
+        queries, see :py:meth:`query_continue_parallel`. All queries must use
+        the same ``list`` module.
+
+        :param params_list: a list of ``params`` for :py:meth:`list`
+        :param int max_workers: same as :py:meth:`query_continue_parallel`
+        :yields: from ``"list"`` part of the API responses
+        """
+        lists = set(params.get("list") for params in params_list)
+        if None in lists:
+            raise ValueError("param 'list' must be supplied")
+        if len(lists) > 1:
+            raise ValueError("all queries must use the same 'list' module")
+        if not lists:
+            return
+        list_ = lists.pop()
+
+        for snippet in self.query_continue_parallel(params_list, max_workers=max_workers):
+            yield from self._list_items(list_, snippet)
 
     @LazyProperty
     def _csrftoken(self):
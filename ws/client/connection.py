@@ -11,12 +11,16 @@ and making requests.
 #        + 'token' parameter should be specified last, see https://www.mediawiki.org/wiki/API:Edit
 
 import requests
+import urllib3
 import http.cookiejar as cookielib
 import logging
-import copy
+import threading
+import socket
+import email.utils
+import datetime
 
 from ws import __version__, __url__
-from ..utils import RateLimited, parse_timestamps_in_struct, serialize_timestamps_in_struct
+from ..utils import RateLimiter, parse_timestamps_in_struct, serialize_timestamps, iter_json_stream
 
 logger = logging.getLogger(__name__)
 
@@ -82,6 +86,31 @@ MULTIPART_FORM_DATA = {
 }
 API_ACTIONS = GET_ACTIONS | POST_ACTIONS | set(MULTIPART_FORM_DATA.keys())
 
+class _HTTPAdapter(requests.adapters.HTTPAdapter):
+    """
+    HTTP adapter which enables TCP keep-alive probes on the pooled sockets, so
+    that idle connections are not silently dropped by firewalls or NAT between
+    the requests.
+
+    :param int keepalive_idle:
+        number of idle seconds before the first keep-alive probe (where
+        supported by the platform), ``None`` disables the probes
+    :param kwargs: passed to :py:class:`requests.adapters.HTTPAdapter`
+    """
+
+    def __init__(self, *, keepalive_idle=60, **kwargs):
+        self.keepalive_idle = keepalive_idle
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.keepalive_idle is not None:
+            options = list(urllib3.connection.HTTPConnection.default_socket_options)
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_idle))
+            kwargs["socket_options"] = options
+        super().init_poolmanager(*args, **kwargs)
+
 class Connection:
     """
     The base object handling connection between a wiki and scripts.
@@ -90,18 +119,42 @@ class Connection:
     :param str index_url: URL path to the wiki's ``index.php`` entry point
     :param requests.Session session: session created by :py:meth:`make_session`
     :param int timeout: connection timeout in seconds
+    :param rate_limiter:
+        a :py:class:`ws.utils.rate.RateLimiter` instance for the requests made
+        by this connection (by default, a new instance with the default
+        parameters is created)
+    :param int maxlag:
+        if not ``None``, the `maxlag parameter`_ is sent with all API requests
+        and the requests rejected due to the replication lag are retried after
+        a backoff
+
+    .. _`maxlag parameter`: https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
     """
 
-    def __init__(self, api_url, index_url, session, timeout=60):
+    # maximum number of requests processed concurrently (e.g. by
+    # :py:meth:`ws.client.api.API.query_continue_parallel`)
+    max_concurrent_requests = 4
+    # maximum number of retries after a backoff requested by the server
+    max_backoff_retries = 5
+    # size of the chunks read from the response by :py:meth:`call_api_streaming`
+    streaming_chunk_size = 64 * 1024
+
+    def __init__(self, api_url, index_url, session, timeout=60, *, rate_limiter=None, maxlag=None):
         self.api_url = api_url
         self.index_url = index_url
         self.session = session
         self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.maxlag = maxlag
+        self._request_semaphore = threading.BoundedSemaphore(self.max_concurrent_requests)
+        self._cookies_lock = threading.Lock()
+        self._saved_cookies = self._get_cookies_state()
 
     @staticmethod
     def make_session(user_agent=DEFAULT_UA, ssl_verify=None, max_retries=0,
                      cookie_file=None, cookiejar=None,
-                     http_user=None, http_password=None):
+                     http_user=None, http_password=None,
+                     pool_size=max_concurrent_requests, keepalive_idle=60):
         """
         Creates a :py:class:`requests.Session` object for the connection.
 
@@ -109,6 +162,11 @@ class Connection:
         or ``cookie_file`` arguments. If ``cookiejar`` is present, ``cookie_file``
         is ignored.
 
+        The session reuses up to ``pool_size`` connections per host and
+        explicitly requests compressed responses with all encodings supported
+        by :py:mod:`urllib3` (``gzip`` and ``deflate``, and ``br`` if the
+        ``brotli`` module is installed).
+
         :param str user_agent: string sent as ``User-Agent`` header to the web server
         :param bool ssl_verify: if ``True``, the SSL certificate will be verified
         :param int max_retries:
@@ -117,6 +175,12 @@ class Connection:
             to requests where data has made it to the server.
         :param str cookie_file: path to a :py:class:`cookielib.FileCookieJar` file
         :param cookiejar: an existing :py:class:`cookielib.CookieJar` object
+        :param int pool_size:
+            maximum number of kept-alive connections per host, it should not be
+            lower than the number of concurrent requests
+        :param int keepalive_idle:
+            number of idle seconds before sending TCP keep-alive probes on the
+            pooled connections, ``None`` disables the probes
         :returns: :py:class:`requests.Session` object
         """
         session = requests.Session()
@@ -135,12 +199,17 @@ class Connection:
         if http_user is not None and http_password is not None:
             _auth = (http_user, http_password)
 
-        session.headers.update({"user-agent": user_agent})
+        session.headers.update({
+            "user-agent": user_agent,
+            "accept-encoding": urllib3.util.request.ACCEPT_ENCODING,
+            "connection": "keep-alive",
+        })
         session.auth = _auth
         session.params.update({"format": "json"})
         session.verify = ssl_verify
 
-        adapter = requests.adapters.HTTPAdapter(max_retries=max_retries)
+        adapter = _HTTPAdapter(max_retries=max_retries, pool_maxsize=pool_size,
+                               keepalive_idle=keepalive_idle)
         session.mount("https://", adapter)
         session.mount("http://", adapter)
         return session
@@ -169,6 +238,12 @@ class Connection:
                 help="connection timeout in seconds (default: %(default)s)")
         group.add_argument("--cookie-file", type=ws.config.argtype_dirname_must_exist, metavar="PATH",
                 help="path to cookie file (default: $cache_dir/$site.cookie)")
+        group.add_argument("--read-rate-limit", default=10/3, type=float, metavar="N",
+                help="maximum number of reading requests per second (default: %(default).2f)")
+        group.add_argument("--write-rate-limit", default=10/3, type=float, metavar="N",
+                help="maximum number of writing requests per second (default: %(default).2f)")
+        group.add_argument("--maxlag", type=int, metavar="SECONDS",
+                help="value of the maxlag parameter for API requests (default: not sent)")
         # TODO: expose also user_agent, http_user, http_password?
 
     @classmethod
@@ -196,9 +271,33 @@ class Connection:
         session = Connection.make_session(ssl_verify=args.ssl_verify,
                                           max_retries=args.connection_max_retries,
                                           cookie_file=cookie_file)
-        return klass(args.api_url, args.index_url, session=session, timeout=args.connection_timeout)
+        # allow bursts of requests made in 3 seconds
+        rate_limiter = RateLimiter(read_rate=args.read_rate_limit,
+                                   read_burst=max(1, 3 * args.read_rate_limit),
+                                   write_rate=args.write_rate_limit,
+                                   write_burst=max(1, 3 * args.write_rate_limit))
+        return klass(args.api_url, args.index_url, session=session, timeout=args.connection_timeout,
+                     rate_limiter=rate_limiter, maxlag=args.maxlag)
+
+    @staticmethod
+    def _get_retry_after(response):
+        """
+        Returns the delay in seconds requested by the ``Retry-After`` header of
+        the response, or ``None``.
+        """
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0, (date - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
 
-    @RateLimited(10, 3)
     def request(self, method, url, **kwargs):
         """
         Simple HTTP request handler. It is basically a wrapper around
@@ -214,35 +313,67 @@ class Connection:
         :py:exc:`requests.exceptions.Timeout` and
         :py:exc:`requests.exceptions.HTTPError`) should be catched by the caller.
 
+        The requests are limited by :py:attr:`rate_limiter`, ``GET`` and
+        ``HEAD`` requests are counted as reading and other requests as writing.
+        Requests rejected with the 429 or 503 status code and a ``Retry-After``
+        header are retried after the requested delay.
+
         .. _`Requests documentation`: http://docs.python-requests.org/en/latest/api/
         """
-        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        kind = "read" if method.upper() in {"GET", "HEAD"} else "write"
+        for attempt in range(self.max_backoff_retries + 1):
+            self.rate_limiter.acquire(kind)
+            with self._request_semaphore:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            retry_after = self._get_retry_after(response)
+            if response.status_code in {429, 503} and retry_after is not None and attempt < self.max_backoff_retries:
+                # the response body is not needed (and it might not be read yet)
+                response.close()
+                self.rate_limiter.backoff(retry_after)
+                continue
+            break
 
         # raise HTTPError for bad requests (4XX client errors and 5XX server errors)
         response.raise_for_status()
+        self.rate_limiter.success()
 
-        if isinstance(self.session.cookies, cookielib.FileCookieJar):
-            self.session.cookies.save()
+        self.save_cookies(only_changed=True)
 
         return response
 
-    def call_api(self, params=None, expand_result=True, **kwargs):
+    def _get_cookies_state(self):
+        return {(c.domain, c.path, c.name, c.value, c.expires) for c in self.session.cookies}
+
+    def save_cookies(self, *, only_changed=False):
         """
-        Convenient method to call the ``api.php`` entry point.
+        Saves the cookies into the cookie file, if the session uses a
+        :py:class:`cookielib.FileCookieJar`.
 
-        Checks the ``action`` parameter (default is ``"help"`` as in the API),
-        selects correct HTTP request method, handles API errors and warnings.
+        :param bool only_changed:
+            if ``True``, the file is written only when the cookies have changed
+            since the last save
+        """
+        if not isinstance(self.session.cookies, cookielib.FileCookieJar):
+            return
+        with self._cookies_lock:
+            state = self._get_cookies_state()
+            if only_changed and state == self._saved_cookies:
+                return
+            self.session.cookies.save()
+            self._saved_cookies = state
 
-        Parameters of the call can be passed either as a dict to ``params``, or
-        as keyword arguments. ``params`` and ``kwargs`` cannot be specified at
-        the same time.
+    def close(self):
+        """
+        Saves the cookies and closes all pooled connections of the session.
+        """
+        self.save_cookies()
+        self.session.close()
 
-        :param params: dictionary of API parameters
-        :param expand_result:
-            if ``True``, return only part of the response relevant to the given
-            action, otherwise full response is returned
-        :param kwargs: API parameters passed as keyword arguments
-        :returns: a dictionary containing (part of) the API response
+    @staticmethod
+    def _get_api_params(params, kwargs):
+        """
+        Validates the parameters for :py:meth:`call_api` and returns a copy with
+        serialized timestamps.
         """
         if params is None:
             params = kwargs
@@ -263,32 +394,43 @@ class Connection:
         if action == "help":
             params["wrap"] = "1"
 
-        # serialize timestamps
-        params = copy.deepcopy(params)
-        serialize_timestamps_in_struct(params)
+        # serialize timestamps (this also creates a copy of the params, the
+        # caller's data must not be modified)
+        return serialize_timestamps(params)
 
-        # select HTTP method and call the API
+    def _api_request(self, params, **kwargs):
+        """
+        Sends the request for :py:meth:`call_api` with the appropriate HTTP
+        method and returns the response.
+        """
+        action = params["action"]
         if action in MULTIPART_FORM_DATA:
             # parameters specified in MULTIPART_FORM_DATA have to be uploaded as "files"
             files = dict((k, v) for k, v in params.items() if k in MULTIPART_FORM_DATA[action])
-            for k in files:
-                del params[k]
-            result = self.request("POST", self.api_url, data=params, files=files)
+            data = dict((k, v) for k, v in params.items() if k not in files)
+            return self.request("POST", self.api_url, data=data, files=files, **kwargs)
         elif action in POST_ACTIONS:
             # passing `params` to `data` will cause form-encoding to take place,
             # which is necessary when editing pages longer than 8000 characters
-            result = self.request("POST", self.api_url, data=params)
+            return self.request("POST", self.api_url, data=params, **kwargs)
         else:
-            result = self.request("GET", self.api_url, params=params)
+            return self.request("GET", self.api_url, params=params, **kwargs)
 
-        try:
-            result = result.json()
-        except ValueError:
-            raise APIJsonError("Failed to decode server response. Please make sure " +
-                               "that the API is enabled on the wiki and that the " +
-                               "API URL is correct.")
+    def _should_retry_api(self, params, result, attempt):
+        """
+        Returns ``True`` if the API request was rejected due to the replication
+        lag and it should be retried.
+        """
+        # uploaded files cannot be re-sent, so they are not retried
+        return result.get("error", {}).get("code") == "maxlag" and \
+                params["action"] not in MULTIPART_FORM_DATA and attempt < self.max_backoff_retries
 
-        # see if there are errors/warnings
+    @staticmethod
+    def _check_api_result(params, result):
+        """
+        Raises :py:exc:`APIError` or logs the warnings contained in the API
+        response.
+        """
         if "error" in result:
             raise APIError(params, result["error"])
         if "warnings" in result:
@@ -297,6 +439,49 @@ class Connection:
                 msg += "\n* {}".format(warning["*"])
             logger.warning(msg)
 
+    def call_api(self, params=None, expand_result=True, **kwargs):
+        """
+        Convenient method to call the ``api.php`` entry point.
+
+        Checks the ``action`` parameter (default is ``"help"`` as in the API),
+        selects correct HTTP request method, handles API errors and warnings.
+
+        Parameters of the call can be passed either as a dict to ``params``, or
+        as keyword arguments. ``params`` and ``kwargs`` cannot be specified at
+        the same time.
+
+        :param params: dictionary of API parameters
+        :param expand_result:
+            if ``True``, return only part of the response relevant to the given
+            action, otherwise full response is returned
+        :param kwargs: API parameters passed as keyword arguments
+        :returns: a dictionary containing (part of) the API response
+        """
+        params = self._get_api_params(params, kwargs)
+        action = params["action"]
+
+        if self.maxlag is not None:
+            params.setdefault("maxlag", self.maxlag)
+
+        for attempt in range(self.max_backoff_retries + 1):
+            response = self._api_request(params)
+
+            try:
+                result = response.json()
+            except ValueError:
+                raise APIJsonError("Failed to decode server response. Please make sure " +
+                                   "that the API is enabled on the wiki and that the " +
+                                   "API URL is correct.")
+
+            # the request was rejected due to the replication lag
+            if self._should_retry_api(params, result, attempt):
+                self.rate_limiter.backoff(self._get_retry_after(response))
+                continue
+            break
+
+        # see if there are errors/warnings
+        self._check_api_result(params, result)
+
         # parse timestamps
         parse_timestamps_in_struct(result)
 
@@ -307,6 +492,80 @@ class Connection:
                 raise APIExpandResultFailed
         return result
 
+    def call_api_streaming(self, params, paths):
+        """
+        Streaming variant of :py:meth:`call_api` for huge responses, e.g. for
+        queries with ``rvprop=content``.
+
+        The response is decoded incrementally by
+        :py:func:`ws.utils.iter_json_stream` while it is being downloaded. The
+        members of the containers at the given ``paths`` (e.g. the pages of a
+        query) are yielded as soon as they are decoded, so the memory usage is
+        bounded by the size of the largest member rather than by the size of
+        the whole response. The rest of the response (e.g. the ``continue``
+        part) is collected into a dictionary, which is returned from the
+        generator after all members have been yielded, i.e. it can be obtained
+        with ``rest = yield from connection.call_api_streaming(...)``.
+
+        Errors in the response are raised before anything is yielded, because
+        MediaWiki does not combine them with the results. The warnings are
+        logged at the end of the response.
+
+        :param dict params: dictionary of API parameters
+        :param paths:
+            a set of tuples of keys locating the streamed containers in the full
+            API response, e.g. ``{("query", "pages")}``
+        :yields: ``(path, value)`` tuples for the members of the streamed
+            containers, where ``path`` is the item of ``paths`` containing the
+            member
+        :returns: a dictionary containing the rest of the API response
+        """
+        params = self._get_api_params(params, {})
+
+        if self.maxlag is not None:
+            params.setdefault("maxlag", self.maxlag)
+
+        for attempt in range(self.max_backoff_retries + 1):
+            response = self._api_request(params, stream=True)
+            try:
+                # JSON is always encoded in UTF-8 (RFC 8259)
+                if response.encoding is None:
+                    response.encoding = "utf-8"
+                chunks = response.iter_content(chunk_size=self.streaming_chunk_size, decode_unicode=True)
+                result = {}
+                for path, key, value in iter_json_stream(chunks, paths):
+                    if path in paths:
+                        if not isinstance(value, str):
+                            parse_timestamps_in_struct(value)
+                        yield path, value
+                    else:
+                        container = result
+                        for k in path:
+                            container = container.setdefault(k, {})
+                        container[key] = value
+                        if path == () and key == "error":
+                            break
+            except ValueError:
+                raise APIJsonError("Failed to decode server response. Please make sure " +
+                                   "that the API is enabled on the wiki and that the " +
+                                   "API URL is correct.")
+            finally:
+                response.close()
+
+            # the request was rejected due to the replication lag
+            if self._should_retry_api(params, result, attempt):
+                self.rate_limiter.backoff(self._get_retry_after(response))
+                continue
+            break
+
+        # see if there are errors/warnings
+        self._check_api_result(params, result)
+
+        # parse timestamps
+        parse_timestamps_in_struct(result)
+
+        return result
+
     def call_index(self, method="GET", **kwargs):
         """
         Convenient method to call the ``index.php`` entry point.
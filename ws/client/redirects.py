@@ -71,23 +71,26 @@ class Redirects:
         if target_namespaces == "all":
             target_namespaces = [ns for ns in self._api.site.namespaces if int(ns) >= 0]
 
-        redirects = {}
+        params_list = []
         for ns in target_namespaces:
             # FIXME: adding the rdnamespace parameter causes an internal API error,
             # see https://wiki.archlinux.org/index.php/User:Lahwaacz/Notes#API:_resolving_redirects
             # removing it for now, all namespaces are included by default anyway...
-#            allpages = self._api.generator(generator="allpages", gapnamespace=ns, gaplimit="max", prop="redirects", rdprop="title|fragment", rdnamespace="|".join(source_namespaces), rdlimit="max")
-            allpages = self._api.generator(generator="allpages", gapnamespace=ns, gaplimit="max", prop="redirects", rdprop="title|fragment", rdlimit="max")
-            for page in allpages:
-                # construct the mapping, the query result is somewhat reversed...
-                target_title = page["title"]
-                for redirect in page.get("redirects", []):
-                    source_title = redirect["title"]
-                    target_fragment = redirect.get("fragment")
-                    if target_fragment:
-                        redirects[source_title] = "{}#{}".format(target_title, target_fragment)
-                    else:
-                        redirects[source_title] = target_title
+#            params = dict(generator="allpages", gapnamespace=ns, gaplimit="max", prop="redirects", rdprop="title|fragment", rdnamespace="|".join(source_namespaces), rdlimit="max")
+            params = dict(generator="allpages", gapnamespace=ns, gaplimit="max", prop="redirects", rdprop="title|fragment", rdlimit="max")
+            params_list.append(params)
+
+        redirects = {}
+        for page in self._api.generator_parallel(params_list):
+            # construct the mapping, the query result is somewhat reversed...
+            target_title = page["title"]
+            for redirect in page.get("redirects", []):
+                source_title = redirect["title"]
+                target_fragment = redirect.get("fragment")
+                if target_fragment:
+                    redirects[source_title] = "{}#{}".format(target_title, target_fragment)
+                else:
+                    redirects[source_title] = target_title
         return redirects
 
     @LazyProperty
@@ -25,9 +25,33 @@ class Site(Meta):
             "languages", "languagevariants", "skins", "extensiontags", "functionhooks",
             "showhooks", "variables", "protocols", "defaultoptions", "uploaddialog"}
 
+    # properties used for the :py:attr:`title_context <ws.client.api.API.title_context>`
+    title_context_properties = {"general", "namespaces", "namespacealiases", "interwikimap"}
+
     def __init__(self, api):
         super().__init__(api)
 
+    def fetch(self, prop=None):
+        """
+        Auxiliary method for querying properties.
+
+        Resets the :py:attr:`title_context <ws.client.api.API.title_context>`
+        of the API when any of the :py:attr:`title_context_properties` is
+        fetched.
+        """
+        result = super().fetch(prop)
+
+        if prop is None:
+            props = self.properties
+        elif isinstance(prop, str):
+            props = {prop}
+        else:
+            props = set(prop)
+        if props & self.title_context_properties:
+            self._api.invalidate_title_context()
+
+        return result
+
     @property
     def interwikimap(self):
         """
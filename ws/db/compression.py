@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+
+"""
+Compression of the revision content stored in the ``text`` table.
+
+The compressed content is stored in the ``old_blob`` column instead of
+``old_text`` and the ``old_flags`` column contains the name of the compression
+method. An empty ``old_flags`` value means that the content is stored as plain
+text in ``old_text``.
+
+The ``zlib`` method is always available, ``zstd`` requires the `zstandard`_
+module.
+
+.. _zstandard: https://pypi.org/project/zstandard/
+"""
+
+import zlib
+
+try:
+    import zstandard
+    _has_zstandard = True
+except ImportError:
+    _has_zstandard = False
+
+__all__ = ["get_methods", "compress_text", "decompress_text"]
+
+def get_methods():
+    """
+    Returns a list of the available compression methods.
+    """
+    methods = ["zlib"]
+    if _has_zstandard:
+        methods.append("zstd")
+    return methods
+
+def compress_text(text, method):
+    """
+    Compresses a revision content.
+
+    :param str text: the content
+    :param str method: the compression method, see :py:func:`get_methods`
+    :returns: a ``(blob, flags)`` tuple, where ``flags`` is the value for the
+              ``old_flags`` column
+    """
+    data = text.encode("utf-8")
+    if method == "zlib":
+        return zlib.compress(data, 9), "zlib"
+    elif method == "zstd":
+        if not _has_zstandard:
+            raise ValueError("The zstd compression requires the zstandard module.")
+        return zstandard.ZstdCompressor(level=19).compress(data), "zstd"
+    raise ValueError("Unknown compression method: {}".format(method))
+
+def decompress_text(blob, flags):
+    """
+    Decompresses a revision content.
+
+    :param bytes blob: the value of the ``old_blob`` column
+    :param str flags: the value of the ``old_flags`` column
+    :returns: the content as :py:class:`str`
+    """
+    if flags == "zlib":
+        data = zlib.decompress(blob)
+    elif flags == "zstd":
+        if not _has_zstandard:
+            raise ValueError("The zstd compression requires the zstandard module.")
+        data = zstandard.ZstdDecompressor().decompress(blob)
+    else:
+        raise ValueError("Unknown compression flags: {}".format(flags))
+    return data.decode("utf-8")
@@ -15,24 +15,35 @@ import os.path
 import sqlalchemy as sa
 import alembic.config
 
-from . import schema, selects, grabbers, parser_cache
+from . import schema, selects, grabbers, parser_cache, compression
+from .section_cache import SectionCache
 from ..parser_helpers.title import Context, Title
+from ..utils import LazyProperty, LRUCache
 
 class Database:
     """
     :param engine_or_url:
         either an existing :py:class:`sqlalchemy.engine.Engine` instance or a
         :py:class:`str` representing the URL created by :py:meth:`make_url`
+    :param str text_compression:
+        compression method for the content of revisions stored by the
+        synchronization, see :py:mod:`ws.db.compression`. ``None`` disables the
+        compression. The content stored previously is kept as is, the queries
+        decompress it transparently.
     """
 
     # it doesn't make sense to even test anything else
     charset = "utf8"
 
     # TODO: take parameters
-    def __init__(self, engine_or_url):
+    def __init__(self, engine_or_url, *, text_compression=None):
         # limit for continuation
         self.chunk_size = 5000
 
+        if text_compression is not None and text_compression not in compression.get_methods():
+            raise ValueError("Unsupported text compression method: {}".format(text_compression))
+        self.text_compression = text_compression
+
         if isinstance(engine_or_url, sa.engine.Engine):
             self.engine = engine_or_url
         else:
@@ -40,6 +51,12 @@ class Database:
 
         assert self.engine.name == "postgresql"
 
+        # statements of the pageset queries keyed by the shape of the query
+        # parameters (see selects.query_pageset) and the compiled form of the
+        # statements executed repeatedly, shared by the concurrent grabbers
+        self.query_cache = LRUCache(256)
+        self.compiled_cache = LRUCache(1024)
+
         self.metadata = sa.MetaData(bind=self.engine)
         schema.create_tables(self.metadata)
 
@@ -80,6 +97,8 @@ class Database:
                 help="port on which the database server listens (default: %(default)s)")
         group.add_argument("--db-name", metavar="DATABASE",
                 help="name of the database (default: %(default)s)")
+        group.add_argument("--db-text-compression", metavar="METHOD", choices=["zlib", "zstd"],
+                help="compression method for the content of revisions, zstd requires the zstandard module (default: no compression)")
 
     @classmethod
     def from_argparser(klass, args):
@@ -104,7 +123,7 @@ class Database:
                                 host=args.db_host,
                                 port=args.db_port,
                                 database=args.db_name)
-        return klass(url)
+        return klass(url, text_compression=args.db_text_compression)
 
     def __getattr__(self, table_name):
         """
@@ -117,14 +136,17 @@ class Database:
             raise AttributeError("Table '{}' does not exist in the database.".format(table_name))
         return self.metadata.tables[table_name]
 
-    def sync_with_api(self, api, *, with_content=False):
+    def sync_with_api(self, api, *, with_content=False, workers=4):
         """
         Sync the local data with a remote MediaWiki instance.
 
         :param ws.client.api.API api: interface to the remote MediaWiki instance
         :param bool with_content: whether to synchronize the content of all revisions
+        :param int workers:
+            maximum number of grabbers running concurrently, see
+            :py:func:`ws.db.grabbers.run_grabbers`
         """
-        grabbers.synchronize(self, api, with_content=with_content)
+        grabbers.synchronize(self, api, with_content=with_content, workers=workers)
 
     def sync_latest_revisions_content(self, api):
         """
@@ -137,20 +159,39 @@ class Database:
         """
         grabbers.GrabberRevisions(api, self).sync_latest_revisions_content()
 
+    def sync_revisions_content(self, api, *, workers=4):
+        """
+        Sync the content of all revisions on the wiki, see
+        :py:meth:`ws.db.grabbers.GrabberRevisions.sync_revisions_content`.
+
+        Note that the method :py:meth:`.sync_with_api` should be called prior to
+        calling this method.
+
+        :param ws.client.api.API api: interface to the remote MediaWiki instance
+        :param int workers: number of concurrent workers
+        """
+        grabbers.GrabberRevisions(api, self).sync_revisions_content(workers=workers)
+
     def query(self, *args, **kwargs):
         """
-        Main interface for the MediaWiki-like database queries.
+        Main interface for the MediaWiki-like database queries. See
+        :py:func:`ws.db.selects.query` for the ``result_format`` parameter.
 
         TODO: documentation of the parameters (or at least the differences from MediaWiki)
         """
         return selects.query(self, *args, **kwargs)
 
-    def Title(self, title):
+    @LazyProperty
+    def title_context(self):
         """
-        Parse a MediaWiki title.
-
-        :param str title: page title to be parsed
-        :returns: a :py:class:`ws.parser_helpers.title.Title` object
+        A :py:class:`ws.parser_helpers.title.Context` instance shared by all
+        titles created by :py:meth:`Title` and :py:meth:`Titles`.
+
+        The context is built lazily from the ``interwiki`` and ``namespace*``
+        tables on the first access and cached afterwards. The grabbers which
+        modify these tables reset the cache after committing their changes,
+        see :py:meth:`invalidate_title_context`. Changes made by other
+        processes are not detected.
         """
         iwmap = selects.get_interwikimap(self)
         namespacenames = selects.get_namespacenames(self)
@@ -158,19 +199,75 @@ class Database:
         # legaltitlechars are not stored in the database, it will hardly ever
         # change so let's just hardcode it
         legaltitlechars = " %!\"$&'()*,\\-.\\/0-9:;=?@A-Z\\\\^_`a-z~\\x80-\\xFF+"
-        context = Context(iwmap, namespacenames, namespaces, legaltitlechars)
-        return Title(context, title)
+        return Context(iwmap, namespacenames, namespaces, legaltitlechars)
+
+    def invalidate_title_context(self):
+        """
+        Reset the cached :py:attr:`title_context`. It will be rebuilt from the
+        database on the next access.
+        """
+        del self.title_context
+
+    @LazyProperty
+    def section_cache(self):
+        """
+        A :py:class:`ws.db.section_cache.SectionCache` instance used by
+        :py:meth:`get_sections`.
+        """
+        return SectionCache(self)
+
+    def get_sections(self, titles):
+        """
+        Returns the sections of multiple pages at once. This is much faster
+        than separate ``db.query(titles=..., prop="sections")`` calls for each
+        page, especially when the same pages are requested repeatedly.
+
+        Note that :py:meth:`update_parser_cache` should be called prior to
+        calling this method.
+
+        :param titles: an iterable of page titles (:py:class:`str`)
+        :returns: a dict mapping the given titles to tuples of sections, or to
+            ``None`` for missing pages. See
+            :py:meth:`ws.db.section_cache.SectionCache.get` for details.
+        """
+        return self.section_cache.get(titles)
+
+    def Title(self, title):
+        """
+        Parse a MediaWiki title.
+
+        :param str title: page title to be parsed
+        :returns: a :py:class:`ws.parser_helpers.title.Title` object
+        """
+        return Title(self.title_context, title)
 
-    def update_parser_cache(self):
+    def Titles(self, titles):
+        """
+        Parse multiple MediaWiki titles using the same context.
+
+        :param titles: an iterable of page titles to be parsed
+        :returns: a list of :py:class:`ws.parser_helpers.title.Title` objects
+        """
+        context = self.title_context
+        return [Title(context, title) for title in titles]
+
+    def update_parser_cache(self, *, workers=1, cache_dir=None):
         """
         Update the parser cache tables.
 
         Note that the methods :py:meth:`.sync_with_api` and
         :py:meth:`.sync_latest_revisions_content` should be called prior to
         calling this method.
+
+        :param int workers:
+            number of worker processes for parsing the pages, see
+            :py:meth:`ws.db.parser_cache.ParserCache.update`
+        :param str cache_dir:
+            directory for the persistent cache of transcluded pages, see
+            :py:class:`ws.db.template_cache.TemplateCache`
         """
-        cache = parser_cache.ParserCache(self)
-        cache.update()
+        cache = parser_cache.ParserCache(self, cache_dir=cache_dir)
+        cache.update(workers=workers)
 
 
 """
@@ -1,5 +1,13 @@
 #! /usr/bin/env python3
 
+import datetime
+import io
+
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+__all__ = ["DeferrableExecutionQueue", "BulkExecutionQueue", "StagedInsert", "bulk_insert"]
+
 class DeferrableExecutionQueue:
     """
     An execution wrapper which defers the execution of statements until the
@@ -16,6 +24,9 @@ class DeferrableExecutionQueue:
         are executed - otherwise the queues may get out of sync and execution
         may hit constraint errors.
 
+    Besides SQL statements, the queue accepts :py:class:`StagedInsert` objects,
+    whose queued parameters are the rows to be inserted.
+
     :param sqlalchemy.engine.Connection conn:
         a connection (with an established transaction) to the database where the
         statements are executed
@@ -43,7 +54,7 @@ class DeferrableExecutionQueue:
         :py:meth:`sqlalchemy.engine.Connection.execute`.
         """
         if self.chunk_size == 1:
-            self.conn.execute(statement, *multiparams, **params)
+            self._execute(statement, list(multiparams) + ([params] if params else []))
         else:
             if statement not in self.ordered_keys:
                 self.ordered_keys.append(statement)
@@ -62,13 +73,254 @@ class DeferrableExecutionQueue:
         """
         for statement in self.ordered_keys:
             if statement in self.stmt_queues:
-                self.conn.execute(statement, self.stmt_queues[statement])
+                self._execute(statement, self.stmt_queues[statement])
 
         # don't clear self.ordered_keys to preserve the order from first execution
         self.stmt_queues.clear()
 
+    def _execute(self, statement, multiparams):
+        if isinstance(statement, StagedInsert):
+            statement.execute(self.conn, multiparams)
+        else:
+            self.conn.execute(statement, multiparams)
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.execute_deferred()
+
+
+def _copy_format_value(value):
+    """
+    Format a Python value for PostgreSQL's ``COPY`` command in the text format.
+    """
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        # bytea in the hex format, the backslash is escaped for COPY
+        return "\\\\x" + bytes(value).hex()
+    value = str(value)
+    return value.replace("\\", "\\\\") \
+                .replace("\n", "\\n") \
+                .replace("\r", "\\r") \
+                .replace("\t", "\\t")
+
+def _copy_rows(conn, table, columns, rows):
+    preparer = conn.dialect.identifier_preparer
+    sql = "COPY {} ({}) FROM STDIN".format(preparer.format_table(table),
+                                          ", ".join(preparer.quote(c) for c in columns))
+
+    # the values are converted by the column types (e.g. JSONEncodedDict or
+    # MWTimestamp) the same way as for regular statements
+    processors = [table.c[c].type.bind_processor(conn.dialect) for c in columns]
+    if not any(processors):
+        def format_row(row):
+            return "\t".join(_copy_format_value(row.get(c)) for c in columns)
+    else:
+        def format_row(row):
+            values = []
+            for c, processor in zip(columns, processors):
+                value = row.get(c)
+                if processor is not None:
+                    value = processor(value)
+                    # unwrap psycopg2.Binary objects
+                    value = getattr(value, "adapted", value)
+                values.append(_copy_format_value(value))
+            return "\t".join(values)
+
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(format_row(row))
+        buffer.write("\n")
+    buffer.seek(0)
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+def bulk_insert(conn, table, rows, *, chunk_size=10000):
+    """
+    Insert many rows into a table with a minimal number of round trips to the
+    database server.
+
+    With the psycopg2 driver, the rows are streamed with PostgreSQL's
+    ``COPY ... FROM STDIN`` command, otherwise multi-row ``INSERT`` statements
+    are used. Rows may contain different sets of keys, missing values are set
+    to ``NULL``. Note that conflicts are not handled, so this is suitable only
+    for tables where the rows are known to not exist yet.
+
+    :param sqlalchemy.engine.Connection conn:
+        a connection (with an established transaction) to the database where
+        the rows are inserted
+    :param sqlalchemy.schema.Table table: the target table
+    :param list rows: a list of dicts mapping column names to values
+    :param int chunk_size: maximum number of rows sent in one statement
+    :returns: a list of the inserted column names
+    """
+    if not rows:
+        return []
+
+    # all columns used in the rows, in the order of the table definition
+    keys = set()
+    for row in rows:
+        keys.update(row)
+    columns = [c.name for c in table.columns if c.name in keys]
+    if len(columns) != len(keys):
+        raise ValueError("Unknown column(s) for table {}: {}".format(table.name, keys - set(columns)))
+
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i : i + chunk_size]
+        if conn.dialect.driver == "psycopg2":
+            _copy_rows(conn, table, columns, chunk)
+        else:
+            values = [dict((c, row.get(c)) for c in columns) for row in chunk]
+            conn.execute(table.insert().values(values))
+    return columns
+
+
+class StagedInsert:
+    """
+    Describes the insertion of rows into a table through a temporary staging
+    table: the rows are inserted into the staging table with
+    :py:func:`bulk_insert` and then merged into the target table with one
+    ``INSERT ... SELECT`` statement, which can handle conflicts and lookups
+    in other tables.
+
+    Use :py:meth:`upsert` to create the common case of a staging table with
+    the same columns as the target table.
+
+    :param sqlalchemy.schema.Table target: the target table
+    :param sqlalchemy.schema.Table staging:
+        the staging table, see :py:meth:`make_staging_table`
+    :param merge:
+        a statement (or a list of statements executed in the given order)
+        which merges the rows from the staging table into the target table, or
+        a callable taking a tuple of the column names present in the rows and
+        returning such statement
+    """
+
+    def __init__(self, target, staging, merge):
+        self.target = target
+        self.staging = staging
+        self._merge = merge
+        self._merge_cache = {}
+
+    @staticmethod
+    def make_staging_table(name, table=None, columns=()):
+        """
+        Creates a definition of a temporary table, which is dropped at the end
+        of the transaction.
+
+        :param str name: name of the staging table
+        :param sqlalchemy.schema.Table table:
+            if not ``None``, the staging table has the same columns (without
+            the constraints and defaults)
+        :param columns: additional :py:class:`sqlalchemy.schema.Column` objects
+        """
+        metadata = sa.MetaData()
+        _columns = []
+        if table is not None:
+            _columns += [sa.Column(c.name, c.type) for c in table.columns]
+        _columns += columns
+        return sa.Table(name, metadata, *_columns,
+                        prefixes=["TEMPORARY"], postgresql_on_commit="DROP")
+
+    @classmethod
+    def upsert(klass, table, *, index_elements, update=()):
+        """
+        Creates a staged insert equivalent to ``INSERT ... ON CONFLICT DO
+        UPDATE`` (or ``DO NOTHING`` if ``update`` is empty).
+
+        :param sqlalchemy.schema.Table table: the target table
+        :param index_elements: columns of the unique index for the conflicts
+        :param update: names of the columns updated on conflict
+        """
+        # the sequence column preserves the order in which the rows were staged
+        seq = sa.Column("staging_seq", sa.BigInteger, primary_key=True, autoincrement=True)
+        staging = klass.make_staging_table("staging_" + table.name, table, columns=[seq])
+
+        def merge(columns):
+            # only the columns present in the rows are inserted, the other
+            # columns get their default values
+            select = sa.select([staging.c[c] for c in columns])
+            set_ = dict((c, None) for c in update if c in columns)
+            if set_:
+                # ON CONFLICT DO UPDATE cannot affect the same row twice, the
+                # last staged row wins like with the executemany strategy
+                index_columns = [staging.c[c.name] for c in index_elements]
+                select = select.distinct(*index_columns) \
+                               .order_by(*index_columns, staging.c.staging_seq.desc())
+            ins = insert(table).from_select(columns, select)
+            set_ = dict((c, ins.excluded[c]) for c in set_)
+            if set_:
+                return ins.on_conflict_do_update(index_elements=index_elements, set_=set_)
+            return ins.on_conflict_do_nothing(index_elements=index_elements)
+
+        return klass(table, staging, merge)
+
+    def merge(self, columns):
+        """
+        Returns the merge statement for the given column names.
+        """
+        if not callable(self._merge):
+            return self._merge
+        columns = tuple(columns)
+        try:
+            return self._merge_cache[columns]
+        except KeyError:
+            stmt = self._merge_cache[columns] = self._merge(columns)
+            return stmt
+
+    def execute(self, conn, rows):
+        """
+        Inserts the rows into the target table.
+
+        :param sqlalchemy.engine.Connection conn:
+            a connection (with an established transaction) to the database
+        :param list rows: a list of dicts mapping column names to values
+        """
+        if not rows:
+            return
+        self.staging.create(conn, checkfirst=True)
+        columns = bulk_insert(conn, self.staging, rows)
+        merge = self.merge(columns)
+        if not isinstance(merge, (list, tuple)):
+            merge = [merge]
+        for statement in merge:
+            conn.execute(statement)
+        conn.execute(self.staging.delete())
+
+
+class BulkExecutionQueue(DeferrableExecutionQueue):
+    """
+    A variant of :py:class:`DeferrableExecutionQueue` where some statements are
+    executed with :py:class:`StagedInsert` (i.e. with PostgreSQL's ``COPY``
+    command) instead of the *executemany* execution strategy.
+
+    :param sqlalchemy.engine.Connection conn:
+        a connection (with an established transaction) to the database where the
+        statements are executed
+    :param int chunk_size:
+        maximum queue size
+    :param dict staged:
+        a mapping of the statements to be replaced to :py:class:`StagedInsert`
+        objects. The parameters of the statements must correspond to the
+        columns of the staging tables.
+    """
+    def __init__(self, conn, chunk_size, staged):
+        super().__init__(conn, chunk_size)
+        self.staged = staged
+
+    def _execute(self, statement, multiparams):
+        if not isinstance(statement, StagedInsert) and statement in self.staged:
+            statement = self.staged[statement]
+        super()._execute(statement, multiparams)
@@ -3,16 +3,30 @@
 import datetime
 import logging
 
+import sqlalchemy as sa
 from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import insert, aggregate_order_by
 
 from ws.client.api import ShortRecentChangesError
-from ws.db.execution import DeferrableExecutionQueue
+from ws.db.execution import DeferrableExecutionQueue, BulkExecutionQueue, StagedInsert
 
-__all__ = ["GrabberBase"]
+__all__ = ["GrabberBase", "Checkpoint"]
 
 logger = logging.getLogger(__name__)
 
+class Checkpoint:
+    """
+    A marker yielded by :py:meth:`GrabberBase.gen_insert_resumable` after all
+    entries fetched before the continuation point.
+
+    :param dict continue_:
+        the data needed to resume the import from this point (must not be
+        ``None``), it is passed back to
+        :py:meth:`GrabberBase.gen_insert_resumable` on resume
+    """
+    def __init__(self, continue_):
+        self.continue_ = continue_
+
 class GrabberBase:
 
     # class attributes that should be overridden in subclasses
@@ -22,11 +36,48 @@ class GrabberBase:
     # be here.
     INSERT_PREDELETE_TABLES = []
 
+    # Names of grabbers which must be finished before this grabber is started
+    # by :py:func:`ws.db.grabbers.run_grabbers`, because it reads their data
+    # (e.g. via the title context or ``db.query``) or references it by foreign
+    # keys. The other grabbers may run concurrently.
+    DEPENDENCIES = []
+
+    # If True, the initial import is done with gen_insert_resumable instead of
+    # gen_insert and committed in chunks of at least INSERT_CHUNK_ROWS entries,
+    # so that an interrupted import can be resumed from the last chunk.
+    RESUMABLE_INSERT = False
+    INSERT_CHUNK_ROWS = 100000
+
+    # If True, the non-unique indexes of the tables written by the statements
+    # in self.bulk_sql are dropped during the initial import and created again
+    # after it has finished, which is faster for huge imports.
+    BULK_INSERT_DROP_INDEXES = False
+
     def __init__(self, api, db):
         self.api = api
         self.db = db
 
-    def _set_sync_timestamp(self, timestamp, conn=None):
+        # Statements from self.sql which are executed with COPY during the
+        # initial import, mapped to ws.db.execution.StagedInsert objects.
+        self.bulk_sql = {}
+
+        # cached mapping of tag names to IDs, see _get_tag_id
+        self._tag_ids = {}
+
+        # Statements refreshing the tables of aggregated tag names, which are
+        # executed at the end of each sync in the same transaction. See
+        # _make_tag_aggregate_refresh. The statements in refresh_sql refresh
+        # the whole tables after the initial import, the statements in
+        # refresh_touched_sql refresh only the objects touched by an update.
+        self.refresh_sql = []
+        self.refresh_touched_sql = []
+        # Mapping of the statements from self.sql which touch the tags to
+        # lists of (key, param) tuples: the values of the key in the entries
+        # of the statement are collected into the expanding bound parameter
+        # param of the statements in refresh_touched_sql.
+        self.refresh_ids = {}
+
+    def _set_sync_timestamp(self, timestamp, conn=None, *, continue_=None):
         """
         Set a last-sync timestamp for the grabber. Writes into the custom
         ``ws_sync`` table.
@@ -35,36 +86,57 @@ class GrabberBase:
         :param conn: an existing :py:obj:`sqlalchemy.engine.Connection` or
             :py:obj:`sqlalchemy.engine.Transaction` object to be re-used for
             execution of the SQL query
+        :param dict continue_:
+            the continuation data of an unfinished resumable import, ``None``
+            marks the sync as finished
         """
         ws_sync = self.db.ws_sync
         ins = insert(ws_sync)
         ins = ins.on_conflict_do_update(
                     constraint=ws_sync.primary_key,
-                    set_={"wss_timestamp": ins.excluded.wss_timestamp}
+                    set_={
+                        "wss_timestamp": ins.excluded.wss_timestamp,
+                        "wss_continue": ins.excluded.wss_continue,
+                    }
                 )
         entry = {
             "wss_key": self.__class__.__name__,
             "wss_timestamp": timestamp,
+            "wss_continue": continue_,
         }
 
         if conn is None:
             conn = self.db.engine.connect()
         conn.execute(ins, entry)
 
-    def _get_sync_timestamp(self):
+    def _get_sync_state(self):
         """
-        Set a last-sync timestamp for the grabber. Reads from the custom
-        ``ws_sync`` table.
+        Get the last-sync timestamp and the continuation data of an unfinished
+        resumable import for the grabber. Reads from the custom ``ws_sync``
+        table.
+
+        :returns: a ``(timestamp, continue)`` tuple, ``(None, None)`` if the
+            grabber has never been synced
         """
         ws_sync = self.db.ws_sync
-        sel = select([ws_sync.c.wss_timestamp]) \
+        sel = select([ws_sync.c.wss_timestamp, ws_sync.c.wss_continue]) \
               .where(ws_sync.c.wss_key == self.__class__.__name__)
 
         conn = self.db.engine.connect()
         row = conn.execute(sel).fetchone()
         if row:
-            return row[0]
-        return None
+            return row[0], row[1]
+        return None, None
+
+    def _get_sync_timestamp(self):
+        """
+        Get a last-sync timestamp for the grabber. Returns ``None`` if the
+        grabber has never been synced or if its import has not finished.
+        """
+        timestamp, continue_ = self._get_sync_state()
+        if continue_ is not None:
+            return None
+        return timestamp
 
     def gen_insert(self):
         """
@@ -103,17 +175,227 @@ class GrabberBase:
         """
         raise NotImplementedError
 
+    def gen_insert_resumable(self, last_continue):
+        """
+        A resumable variant of :py:meth:`gen_insert`, used when
+        :py:attr:`RESUMABLE_INSERT` is ``True``.
+
+        To be implemented in subclasses.
+
+        In addition to the values accepted from :py:meth:`gen_insert`, the
+        generator should yield :py:class:`Checkpoint` objects at the points
+        where the import can be interrupted, typically after all entries from
+        one API query continuation. The import may be committed at any
+        checkpoint.
+
+        :param dict last_continue:
+            ``None`` to start the import from the beginning, otherwise the
+            ``continue_`` attribute of the last committed checkpoint
+        """
+        raise NotImplementedError
+
     def insert(self):
-        # delete everything and start over, otherwise the invalid rows would
-        # stay in the tables
+        drop_indexes = self.BULK_INSERT_DROP_INDEXES is True and self.bulk_sql
+        try:
+            if drop_indexes:
+                self._drop_bulk_indexes()
+
+            if self.RESUMABLE_INSERT is True:
+                sync_timestamp, last_continue = self._get_sync_state()
+            else:
+                last_continue = None
+
+            if last_continue is not None:
+                logger.info("Resuming the interrupted import of {}.".format(self.__class__.__name__))
+                # keep the timestamp from the start of the import, the changes
+                # made since then are synced by the next update
+                gen = self.gen_insert_resumable(last_continue)
+                self._execute_resumable(gen, sync_timestamp, bulk=True)
+            else:
+                # delete everything and start over, otherwise the invalid rows would
+                # stay in the tables
+                with self.db.engine.begin() as conn:
+                    for table in self.INSERT_PREDELETE_TABLES:
+                        conn.execute(self.db.metadata.tables[table].delete())
+
+                sync_timestamp = datetime.datetime.utcnow()
+
+                if self.RESUMABLE_INSERT is True:
+                    gen = self.gen_insert_resumable(None)
+                    self._execute_resumable(gen, sync_timestamp, bulk=True)
+                else:
+                    gen = self.gen_insert()
+                    self._execute(gen, sync_timestamp, bulk=True)
+        finally:
+            # the indexes are recreated even if the import fails, otherwise
+            # the subsequent updates would run without them
+            if drop_indexes:
+                self._create_bulk_indexes()
+
+    def _get_bulk_indexes(self):
+        tables = set(staged.target for staged in self.bulk_sql.values())
+        for table in sorted(tables, key=lambda t: t.name):
+            for index in sorted(table.indexes, key=lambda i: i.name):
+                # unique indexes are needed for the conflict handling
+                if not index.unique:
+                    yield table, index
+
+    def _drop_bulk_indexes(self):
+        preparer = self.db.engine.dialect.identifier_preparer
         with self.db.engine.begin() as conn:
-            for table in self.INSERT_PREDELETE_TABLES:
-                conn.execute(self.db.metadata.tables[table].delete())
+            for table, index in self._get_bulk_indexes():
+                conn.execute("DROP INDEX IF EXISTS {}".format(preparer.quote(index.name)))
 
-        sync_timestamp = datetime.datetime.utcnow()
+    def _create_bulk_indexes(self):
+        with self.db.engine.begin() as conn:
+            inspector = sa.inspect(conn)
+            existing = {}
+            for table, index in self._get_bulk_indexes():
+                if table.name not in existing:
+                    existing[table.name] = set(i["name"] for i in inspector.get_indexes(table.name))
+                if index.name not in existing[table.name]:
+                    logger.info("Creating index {} on table {}".format(index.name, table.name))
+                    index.create(conn)
 
-        gen = self.gen_insert()
-        self._execute(gen, sync_timestamp)
+    def _get_tag_id(self, tag_name):
+        """
+        Returns the ID of a tag, or ``None`` if the tag does not exist.
+
+        The mapping of tag names to IDs is loaded once and reloaded only when
+        an unknown tag name is requested, so the queries inserting into the
+        ``tagged_*`` tables do not have to look up the tag by its name.
+        """
+        try:
+            return self._tag_ids[tag_name]
+        except KeyError:
+            pass
+        tag = self.db.tag
+        result = self.db.engine.execute(select([tag.c.tag_name, tag.c.tag_id]))
+        self._tag_ids = dict(tuple(row) for row in result)
+        return self._tag_ids.get(tag_name)
+
+    def _make_staged_tag_insert(self, table, id_column, tag_id_column, id_param):
+        """
+        Creates a :py:class:`ws.db.execution.StagedInsert` for the statements
+        inserting into the ``tagged_*`` tables, which take the ``id_param``
+        (e.g. ``b_rev_id``) and ``b_tag_id`` parameters.
+        """
+        staging = StagedInsert.make_staging_table("staging_" + table.name, columns=[
+            sa.Column(id_param, sa.Integer),
+            sa.Column("b_tag_id", sa.Integer),
+        ])
+        merge = insert(table).from_select(
+                    [id_column.name, tag_id_column.name],
+                    select([staging.c[id_param], staging.c.b_tag_id])
+                ).on_conflict_do_nothing()
+        return StagedInsert(table, staging, merge)
+
+    def _make_staged_tag_changes(self, id_param, targets):
+        """
+        Creates a :py:class:`ws.db.execution.StagedInsert` which applies
+        changes of tags with a few set-based statements. The rows take the
+        ``id_param`` (e.g. ``b_rev_id``), ``b_tag_id`` and ``b_added``
+        parameters, where ``b_added`` is ``True`` for added tags and ``False``
+        for removed tags.
+
+        Changes of objects which do not exist in the database are ignored.
+
+        :param str id_param: name of the parameter identifying the tagged object
+        :param targets:
+            a list of ``(id_column, tag_id_column, key_column, match_column)``
+            tuples, where ``id_column`` and ``tag_id_column`` are columns of a
+            ``tagged_*`` table, ``key_column`` is the column referenced by
+            ``id_column`` and ``match_column`` is a column of the same table
+            as ``key_column`` which is matched against ``id_param``.
+        """
+        target = targets[0][0].table
+        staging = StagedInsert.make_staging_table("staging_" + target.name + "_changes", columns=[
+            sa.Column(id_param, sa.Integer),
+            sa.Column("b_tag_id", sa.Integer),
+            sa.Column("b_added", sa.Boolean),
+        ])
+        statements = []
+        for id_column, tag_id_column, key_column, match_column in targets:
+            table = id_column.table
+            statements.append(
+                table.delete().where(sa.and_(
+                    match_column == staging.c[id_param],
+                    id_column == key_column,
+                    tag_id_column == staging.c.b_tag_id,
+                    staging.c.b_added == False,
+                )))
+            statements.append(
+                insert(table).from_select(
+                    [id_column.name, tag_id_column.name],
+                    select([key_column, staging.c.b_tag_id])
+                        .select_from(staging.join(key_column.table, match_column == staging.c[id_param]))
+                        .where(staging.c.b_added == True)
+                ).on_conflict_do_nothing())
+        return StagedInsert(target, staging, statements)
+
+    def _make_tag_aggregate_refresh(self, aggregate, id_column, tag_id_column, touched=None):
+        """
+        Creates statements which bring a table of aggregated tag names (e.g.
+        ``tagged_revision_tgname``) up to date with a ``tagged_*`` table. Only
+        the rows whose tags have changed are written.
+
+        :param aggregate: the aggregate table, its columns are ``id_column``
+            and ``tag_names``
+        :param id_column: the column of the ``tagged_*`` table identifying the
+            tagged object
+        :param tag_id_column: the column of the ``tagged_*`` table referencing
+            the tag
+        :param touched:
+            ``None`` to refresh the whole table, otherwise a list of
+            expressions for the IDs of the touched objects (expanding bound
+            parameters or selects), the other rows are not refreshed
+        """
+        tag = self.db.tag
+        aggregate_id = aggregate.c[id_column.name]
+        tag_names = select([id_column, sa.func.array_agg(aggregate_order_by(tag.c.tag_name, tag.c.tag_name))]) \
+                        .select_from(tag.join(id_column.table, tag.c.tag_id == tag_id_column)) \
+                        .group_by(id_column)
+        delete = aggregate.delete().where(~sa.exists().where(id_column == aggregate_id))
+        if touched is not None:
+            tag_names = tag_names.where(sa.or_(*[id_column.in_(ids) for ids in touched]))
+            delete = delete.where(sa.or_(*[aggregate_id.in_(ids) for ids in touched]))
+        ins = insert(aggregate).from_select([aggregate_id.name, "tag_names"], tag_names)
+        ins = ins.on_conflict_do_update(
+                    index_elements=[aggregate_id],
+                    set_={"tag_names": ins.excluded.tag_names},
+                    where=aggregate.c.tag_names != ins.excluded.tag_names)
+        return [delete, ins]
+
+    def _collect_touched_ids(self, touched, statement, entry):
+        """
+        Adds the IDs of the objects whose tags are touched by the statement
+        to the ``touched`` dict, see :py:attr:`refresh_ids`.
+        """
+        for key, param in self.refresh_ids.get(statement, ()):
+            touched.setdefault(param, set()).add(entry[key])
+
+    def _refresh_tag_aggregates(self, conn, touched=None):
+        """
+        Refreshes the tables of aggregated tag names.
+
+        :param dict touched:
+            ``None`` to refresh the whole tables with :py:attr:`refresh_sql`,
+            otherwise a mapping of bound parameters to the sets of the touched
+            IDs for :py:attr:`refresh_touched_sql`
+        """
+        if touched is None:
+            for statement in self.refresh_sql:
+                conn.execute(statement)
+        elif touched:
+            params = dict((param, []) for keys in self.refresh_ids.values() for _, param in keys)
+            params.update((param, sorted(ids)) for param, ids in touched.items())
+            for statement in self.refresh_touched_sql:
+                conn.execute(statement, params)
+
+    def _make_execution_queue(self, conn, bulk):
+        if bulk is True and self.bulk_sql:
+            return BulkExecutionQueue(conn, self.db.chunk_size, self.bulk_sql)
+        return DeferrableExecutionQueue(conn, self.db.chunk_size)
 
     def update(self, *, since=None):
         sync_timestamp = datetime.datetime.utcnow()
@@ -131,16 +413,74 @@ class GrabberBase:
             logger.warning("The recent changes table on the wiki has been recently purged, so {} must start from scratch.".format(self.__class__.__name__))
             self.insert()
 
-    def _execute(self, gen, sync_timestamp):
+    def _execute(self, gen, sync_timestamp, *, bulk=False):
+        """
+        Executes the items from the generator in one transaction and sets the
+        sync timestamp.
+
+        :param gen: the generator from :py:meth:`gen_insert` or :py:meth:`gen_update`
+        :param datetime.datetime sync_timestamp: the new sync timestamp
+        :param bool bulk:
+            whether the statements in ``self.bulk_sql`` can be executed with
+            the fast path for the initial import
+        """
+        # IDs of the objects whose tags were touched by an update
+        touched = {}
         with self.db.engine.begin() as conn:
-            with DeferrableExecutionQueue(conn, self.db.chunk_size) as dfe:
+            with self._make_execution_queue(conn, bulk) as dfe:
                 for item in gen:
                     if isinstance(item, tuple):
                         # unpack the tuple
                         dfe.execute(*item)
+                        self._collect_touched_ids(touched, *item)
                     else:
                         # probably a single value
                         dfe.execute(item)
 
+            # the initial import refreshes the whole aggregates
+            self._refresh_tag_aggregates(conn, None if bulk is True else touched)
+
             # set the sync timestamp, in the same transaction as the data
             self._set_sync_timestamp(sync_timestamp, conn)
+
+    def _execute_resumable(self, gen, sync_timestamp, *, bulk=False):
+        """
+        Like :py:meth:`_execute`, but the transaction is committed at the
+        first :py:class:`Checkpoint` after every :py:attr:`INSERT_CHUNK_ROWS`
+        entries, together with the continuation data of the checkpoint.
+        """
+        conn = self.db.engine.connect()
+        try:
+            trans = conn.begin()
+            try:
+                dfe = self._make_execution_queue(conn, bulk)
+                rows = 0
+                for item in gen:
+                    if isinstance(item, Checkpoint):
+                        if rows >= self.INSERT_CHUNK_ROWS:
+                            dfe.execute_deferred()
+                            self._set_sync_timestamp(sync_timestamp, conn, continue_=item.continue_)
+                            trans.commit()
+                            logger.info("{}: committed {} rows.".format(self.__class__.__name__, rows))
+                            trans = conn.begin()
+                            rows = 0
+                    elif isinstance(item, tuple):
+                        # unpack the tuple
+                        dfe.execute(*item)
+                        rows += 1
+                    else:
+                        # probably a single value
+                        dfe.execute(item)
+                        rows += 1
+                dfe.execute_deferred()
+                # the aggregates are refreshed only when the import is finished
+                self._refresh_tag_aggregates(conn)
+
+                # mark the import as finished, in the same transaction as the data
+                self._set_sync_timestamp(sync_timestamp, conn)
+                trans.commit()
+            except:
+                trans.rollback()
+                raise
+        finally:
+            conn.close()
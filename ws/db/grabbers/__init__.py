@@ -2,6 +2,7 @@
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from ws.db.grabbers.namespace import GrabberNamespaces
 from ws.db.grabbers.tags import GrabberTags
@@ -16,7 +17,90 @@ from ws.db.grabbers.logging_ import GrabberLogging
 
 logger = logging.getLogger(__name__)
 
-def synchronize(db, api, *, with_content=False):
+# all grabbers in an order which satisfies their dependencies
+GRABBERS = [
+    GrabberNamespaces,
+    GrabberTags,
+    GrabberRecentChanges,
+    GrabberUsers,
+    GrabberLogging,
+    GrabberInterwiki,
+    GrabberIPBlocks,
+    GrabberPages,
+    GrabberProtectedTitles,
+    GrabberRevisions,
+]
+
+def run_grabbers(tasks, *, workers=1):
+    """
+    Runs the grabbers in a pool of threads, respecting their dependencies
+    declared in :py:attr:`GrabberBase.DEPENDENCIES`. A grabber is started as
+    soon as all its dependencies have finished, so independent grabbers run
+    concurrently. With ``workers=1``, the grabbers run one after another in the
+    given order.
+
+    When a grabber fails, no other grabbers are started and the exception is
+    re-raised after the running grabbers have finished. Each grabber commits
+    its data in its own transaction, so the finished grabbers are not affected.
+
+    :param tasks:
+        a list of ``(klass, function)`` pairs, where ``klass`` is a subclass of
+        :py:class:`GrabberBase` and ``function`` is a callable which runs the
+        grabber. The list must be in an order satisfying the dependencies.
+    :param int workers: maximum number of concurrently running grabbers
+    :returns: a list of ``(name, start, duration)`` tuples in the order in
+        which the grabbers were started, where ``start`` is the time offset
+        (in seconds) from the start of the first grabber
+    """
+    names = [klass.__name__ for klass, _ in tasks]
+    for i, (klass, _) in enumerate(tasks):
+        for dep in klass.DEPENDENCIES:
+            if dep in names and names.index(dep) > i:
+                raise ValueError("{} depends on {}, which comes later in the list".format(klass.__name__, dep))
+
+    pending = list(tasks)
+    finished = set()
+    running = {}
+    timings = []
+    time0 = time.time()
+
+    def run(name, function):
+        start = time.time()
+        function()
+        timings.append((name, start - time0, time.time() - start))
+
+    error = None
+    with ThreadPoolExecutor(workers) as executor:
+        while pending or running:
+            # start the grabbers whose dependencies have finished
+            # (dependencies which are not in the list are ignored)
+            for klass, function in list(pending):
+                if error is not None or len(running) >= workers:
+                    break
+                if all(dep in finished or dep not in names for dep in klass.DEPENDENCIES):
+                    pending.remove((klass, function))
+                    future = executor.submit(run, klass.__name__, function)
+                    running[future] = klass.__name__
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    logger.error("{} failed: {!r}".format(name, exc))
+                    if error is None:
+                        error = exc
+                else:
+                    finished.add(name)
+
+    if error is not None:
+        raise error
+    timings.sort(key=lambda t: t[1])
+    return timings
+
+def synchronize(db, api, *, with_content=False, workers=4):
     time1 = time.time()
 
     # if no recent change has been added, it's safe to assume that the other tables are up to date as well
@@ -25,16 +109,22 @@ def synchronize(db, api, *, with_content=False):
         logger.info("No new changes since the last database synchronization.")
         return
 
-    GrabberNamespaces(api, db).update()
-    GrabberTags(api, db).update()
-    GrabberRecentChanges(api, db).update()
-    GrabberUsers(api, db).update()
-    GrabberLogging(api, db).update()
-    GrabberInterwiki(api, db).update()
-    GrabberIPBlocks(api, db).update()
-    GrabberPages(api, db).update()
-    GrabberProtectedTitles(api, db).update()
-    GrabberRevisions(api, db, with_content=with_content).update()
+    def task(klass, **kwargs):
+        # the grabber is created in the worker thread, because some
+        # constructors query the API
+        return klass, lambda: klass(api, db, **kwargs).update()
+
+    tasks = []
+    for klass in GRABBERS:
+        if klass is GrabberRevisions:
+            tasks.append(task(klass, with_content=with_content))
+        else:
+            tasks.append(task(klass))
+
+    timings = run_grabbers(tasks, workers=workers)
 
     time2 = time.time()
-    logger.info("Synchronization of the database took {:.2f} seconds.".format(time2 - time1))
+    report = "Synchronization of the database took {:.2f} seconds:".format(time2 - time1)
+    for name, start, duration in timings:
+        report += "\n    {:<24} started at {:7.2f} s, took {:7.2f} s".format(name, start, duration)
+    logger.info(report)
@@ -7,6 +7,7 @@ from .GrabberBase import *
 class GrabberInterwiki(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["interwiki"]
+    DEPENDENCIES = ["GrabberLogging"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -29,6 +30,11 @@ class GrabberInterwiki(GrabberBase):
                     }),
         }
 
+    def _execute(self, gen, sync_timestamp, **kwargs):
+        super()._execute(gen, sync_timestamp, **kwargs)
+        # the cached title context depends on the interwiki table
+        self.db.invalidate_title_context()
+
     def gen_insert(self):
         for iw in self.api.site.interwikimap.values():
             db_entry = {
@@ -9,6 +9,7 @@ from .GrabberBase import *
 class GrabberIPBlocks(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["ipblocks"]
+    DEPENDENCIES = ["GrabberUsers", "GrabberLogging"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -4,17 +4,20 @@ import sqlalchemy as sa
 
 from ws.utils import value_or_none
 import ws.db.mw_constants as mwconst
+from ws.db.execution import StagedInsert
 
 from .GrabberBase import *
 
 class GrabberLogging(GrabberBase):
 
+    DEPENDENCIES = ["GrabberNamespaces", "GrabberTags", "GrabberRecentChanges", "GrabberUsers"]
+    RESUMABLE_INSERT = True
+
     def __init__(self, api, db):
         super().__init__(api, db)
 
         ins_logging = sa.dialects.postgresql.insert(db.logging)
         ins_tgle = sa.dialects.postgresql.insert(db.tagged_logevent)
-        ins_tgrc = sa.dialects.postgresql.insert(db.tagged_recentchange)
 
         self.sql = {
             ("insert", "logging"):
@@ -27,32 +30,41 @@ class GrabberLogging(GrabberBase):
             ("insert", "tagged_logevent"):
                 ins_tgle.values(
                     tgle_log_id=sa.bindparam("b_log_id"),
-                    tgle_tag_id=sa.select([db.tag.c.tag_id]) \
-                                    .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
-                    .on_conflict_do_nothing(),
-            ("insert", "tagged_recentchange"):
-                ins_tgrc.values(
-                    tgrc_rc_id=sa.select([db.recentchanges.c.rc_id]) \
-                                    .where(db.recentchanges.c.rc_logid == sa.bindparam("b_log_id")),
-                    tgrc_tag_id=sa.select([db.tag.c.tag_id]) \
-                                    .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
+                    tgle_tag_id=sa.bindparam("b_tag_id")) \
                     .on_conflict_do_nothing(),
-            ("delete", "tagged_logevent"):
-                db.tagged_logevent.delete() \
-                    .where(sa.and_(db.tagged_logevent.c.tgle_log_id == sa.bindparam("b_log_id"),
-                                   db.tagged_logevent.c.tgle_tag_id == sa.select([db.tag.c.tag_id]) \
-                                            .where(db.tag.c.tag_name == sa.bindparam("b_tag_name")))),
-            ("delete", "tagged_recentchange"):
-                db.tagged_recentchange.delete() \
-                    .where(sa.and_(db.tagged_recentchange.c.tgrc_rc_id == sa.select([db.recentchanges.c.rc_id]) \
-                                            .where(db.recentchanges.c.rc_logid == sa.bindparam("b_log_id")),
-                                   db.tagged_recentchange.c.tgrc_tag_id == sa.select([db.tag.c.tag_id]) \
-                                            .where(db.tag.c.tag_name == sa.bindparam("b_tag_name")))),
             ("update", "log_deleted"):
                 db.logging.update() \
                     .where(db.logging.c.log_id == sa.bindparam("b_log_id")),
         }
 
+        # staged changes of tags of existing logevents, applied to the
+        # logging and recentchanges tables at once
+        self.sql["sync", "tags"] = self._make_staged_tag_changes("b_log_id", [
+            (db.tagged_logevent.c.tgle_log_id, db.tagged_logevent.c.tgle_tag_id,
+             db.logging.c.log_id, db.logging.c.log_id),
+            (db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id,
+             db.recentchanges.c.rc_id, db.recentchanges.c.rc_logid),
+        ])
+
+        # the initial import does not touch the tags of recent changes
+        rc_ids = sa.select([db.recentchanges.c.rc_id]) \
+                    .where(db.recentchanges.c.rc_logid.in_(sa.bindparam("b_log_ids", expanding=True)))
+        self.refresh_touched_sql = self._make_tag_aggregate_refresh(
+                db.tagged_recentchange_tgname, db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id,
+                touched=[rc_ids])
+        self.refresh_ids = {
+            self.sql["sync", "tags"]: [("b_log_id", "b_log_ids")],
+        }
+
+        self.bulk_sql = {
+            self.sql["insert", "logging"]:
+                StagedInsert.upsert(db.logging, index_elements=[db.logging.c.log_id],
+                                    update=["log_deleted"]),
+            self.sql["insert", "tagged_logevent"]:
+                self._make_staged_tag_insert(db.tagged_logevent, db.tagged_logevent.c.tgle_log_id,
+                                             db.tagged_logevent.c.tgle_tag_id, "b_log_id"),
+        }
+
         self.le_params = {
             "list": "logevents",
             "leprop": "title|ids|type|user|userid|timestamp|comment|details|tags",
@@ -103,7 +115,7 @@ class GrabberLogging(GrabberBase):
         for tag_name in logevent.get("tags", []):
             db_entry = {
                 "b_log_id": logevent["logid"],
-                "b_tag_name": tag_name,
+                "b_tag_id": self._get_tag_id(tag_name),
             }
             yield self.sql["insert", "tagged_logevent"], db_entry
 
@@ -111,6 +123,13 @@ class GrabberLogging(GrabberBase):
         for logevent in self.api.list(self.le_params):
             yield from self.gen_inserts_from_logevent(logevent)
 
+    def gen_insert_resumable(self, last_continue):
+        for snippet, continue_ in self.api.query_continue_resumable(self.le_params, last_continue):
+            for logevent in snippet["logevents"]:
+                yield from self.gen_inserts_from_logevent(logevent)
+            if continue_ is not None:
+                yield Checkpoint(continue_)
+
     def gen_update(self, since):
         params = self.le_params.copy()
         params["ledir"] = "newer"
@@ -156,22 +175,7 @@ class GrabberLogging(GrabberBase):
         # update tags
         for logid, added in added_tags.items():
             for tag in added:
-                db_entry = {
-                    "b_log_id": logid,
-                    "b_tag_name": tag,
-                }
-                yield self.sql["insert", "tagged_logevent"], db_entry
-                # check if it is a recent change and tag it as well
-                result = self.db.engine.execute(sa.select([
-                            sa.exists().where(self.db.recentchanges.c.rc_logid == logid)
-                        ]))
-                if result.fetchone()[0]:
-                    yield self.sql["insert", "tagged_recentchange"], db_entry
+                yield self.sql["sync", "tags"], {"b_log_id": logid, "b_tag_id": self._get_tag_id(tag), "b_added": True}
         for logid, removed in removed_tags.items():
             for tag in removed:
-                db_entry = {
-                    "b_log_id": logid,
-                    "b_tag_name": tag,
-                }
-                yield self.sql["delete", "tagged_logevent"], db_entry
-                yield self.sql["delete", "tagged_recentchange"], db_entry
+                yield self.sql["sync", "tags"], {"b_log_id": logid, "b_tag_id": self._get_tag_id(tag), "b_added": False}
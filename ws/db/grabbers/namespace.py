@@ -45,6 +45,11 @@ class GrabberNamespaces(GrabberBase):
                     }),
         }
 
+    def _execute(self, gen, sync_timestamp, **kwargs):
+        super()._execute(gen, sync_timestamp, **kwargs)
+        # the cached title context depends on the namespace tables
+        self.db.invalidate_title_context()
+
     def gen_insert(self):
         for ns in self.api.site.namespaces.values():
             # don't store special namespaces in the database
@@ -10,6 +10,7 @@ from .GrabberBase import *
 class GrabberPages(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["page", "page_props", "page_restrictions"]
+    DEPENDENCIES = ["GrabberNamespaces", "GrabberInterwiki", "GrabberRecentChanges", "GrabberLogging"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -133,6 +134,8 @@ class GrabberPages(GrabberBase):
             deleted_tagged_revision.select()
         )
         self.sql["move", "tagged_revision"] = insert
+        # the moved revisions are deleted from the revision table, so the rows
+        # of tagged_revision_tgname are deleted by the foreign key cascade
 
 
     def gen_inserts_from_page(self, page):
@@ -225,18 +228,22 @@ class GrabberPages(GrabberBase):
 
 
     def gen_insert(self):
-        params = {
-            "generator": "allpages",
-            "gaplimit": "max",
-            "prop": "info|pageprops",
-            "inprop": "protection",
-        }
+        params_list = []
         for ns in self.api.site.namespaces.keys():
             if ns < 0:
                 continue
-            params["gapnamespace"] = ns
-            for page in self.api.generator(params):
-                yield from self.gen_inserts_from_page(page)
+            params = {
+                "generator": "allpages",
+                "gaplimit": "max",
+                "gapnamespace": ns,
+                "prop": "info|pageprops",
+                "inprop": "protection",
+            }
+            params_list.append(params)
+
+        # the namespaces are fetched concurrently
+        for page in self.api.generator_parallel(params_list):
+            yield from self.gen_inserts_from_page(page)
 
 
     def gen_update(self, since):
@@ -276,23 +283,26 @@ class GrabberPages(GrabberBase):
                 }
 
         if pages:
-            for chunk in ws.utils.iter_chunks(pages, self.api.max_ids_per_query):
-                params = {
-                    "action": "query",
-                    "pageids": "|".join(str(pageid) for pageid in chunk),
-                    "prop": "info|pageprops",
-                    "inprop": "protection",
-                }
-                pages = list(self.api.call_api(params)["pages"].values())
-
-                # ordering of SQL inserts is important for moved pages, but MediaWiki does
-                # not return ordered results for the pageids= parameter
-                pages.sort(key=lambda page: keys.index(page["pageid"]))
-
-                for page in pages:
-                    # deletes first, otherwise edit + move over redirect would fail
-                    yield from self.gen_deletes_from_page(page)
-                    yield from self.gen_inserts_from_page(page)
+            params = {
+                "prop": "info|pageprops",
+                "inprop": "protection",
+            }
+            # a continued response contains only the props which continue, so
+            # the snippets have to be merged before the pages can be inserted
+            merged = {}
+            for snippet in self.api.fetch_by_ids("pageids", pages, params):
+                for page in snippet["pages"].values():
+                    ws.utils.dmerge(page, merged.setdefault(page["pageid"], {}))
+
+            # ordering of SQL inserts is important for moved pages, but MediaWiki does
+            # not return ordered results for the pageids= parameter
+            positions = {pageid: i for i, pageid in enumerate(keys)}
+            merged_pages = sorted(merged.values(), key=lambda page: positions[page["pageid"]])
+
+            for page in merged_pages:
+                # deletes first, otherwise edit + move over redirect would fail
+                yield from self.gen_deletes_from_page(page)
+                yield from self.gen_inserts_from_page(page)
 
         # get_logpages does not include normal edits, so we need to go through list=allpages again
         if rc_oldest is None or rc_oldest > since:
@@ -11,6 +11,7 @@ from .GrabberBase import *
 class GrabberProtectedTitles(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["protected_titles"]
+    DEPENDENCIES = ["GrabberNamespaces", "GrabberInterwiki", "GrabberRecentChanges", "GrabberUsers"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -15,6 +15,7 @@ logger = logging.getLogger(__name__)
 class GrabberRecentChanges(GrabberBase):
 
     INSERT_PREDELETE_TABLES = ["recentchanges"]
+    DEPENDENCIES = ["GrabberNamespaces", "GrabberTags"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -42,12 +43,19 @@ class GrabberRecentChanges(GrabberBase):
             ("insert", "tagged_recentchange"):
                 ins_tgrc.values(
                     tgrc_rc_id=sa.bindparam("b_rc_id"),
-                    tgrc_tag_id=sa.select([db.tag.c.tag_id]) \
-                                    .select_from(db.tag) \
-                                    .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
+                    tgrc_tag_id=sa.bindparam("b_tag_id")) \
                     .on_conflict_do_nothing(),
         }
 
+        self.refresh_sql = self._make_tag_aggregate_refresh(
+                db.tagged_recentchange_tgname, db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id)
+        self.refresh_touched_sql = self._make_tag_aggregate_refresh(
+                db.tagged_recentchange_tgname, db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id,
+                touched=[sa.bindparam("b_rc_ids", expanding=True)])
+        self.refresh_ids = {
+            self.sql["insert", "tagged_recentchange"]: [("b_rc_id", "b_rc_ids")],
+        }
+
         self.rc_params = {
             "list": "recentchanges",
             "rcprop": "title|ids|user|userid|flags|timestamp|comment|sizes|loginfo|sha1|tags",
@@ -108,7 +116,7 @@ class GrabberRecentChanges(GrabberBase):
         for tag_name in rc.get("tags", []):
             db_entry = {
                 "b_rc_id": rc["rcid"],
-                "b_tag_name": tag_name,
+                "b_tag_id": self._get_tag_id(tag_name),
             }
             yield self.sql["insert", "tagged_recentchange"], db_entry
 
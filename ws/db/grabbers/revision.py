@@ -2,12 +2,17 @@
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import sqlalchemy as sa
 
 import ws.utils
 from ws.utils import value_or_none
 
+import ws.db.mw_constants as mwconst
+from ws.db.compression import compress_text
+from ws.db.execution import DeferrableExecutionQueue, StagedInsert
+
 from .GrabberBase import *
 
 logger = logging.getLogger(__name__)
@@ -15,73 +20,41 @@ logger = logging.getLogger(__name__)
 # TODO: are truncated results due to PHP cache reflected by changing the query-continuation parameter accordingly or do we actually lose some revisions?
 class GrabberRevisions(GrabberBase):
 
+    DEPENDENCIES = ["GrabberTags", "GrabberRecentChanges", "GrabberUsers", "GrabberPages"]
+    RESUMABLE_INSERT = True
+
+    # maximum number of revisions whose content is synchronized in one
+    # transaction by sync_revisions_content
+    CONTENT_RANGE_SIZE = 5000
+
     def __init__(self, api, db, *, with_content=False):
         super().__init__(api, db)
         self.with_content = with_content
 
-        ins_text = sa.dialects.postgresql.insert(db.text)
         ins_revision = sa.dialects.postgresql.insert(db.revision)
         ins_archive = sa.dialects.postgresql.insert(db.archive)
         ins_tgrev = sa.dialects.postgresql.insert(db.tagged_revision)
         ins_tgar = sa.dialects.postgresql.insert(db.tagged_archived_revision)
-        ins_tgrc = sa.dialects.postgresql.insert(db.tagged_recentchange)
 
         self.sql = {
-            ("insert", "text"):
-                ins_text.on_conflict_do_update(
-                    constraint=db.text.primary_key,
-                    set_={
-                        "old_text":  ins_text.excluded.old_text,
-                    }),
+            # rev_text_id and ar_text_id are set by the ("insert", "revision_text")
+            # and ("insert", "archive_text") queries
             ("insert", "revision"):
-                ins_revision.on_conflict_do_update(
-                    constraint=db.revision.primary_key,
-                    set_={
-                        # this should be the only column that may change with an insert query
-                        "rev_text_id": ins_revision.excluded.rev_text_id,
-                    }),
+                ins_revision.on_conflict_do_nothing(
+                    constraint=db.revision.primary_key),
             ("insert", "archive"):
-                ins_archive.on_conflict_do_update(
-                    index_elements=[db.archive.c.ar_rev_id],
-                    set_={
-                        # this should be the only column that may change with an insert query
-                        "ar_text_id": ins_archive.excluded.ar_text_id,
-                    }),
+                ins_archive.on_conflict_do_nothing(
+                    index_elements=[db.archive.c.ar_rev_id]),
             ("insert", "tagged_revision"):
                 ins_tgrev.values(
                     tgrev_rev_id=sa.bindparam("b_rev_id"),
-                    tgrev_tag_id=sa.select([db.tag.c.tag_id]) \
-                                        .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
+                    tgrev_tag_id=sa.bindparam("b_tag_id")) \
                     .on_conflict_do_nothing(),
             ("insert", "tagged_archived_revision"):
                 ins_tgar.values(
                     tgar_rev_id=sa.bindparam("b_rev_id"),
-                    tgar_tag_id=sa.select([db.tag.c.tag_id]) \
-                                        .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
-                    .on_conflict_do_nothing(),
-            ("insert", "tagged_recentchange"):
-                ins_tgrc.values(
-                    tgrc_rc_id=sa.select([db.recentchanges.c.rc_id]) \
-                                    .where(db.recentchanges.c.rc_this_oldid == sa.bindparam("b_rev_id")),
-                    tgrc_tag_id=sa.select([db.tag.c.tag_id]) \
-                                    .where(db.tag.c.tag_name == sa.bindparam("b_tag_name"))) \
+                    tgar_tag_id=sa.bindparam("b_tag_id")) \
                     .on_conflict_do_nothing(),
-            ("delete", "tagged_revision"):
-                db.tagged_revision.delete() \
-                    .where(sa.and_(db.tagged_revision.c.tgrev_rev_id == sa.bindparam("b_rev_id"),
-                                   db.tagged_revision.c.tgrev_tag_id == sa.select([db.tag.c.tag_id]) \
-                                            .where(db.tag.c.tag_name == sa.bindparam("b_tag_name")))),
-            ("delete", "tagged_archived_revision"):
-                db.tagged_archived_revision.delete() \
-                    .where(sa.and_(db.tagged_archived_revision.c.tgar_rev_id == sa.bindparam("b_rev_id"),
-                                   db.tagged_archived_revision.c.tgar_tag_id == sa.select([db.tag.c.tag_id]) \
-                                            .where(db.tag.c.tag_name == sa.bindparam("b_tag_name")))),
-            ("delete", "tagged_recentchange"):
-                db.tagged_recentchange.delete() \
-                    .where(sa.and_(db.tagged_recentchange.c.tgrc_rc_id == sa.select([db.recentchanges.c.rc_id]) \
-                                            .where(db.recentchanges.c.rc_this_oldid == sa.bindparam("b_rev_id")),
-                                   db.tagged_recentchange.c.tgrc_tag_id == sa.select([db.tag.c.tag_id]) \
-                                            .where(db.tag.c.tag_name == sa.bindparam("b_tag_name")))),
             # query for updating archive.ar_page_id
             ("update", "archive.ar_page_id"):
                 db.archive.update() \
@@ -104,12 +77,21 @@ class GrabberRevisions(GrabberBase):
             ("update", "ar_deleted"):
                 db.archive.update() \
                     .where(db.archive.c.ar_rev_id == sa.bindparam("b_rev_id")),
-            # query for updating revision.rev_text_id
-            ("update", "revision"):
-                db.revision.update() \
-                    .where(db.revision.c.rev_id == sa.bindparam("b_rev_id")),
         }
 
+        # queries for inserting the content of revisions, they take the
+        # b_rev_id and old_text parameters
+        new_text = sa.select([
+                        sa.bindparam("b_rev_id", type_=sa.Integer).label("b_rev_id"),
+                        sa.bindparam("old_text", type_=sa.UnicodeText).label("old_text"),
+                        sa.bindparam("old_blob", type_=sa.LargeBinary).label("old_blob"),
+                        sa.bindparam("old_flags", type_=sa.UnicodeText).label("old_flags"),
+                    ]).alias("new_text")
+        self.sql["insert", "revision_text"] = \
+            self._make_text_insert(db.revision.c.rev_id, db.revision.c.rev_text_id, new_text)
+        self.sql["insert", "archive_text"] = \
+            self._make_text_insert(db.archive.c.ar_rev_id, db.archive.c.ar_text_id, new_text)
+
         # build query to move data from the archive table into revision
         deleted_revision = db.archive.delete() \
             .where(db.archive.c.ar_page_id == sa.bindparam("b_page_id")) \
@@ -153,6 +135,57 @@ class GrabberRevisions(GrabberBase):
         )
         self.sql["move", "tagged_archived_revision"] = insert
 
+        # staged changes of tags of existing revisions, applied to the
+        # revision, archive and recentchanges tables at once
+        self.sql["sync", "tags"] = self._make_staged_tag_changes("b_rev_id", [
+            (db.tagged_revision.c.tgrev_rev_id, db.tagged_revision.c.tgrev_tag_id,
+             db.revision.c.rev_id, db.revision.c.rev_id),
+            (db.tagged_archived_revision.c.tgar_rev_id, db.tagged_archived_revision.c.tgar_tag_id,
+             db.archive.c.ar_rev_id, db.archive.c.ar_rev_id),
+            (db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id,
+             db.recentchanges.c.rc_id, db.recentchanges.c.rc_this_oldid),
+        ])
+
+        # the initial import does not touch the tags of recent changes
+        self.refresh_sql = self._make_tag_aggregate_refresh(
+                db.tagged_revision_tgname, db.tagged_revision.c.tgrev_rev_id, db.tagged_revision.c.tgrev_tag_id)
+        # updates touch the tags of new revisions, undeleted revisions (by
+        # page) and the revisions and recent changes with changed tags
+        undeleted_rev_ids = sa.select([db.revision.c.rev_id]) \
+                                .where(db.revision.c.rev_page.in_(sa.bindparam("b_page_ids", expanding=True)))
+        changed_rc_ids = sa.select([db.recentchanges.c.rc_id]) \
+                            .where(db.recentchanges.c.rc_this_oldid.in_(sa.bindparam("b_changed_rev_ids", expanding=True)))
+        self.refresh_touched_sql = self._make_tag_aggregate_refresh(
+                db.tagged_revision_tgname, db.tagged_revision.c.tgrev_rev_id, db.tagged_revision.c.tgrev_tag_id,
+                touched=[sa.bindparam("b_rev_ids", expanding=True),
+                         sa.bindparam("b_changed_rev_ids", expanding=True),
+                         undeleted_rev_ids])
+        self.refresh_touched_sql += self._make_tag_aggregate_refresh(
+                db.tagged_recentchange_tgname, db.tagged_recentchange.c.tgrc_rc_id, db.tagged_recentchange.c.tgrc_tag_id,
+                touched=[changed_rc_ids])
+        self.refresh_ids = {
+            self.sql["insert", "tagged_revision"]: [("b_rev_id", "b_rev_ids")],
+            self.sql["sync", "tags"]: [("b_rev_id", "b_changed_rev_ids")],
+            self.sql["move", "tagged_archived_revision"]: [("b_page_id", "b_page_ids")],
+        }
+
+        self.bulk_sql = {
+            self.sql["insert", "revision_text"]:
+                self._make_staged_text_insert(db.revision.c.rev_id, db.revision.c.rev_text_id),
+            self.sql["insert", "archive_text"]:
+                self._make_staged_text_insert(db.archive.c.ar_rev_id, db.archive.c.ar_text_id),
+            self.sql["insert", "revision"]:
+                StagedInsert.upsert(db.revision, index_elements=[db.revision.c.rev_id]),
+            self.sql["insert", "archive"]:
+                StagedInsert.upsert(db.archive, index_elements=[db.archive.c.ar_rev_id]),
+            self.sql["insert", "tagged_revision"]:
+                self._make_staged_tag_insert(db.tagged_revision, db.tagged_revision.c.tgrev_rev_id,
+                                             db.tagged_revision.c.tgrev_tag_id, "b_rev_id"),
+            self.sql["insert", "tagged_archived_revision"]:
+                self._make_staged_tag_insert(db.tagged_archived_revision, db.tagged_archived_revision.c.tgar_rev_id,
+                                             db.tagged_archived_revision.c.tgar_tag_id, "b_rev_id"),
+        }
+
         props = "ids|timestamp|flags|user|userid|comment|size|sha1|contentmodel|tags"
         if self.with_content is True:
             props += "|content"
@@ -176,23 +209,68 @@ class GrabberRevisions(GrabberBase):
 #            logger.warning("You need the 'patrol' right to request the patrolled flag. "
 #                           "Skipping it, but the sync will be incomplete.")
 
-    # TODO: text.old_id is auto-increment, but revision.rev_text_id has to be set accordingly. SQL should be able to do it automatically.
-    def _get_text_id_gen(self):
-        conn = self.db.engine.connect()
-        result = conn.execute(sa.select( [sa.sql.func.max(self.db.text.c.old_id)] ))
-        value = result.fetchone()[0]
-        if value is None:
-            value = 0
-        while True:
-            value += 1
-            yield value
-
-    def gen_text(self, rev, text_id):
+    def _make_text_insert(self, id_column, text_id_column, source):
+        """
+        Creates a query which inserts the content of revisions into the
+        ``text`` table and links it from the revision (or archive) rows.
+
+        The IDs are allocated from the sequence of ``text.old_id`` when the
+        ``text_id_column`` is updated, so the query can be executed from
+        multiple concurrent transactions. If the revision already has a text
+        ID, the existing ``text`` row is updated instead. The revision rows
+        must be inserted before the content.
+
+        :param id_column: the ``rev_id`` or ``ar_rev_id`` column
+        :param text_id_column: the ``rev_text_id`` or ``ar_text_id`` column
+        :param source:
+            a selectable with the ``b_rev_id``, ``old_text``, ``old_blob`` and
+            ``old_flags`` columns
+        """
+        text = self.db.text
+        # implicit sequence of the serial text.old_id column
+        text_id_seq = sa.Sequence("text_old_id_seq")
+        linked = text_id_column.table.update() \
+            .where(id_column == source.c.b_rev_id) \
+            .values({text_id_column: sa.func.coalesce(text_id_column, text_id_seq.next_value())}) \
+            .returning(text_id_column.label("old_id"), source.c.old_text, source.c.old_blob, source.c.old_flags) \
+            .cte("linked_text")
+        ins = sa.dialects.postgresql.insert(text).from_select(
+                    [text.c.old_id, text.c.old_text, text.c.old_blob, text.c.old_flags],
+                    sa.select([linked.c.old_id, linked.c.old_text, linked.c.old_blob, linked.c.old_flags])
+                )
+        return ins.on_conflict_do_update(
+                    constraint=text.primary_key,
+                    set_={
+                        "old_text": ins.excluded.old_text,
+                        "old_blob": ins.excluded.old_blob,
+                        "old_flags": ins.excluded.old_flags,
+                    })
+
+    def _make_staged_text_insert(self, id_column, text_id_column):
+        """
+        Creates a :py:class:`ws.db.execution.StagedInsert` for the queries
+        created by :py:meth:`_make_text_insert`.
+        """
+        staging = StagedInsert.make_staging_table("staging_text_" + text_id_column.table.name, columns=[
+            sa.Column("b_rev_id", sa.Integer),
+            sa.Column("old_text", sa.UnicodeText),
+            sa.Column("old_blob", sa.LargeBinary),
+            sa.Column("old_flags", sa.UnicodeText),
+        ])
+        merge = self._make_text_insert(id_column, text_id_column, staging)
+        return StagedInsert(self.db.text, staging, merge)
+
+    def gen_text(self, rev, table):
         db_entry = {
-            "old_id": text_id,
+            "b_rev_id": rev["revid"],
             "old_text": rev["*"],
+            "old_blob": None,
+            "old_flags": "",
         }
-        yield self.sql["insert", "text"], db_entry
+        if self.db.text_compression is not None:
+            db_entry["old_blob"], db_entry["old_flags"] = compress_text(rev["*"], self.db.text_compression)
+            db_entry["old_text"] = None
+        yield self.sql["insert", table + "_text"], db_entry
 
     def gen_revisions(self, page):
         for rev in page["revisions"]:
@@ -212,17 +290,15 @@ class GrabberRevisions(GrabberBase):
                 "rev_content_format": rev.get("contentformat"),  # available iff content is available
             }
 
-            if self.with_content is True:
-                text_id = next(self.text_id_gen)
-                db_entry["rev_text_id"] = text_id
-                yield from self.gen_text(rev, text_id)
-
             yield self.sql["insert", "revision"], db_entry
 
+            if self.with_content is True:
+                yield from self.gen_text(rev, "revision")
+
             for tag_name in rev.get("tags", []):
                 db_entry = {
                     "b_rev_id": rev["revid"],
-                    "b_tag_name": tag_name,
+                    "b_tag_id": self._get_tag_id(tag_name),
                 }
                 yield self.sql["insert", "tagged_revision"], db_entry
 
@@ -249,36 +325,51 @@ class GrabberRevisions(GrabberBase):
                 "ar_content_format": rev.get("contentformat"),  # available iff content is available
             }
 
-            if self.with_content is True:
-                text_id = next(self.text_id_gen)
-                db_entry["ar_text_id"] = text_id
-                yield from self.gen_text(rev, text_id)
-
             yield self.sql["insert", "archive"], db_entry
 
+            if self.with_content is True:
+                yield from self.gen_text(rev, "archive")
+
             for tag_name in rev.get("tags", []):
                 db_entry = {
                     "b_rev_id": rev["revid"],
-                    "b_tag_name": tag_name,
+                    "b_tag_id": self._get_tag_id(tag_name),
                 }
                 yield self.sql["insert", "tagged_archived_revision"], db_entry
 
-    # TODO: write custom insert and update methods, use discontinued API queries and wrap each chunk in a separate transaction
-    # TODO: generalize the above even for logging table
-
     def gen_insert(self):
-        # we need one instance per transaction
-        self.text_id_gen = self._get_text_id_gen()
-
         for page in self.api.list(self.arv_params):
             yield from self.gen_revisions(page)
         for page in self.api.list(self.adr_params):
             yield from self.gen_deletedrevisions(page)
 
-    def gen_update(self, since):
-        # we need one instance per transaction
-        self.text_id_gen = self._get_text_id_gen()
+    def gen_insert_resumable(self, last_continue):
+        # the lists are imported one after another, the checkpoints contain the
+        # name of the list and its continuation parameters
+        lists = [
+            (self.arv_params, self.gen_revisions),
+            (self.adr_params, self.gen_deletedrevisions),
+        ]
+        names = [params["list"] for params, _ in lists]
+        if last_continue is None:
+            start = 0
+            list_continue = None
+        else:
+            start = names.index(last_continue["list"])
+            list_continue = last_continue["continue"]
+
+        for i in range(start, len(lists)):
+            params, gen_entries = lists[i]
+            for snippet, continue_ in self.api.query_continue_resumable(params, list_continue):
+                for page in snippet[params["list"]]:
+                    yield from gen_entries(page)
+                if continue_ is not None:
+                    yield Checkpoint({"list": names[i], "continue": continue_})
+                elif i + 1 < len(lists):
+                    yield Checkpoint({"list": names[i + 1], "continue": None})
+            list_continue = None
 
+    def gen_update(self, since):
         # save new revids for the tag updates
         new_revids = set()
         new_deleted_revids = set()
@@ -450,42 +541,18 @@ class GrabberRevisions(GrabberBase):
             yield self.sql["update", "ar_deleted"], {"b_rev_id": revid, "ar_deleted": bitmask}
 
         # update tags
+        # Deleted revisions cannot be tagged in MediaWiki, but they might be
+        # undeleted, tagged, and deleted again before the sync, so the changes
+        # are applied to both normal and archived revisions as well as the
+        # recent changes. The statements are executed in the same transaction
+        # after all revisions queued above, new revisions added in this sync
+        # are skipped anyway.
         for revid, added in added_tags.items():
             for tag in added:
-                # Deleted revisions cannot be tagged in MediaWiki, but they might be
-                # undeleted, tagged, and deleted again before the sync. For inserts we
-                # have to check manually if it is normal or archived revision, otherwise
-                # we would get foreign key errors. New revisions added in this sync are
-                # skipped, so we don't mind if the queued queries were not executed yet.
-                db_entry = {
-                    "b_rev_id": revid,
-                    "b_tag_name": tag,
-                }
-                result = self.db.engine.execute(sa.select([
-                            sa.exists().where(self.db.revision.c.rev_id == revid)
-                        ]))
-                if result.fetchone()[0]:
-                    yield self.sql["insert", "tagged_revision"], db_entry
-                else:
-                    yield self.sql["insert", "tagged_archived_revision"], db_entry
-                # check if it is a recent change and tag it as well
-                result = self.db.engine.execute(sa.select([
-                            sa.exists().where(self.db.recentchanges.c.rc_this_oldid == revid)
-                        ]))
-                if result.fetchone()[0]:
-                    yield self.sql["insert", "tagged_recentchange"], db_entry
-
+                yield self.sql["sync", "tags"], {"b_rev_id": revid, "b_tag_id": self._get_tag_id(tag), "b_added": True}
         for revid, removed in removed_tags.items():
             for tag in removed:
-                # we don't care if the revisions actually exist in the revision or archive
-                # or recentchanges tables, some queries will just not do anything
-                db_entry = {
-                    "b_rev_id": revid,
-                    "b_tag_name": tag,
-                }
-                yield self.sql["delete", "tagged_revision"], db_entry
-                yield self.sql["delete", "tagged_archived_revision"], db_entry
-                yield self.sql["delete", "tagged_recentchange"], db_entry
+                yield self.sql["sync", "tags"], {"b_rev_id": revid, "b_tag_id": self._get_tag_id(tag), "b_added": False}
 
 
     def sync_latest_revisions_content(self):
@@ -505,30 +572,17 @@ class GrabberRevisions(GrabberBase):
 
         def gen():
             nonlocal counter
-            # we need one instance per transaction
-            self.text_id_gen = self._get_text_id_gen()
-
-            for chunk in ws.utils.iter_chunks(get_latest_revids(), self.api.max_ids_per_query):
-                params = {
-                    "action": "query",
-                    "revids": "|".join(str(i) for i in chunk),
-                    "prop": "revisions",
-                    "rvprop": "ids|content",
-                }
-                result = self.api.call_api(params, expand_result=False)
-                for page in result["query"]["pages"].values():
-                    for rev in page["revisions"]:
-                        text_id = next(self.text_id_gen)
-                        db_entry = {
-                            "b_rev_id": rev["revid"],
-                            "rev_text_id": text_id
-                        }
-                        yield from self.gen_text(rev, text_id)
-                        yield self.sql["update", "revision"], db_entry
+            params = {
+                "prop": "revisions",
+                "rvprop": "ids|content",
+            }
+            for snippet in self.api.fetch_by_ids("revids", get_latest_revids(), params):
+                for page in snippet["pages"].values():
+                    for rev in page.get("revisions", []):
+                        yield from self.gen_text(rev, "revision")
                         counter += 1
 
         # snippet copy-pasted from GrabberBase._execute, but without calling _set_sync_timestamp
-        from ws.db.execution import DeferrableExecutionQueue
         with self.db.engine.begin() as conn:
             with DeferrableExecutionQueue(conn, self.db.chunk_size) as dfe:
                 for item in gen():
@@ -544,3 +598,177 @@ class GrabberRevisions(GrabberBase):
             logger.info("Synchronization of the latest revisions content for {} pages took {:.2f} seconds.".format(counter, time2 - time1))
         else:
             logger.info("Content of all latest revisions is already fetched.")
+
+    def _get_content_columns(self, table):
+        """
+        Returns the ``(table, id, text_id, sha1, deleted)`` columns of the
+        ``"revision"`` or ``"archive"`` table.
+        """
+        if table == "revision":
+            t = self.db.revision
+            return t, t.c.rev_id, t.c.rev_text_id, t.c.rev_sha1, t.c.rev_deleted
+        elif table == "archive":
+            t = self.db.archive
+            return t, t.c.ar_rev_id, t.c.ar_text_id, t.c.ar_sha1, t.c.ar_deleted
+        raise ValueError("unsupported table: {}".format(table))
+
+    def _without_content(self, table):
+        """
+        Returns the condition for the rows of the given table whose content
+        should be fetched: the rows without content, except those whose
+        content is hidden.
+        """
+        _, _, text_id, _, deleted = self._get_content_columns(table)
+        return (text_id == None) & (deleted.op("&")(mwconst.DELETED_TEXT) == 0)
+
+    def _get_content_ranges(self, table):
+        """
+        Partitions the IDs of the revisions without content in the given table
+        (``"revision"`` or ``"archive"``) into ranges of at most
+        :py:attr:`CONTENT_RANGE_SIZE` revisions.
+
+        :yields: ``(first, last)`` tuples of revision IDs
+        """
+        _, id_column, _, _, _ = self._get_content_columns(table)
+        query = sa.select([id_column]).where(self._without_content(table)).order_by(id_column)
+        first = last = None
+        count = 0
+        for row in self.db.engine.execute(query):
+            if first is None:
+                first = row[0]
+            last = row[0]
+            count += 1
+            if count == self.CONTENT_RANGE_SIZE:
+                yield first, last
+                first = None
+                count = 0
+        if first is not None:
+            yield first, last
+
+    def _link_stored_content(self, conn, table, first, last):
+        """
+        Links the revisions in the given range, which do not have content yet,
+        to the ``text`` rows of other revisions with the same SHA1 hash.
+        """
+        t, id_column, text_id_column, sha1_column, _ = self._get_content_columns(table)
+
+        rev = self.db.revision.alias("other")
+        sources = [
+            sa.select([rev.c.rev_text_id]) \
+                .where(rev.c.rev_sha1 == sha1_column) \
+                .where(rev.c.rev_text_id != None)
+        ]
+        if table == "archive":
+            # archive.ar_sha1 is not indexed, so only the current range is searched
+            ar = self.db.archive.alias("other")
+            sources.append(
+                sa.select([ar.c.ar_text_id]) \
+                    .where(ar.c.ar_rev_id.between(first, last)) \
+                    .where(ar.c.ar_sha1 == sha1_column) \
+                    .where(ar.c.ar_text_id != None)
+            )
+
+        linked = 0
+        for stored in sources:
+            query = t.update() \
+                        .where(id_column.between(first, last)) \
+                        .where(text_id_column == None) \
+                        .where(sa.func.length(sha1_column) > 0) \
+                        .where(sa.exists(stored)) \
+                        .values({text_id_column: stored.limit(1).as_scalar()})
+            linked += conn.execute(query).rowcount
+        return linked
+
+    def _sync_content_range(self, table, first, last):
+        """
+        Synchronizes the content of the revisions in the given range of the
+        given table in one transaction. The content is fetched only once for
+        each distinct SHA1 hash and the revisions with the same hash share the
+        ``text`` row. Revisions whose content is not returned by the API (e.g.
+        ``textmissing``) are logged and left without content.
+
+        :returns: a ``(fetched, linked)`` tuple of the numbers of revisions
+        """
+        _, id_column, _, sha1_column, _ = self._get_content_columns(table)
+        fetched = 0
+        with self.db.engine.begin() as conn:
+            linked = self._link_stored_content(conn, table, first, last)
+
+            # the raw values are selected, because SHA1 cannot decode empty hashes
+            query = sa.select([id_column, sa.type_coerce(sha1_column, sa.LargeBinary)]) \
+                        .where(id_column.between(first, last)) \
+                        .where(self._without_content(table)) \
+                        .order_by(id_column)
+            revids = []
+            hashes = set()
+            for revid, sha1 in conn.execute(query):
+                if sha1:
+                    sha1 = bytes(sha1)
+                    if sha1 in hashes:
+                        continue
+                    hashes.add(sha1)
+                revids.append(revid)
+
+            if table == "revision":
+                params = {
+                    "prop": "revisions",
+                    "rvprop": "ids|content",
+                }
+            else:
+                params = {
+                    "prop": "deletedrevisions",
+                    "drvprop": "ids|content",
+                }
+            with DeferrableExecutionQueue(conn, self.db.chunk_size) as dfe:
+                for snippet in self.api.fetch_by_ids("revids", revids, params):
+                    for page in snippet["pages"].values():
+                        for rev_ in page.get(params["prop"], []):
+                            if "*" in rev_:
+                                dfe.execute(*next(self.gen_text(rev_, table)))
+                                fetched += 1
+                            else:
+                                # rev_deleted/ar_deleted mirror the wiki, so the
+                                # revision is not marked and will be retried
+                                logger.warning("The API did not return the content of revision {} in the {} table.".format(rev_["revid"], table))
+
+            # link the remaining revisions with the same hashes
+            linked += self._link_stored_content(conn, table, first, last)
+
+        return fetched, linked
+
+    def sync_revisions_content(self, *, workers=4):
+        """
+        Synchronizes the content of all revisions (not only the latest ones),
+        including the deleted revisions in the ``archive`` table, which do not
+        have it in the database yet.
+
+        The revision IDs are partitioned into ranges which are fetched by
+        concurrent workers and each range is committed in a separate
+        transaction, so an interrupted synchronization continues from the
+        unfinished ranges when it is started again. The content is fetched
+        and stored only once for all revisions with the same SHA1 hash (e.g.
+        reverts). Ranges synchronized at the same time do not see each other's
+        content, so a few duplicates may still be stored. Revisions whose
+        content is hidden (``DELETED_TEXT`` in ``rev_deleted`` or
+        ``ar_deleted``) are skipped.
+
+        :param int workers: number of ranges synchronized concurrently
+        """
+        time1 = time.time()
+        fetched = linked = 0
+
+        ranges = [(table, first, last)
+                  for table in ["revision", "archive"]
+                  for first, last in self._get_content_ranges(table)]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for i, result in enumerate(executor.map(lambda r: self._sync_content_range(*r), ranges)):
+                fetched += result[0]
+                linked += result[1]
+                logger.info("Synchronized content of {} rows {} to {} ({}/{} ranges).".format(*ranges[i], i + 1, len(ranges)))
+
+        time2 = time.time()
+        if fetched + linked > 0:
+            logger.info("Synchronization of the content of {} revisions took {:.2f} seconds ({} fetched, {} shared with other revisions)."
+                        .format(fetched + linked, time2 - time1, fetched, linked))
+        else:
+            logger.info("Content of all revisions is already fetched.")
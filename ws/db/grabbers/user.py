@@ -20,6 +20,7 @@ class GrabberUsers(GrabberBase):
     # If we find out that MediaWiki sometimes deletes from the user table, it
     # should be handled differently.
     INSERT_PREDELETE_TABLES = ["user_groups"]
+    DEPENDENCIES = ["GrabberRecentChanges"]
 
     def __init__(self, api, db):
         super().__init__(api, db)
@@ -0,0 +1,28 @@
+"""sync the sequence of text.old_id
+
+The text IDs used to be allocated in the client, so the sequence of the
+serial column has to be moved past the existing IDs.
+
+Revision ID: 6a2f0c9d81b4
+Revises: e4a1bd3c7f02
+Create Date: 2026-10-16 14:02:47.518306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6a2f0c9d81b4'
+down_revision = 'e4a1bd3c7f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("SELECT setval('text_old_id_seq', coalesce(max(old_id), 0) + 1, false) FROM text")
+
+
+def downgrade():
+    # the sequence is not used by the previous revision
+    pass
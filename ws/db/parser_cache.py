@@ -1,14 +1,15 @@
 #! /usr/bin/env python3
 
 import logging
-from functools import lru_cache
+import multiprocessing
 
 import sqlalchemy as sa
 from sqlalchemy.dialects.postgresql import insert
 import mwparserfromhell
 
-from .selects.namespaces import get_namespaces
-from ..parser_helpers.template_expansion import expand_templates
+from .execution import bulk_insert
+from .template_cache import TemplateCache
+from ..parser_helpers.template_expansion import ExpansionCache, expand_templates
 from ..parser_helpers.wikicode import get_anchors, is_redirect, parented_ifilter
 from ..parser_helpers.title import TitleError
 from ..parser_helpers.encodings import urldecode
@@ -46,23 +47,28 @@ def get_normalized_extlinks(wikicode):
     return extlinks
 
 class ParserCache:
-    def __init__(self, db):
+
+    # number of pages sent to a worker process at once
+    worker_chunksize = 16
+    # maximum number of pages written in one transaction
+    batch_pages = 100
+    # maximum number of link table rows written in one transaction
+    batch_rows = 20000
+    # maximum number of cached template expansions
+    expansion_cache_size = 4096
+
+    def __init__(self, db, *, cache_dir=None):
         self.db = db
+        self.cache_dir = cache_dir
         self.invalidated_pageids = set()
+        self.template_cache = TemplateCache(db, cache_dir=cache_dir)
+        self.expansion_cache = ExpansionCache(self.expansion_cache_size)
 
         wspc_sync = self.db.ws_parser_cache_sync
         wspc_sync_ins = insert(wspc_sync)
 
+        # the link tables are written with ws.db.execution.bulk_insert
         self.sql_inserts = {
-            "templatelinks": self.db.templatelinks.insert(),
-            "pagelinks": self.db.pagelinks.insert(),
-            "imagelinks": self.db.imagelinks.insert(),
-            "categorylinks": self.db.categorylinks.insert(),
-            "langlinks": self.db.langlinks.insert(),
-            "iwlinks": self.db.iwlinks.insert(),
-            "externallinks": self.db.externallinks.insert(),
-            "redirect": self.db.redirect.insert(),
-            "section": self.db.section.insert(),
             "ws_parser_cache_sync":
                 wspc_sync_ins.on_conflict_do_update(
                     constraint=wspc_sync.primary_key,
@@ -126,10 +132,9 @@ class ParserCache:
         conn.execute(self.db.redirect.delete().where(self.db.redirect.c.rd_from.in_(self.invalidated_pageids)))
         conn.execute(self.db.section.delete().where(self.db.section.c.sec_page.in_(self.invalidated_pageids)))
 
-    def _insert_templatelinks(self, conn, pageid, transclusions):
+    def _get_templatelinks(self, pageid, transclusions):
         db_entries = []
-        for t in transclusions:
-            title = self.db.Title(t)
+        for title in self.db.Titles(transclusions):
             entry = {
                 "tl_from": pageid,
                 "tl_namespace": title.namespacenumber,
@@ -137,10 +142,9 @@ class ParserCache:
             }
             db_entries.append(entry)
 
-        if db_entries:
-            conn.execute(self.sql_inserts["templatelinks"], db_entries)
+        return db_entries
 
-    def _insert_pagelinks(self, conn, pageid, pagelinks):
+    def _get_pagelinks(self, pageid, pagelinks):
         db_entries = []
         for title in pagelinks:
             entry = {
@@ -153,10 +157,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["pl_from"], v["pl_namespace"], v["pl_title"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["pagelinks"], db_entries)
+        return db_entries
 
-    def _insert_imagelinks(self, conn, pageid, imagelinks):
+    def _get_imagelinks(self, pageid, imagelinks):
         db_entries = []
         for title in imagelinks:
             entry = {
@@ -168,10 +171,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["il_from"], v["il_to"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["imagelinks"], db_entries)
+        return db_entries
 
-    def _insert_categorylinks(self, conn, pageid, from_title, categorylinks):
+    def _get_categorylinks(self, pageid, from_title, categorylinks):
         db_entries = []
         for title, prefix in categorylinks:
             sortkey = from_title.pagename.upper()
@@ -198,10 +200,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["cl_from"], v["cl_to"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["categorylinks"], db_entries)
+        return db_entries
 
-    def _insert_langlinks(self, conn, pageid, langlinks):
+    def _get_langlinks(self, pageid, langlinks):
         db_entries = []
         for title in langlinks:
             if title.namespace:
@@ -221,10 +222,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["ll_from"], v["ll_lang"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["langlinks"], db_entries)
+        return db_entries
 
-    def _insert_iwlinks(self, conn, pageid, iwlinks):
+    def _get_iwlinks(self, pageid, iwlinks):
         db_entries = []
         for title in iwlinks:
             entry = {
@@ -237,10 +237,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["iwl_from"], v["iwl_prefix"], v["iwl_title"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["iwlinks"], db_entries)
+        return db_entries
 
-    def _insert_externallinks(self, conn, pageid, externallinks):
+    def _get_externallinks(self, pageid, externallinks):
         db_entries = []
         for ext in externallinks:
             url = str(ext.url)
@@ -253,10 +252,9 @@ class ParserCache:
         # drop duplicates
         db_entries = list({ (v["el_from"], v["el_to"] ):v for v in db_entries}.values())
 
-        if db_entries:
-            conn.execute(self.sql_inserts["externallinks"], db_entries)
+        return db_entries
 
-    def _insert_redirect(self, conn, pageid, target):
+    def _get_redirect(self, pageid, target):
         db_entry = {
             "rd_from": pageid,
             "rd_namespace": target.namespacenumber if not target.iwprefix else None,
@@ -274,13 +272,13 @@ class ParserCache:
         if target.sectionname:
             db_entry["rd_fragment"] = target.sectionname
 
-        conn.execute(self.sql_inserts["redirect"], db_entry)
+        return [db_entry]
 
-    def _insert_section(self, conn, pageid, levels, headings):
+    def _get_section(self, pageid, levels, headings):
+        db_entries = []
         if headings:
             anchors = get_anchors(headings)
 
-            db_entries = []
             for i, level, title, anchor in zip(range(len(headings)), levels, headings, anchors):
                 db_entry = {
                     "sec_page": pageid,
@@ -291,36 +289,16 @@ class ParserCache:
                 }
                 db_entries.append(db_entry)
 
-            conn.execute(self.sql_inserts["section"], db_entries)
+        return db_entries
 
-    def _set_sync_revid(self, conn, pageid, revid):
+    def _parse_page(self, pageid, title, content):
         """
-        Set the ``pageid``, ``revid`` pair in the ``ws_parser_cache_sync`` table.
-        """
-        entry = {
-            "wspc_page_id": pageid,
-            "wspc_rev_id": revid,
-        }
-        conn.execute(self.sql_inserts["ws_parser_cache_sync"], entry)
-
-    # cacheable part of the content getter, using common cache across all SQL transactions
-    @lru_cache(maxsize=128)
-    def _cached_content_getter(self, title):
-        pages_gen = self.db.query(titles=title, prop="latestrevisions", rvprop="content")
-        page = next(pages_gen)
-
-        if "revisions" in page:
-            if "*" in page["revisions"][0]:
-                return page["revisions"][0]["*"]
-            else:
-                logger.error("ParserCache: no latest revision found for page [[{}]]".format(page["title"]))
-                raise ValueError
-        else:
-            # no revision => page does not exist
-            logger.warn("ParserCache: page not found: {{" + title + "}}")
-            raise ValueError
+        Parse the content of a page and extract the entries for the link
+        tables. Nothing is written into the database by this method, see
+        :py:meth:`_write_pages`.
 
-    def _parse_page(self, conn, pageid, title, content):
+        :returns: a dict mapping table names to lists of entries
+        """
         logger.info("ParserCache: parsing page [[{}]] ...".format(title))
         title = self.db.Title(title)
 
@@ -333,28 +311,31 @@ class ParserCache:
             # (even MediaWiki does not track such transclusions in the templatelinks table)
             if title.namespacenumber < 0:
                 raise ValueError
-            # set and lru_cache need hashable types
+            # set and the template cache need hashable types
             title = str(title)
             nonlocal transclusions
             transclusions.add(title)
-            return self._cached_content_getter(title)
+            return self.template_cache.get(title)
 
         wikicode = mwparserfromhell.parse(content)
-        expand_templates(title, wikicode, content_getter)
+        expand_templates(title, wikicode, content_getter, cache=self.expansion_cache,
+                         content_is_prepared=True)
 
-        logger.debug("ParserCache: content getter cache statistics: {}".format(self._cached_content_getter.cache_info()))
+        logger.debug("ParserCache: template cache statistics: {}".format(self.template_cache.cache_info()))
+        logger.debug("ParserCache: expansion cache statistics: {}".format(self.expansion_cache.cache_info()))
 
-        # templatelinks can be updated right away
-        self._insert_templatelinks(conn, pageid, transclusions)
+        entries = {}
+        entries["templatelinks"] = self._get_templatelinks(pageid, transclusions)
 
         # parse redirect using regex-based parser helper
         if is_redirect(str(wikicode)):
             page_is_redirect = True
             # the redirect target is just the first wikilink
             redirect_target = wikicode.filter_wikilinks()[0]
-            self._insert_redirect(conn, pageid, self.db.Title(str(redirect_target.title)))
+            entries["redirect"] = self._get_redirect(pageid, self.db.Title(str(redirect_target.title)))
         else:
             page_is_redirect = False
+            entries["redirect"] = []
 
         # replace HTML entities like "&#61" or "&Sigma;" with their unicode equivalents
 #        for entity in wikicode.ifilter_html_entities(recursive=True):
@@ -366,7 +347,7 @@ class ParserCache:
         # normalize and extract external links
         # (should be done before wikilinks and other nodes, because URLs need to be re-parsed due to adjacent templates)
         extlinks = get_normalized_extlinks(wikicode)
-        self._insert_externallinks(conn, pageid, extlinks)
+        entries["externallinks"] = self._get_externallinks(pageid, extlinks)
 
         pagelinks = []
         imagelinks = []
@@ -422,11 +403,11 @@ class ParserCache:
                 if target.namespacenumber >= 0:
                     pagelinks.append(target)
 
-        self._insert_pagelinks(conn, pageid, pagelinks)
-        self._insert_iwlinks(conn, pageid, iwlinks)
-        self._insert_categorylinks(conn, pageid, title, categorylinks)
-        self._insert_langlinks(conn, pageid, langlinks)
-        self._insert_imagelinks(conn, pageid, imagelinks)
+        entries["pagelinks"] = self._get_pagelinks(pageid, pagelinks)
+        entries["iwlinks"] = self._get_iwlinks(pageid, iwlinks)
+        entries["categorylinks"] = self._get_categorylinks(pageid, title, categorylinks)
+        entries["langlinks"] = self._get_langlinks(pageid, langlinks)
+        entries["imagelinks"] = self._get_imagelinks(pageid, imagelinks)
 
         # extract section headings
         levels = []
@@ -434,11 +415,66 @@ class ParserCache:
         for heading in wikicode.ifilter_headings(recursive=True):
             levels.append(heading.level)
             headings.append(heading.title.strip())
-        self._insert_section(conn, pageid, levels, headings)
+        entries["section"] = self._get_section(pageid, levels, headings)
+
+        return entries
+
+    def _write_pages(self, parsed):
+        """
+        Write the entries extracted by :py:meth:`_parse_page` into the
+        database and set the ``pageid``, ``revid`` pairs in the
+        ``ws_parser_cache_sync`` table.
+
+        The pages are written in batches, each batch is committed in a separate
+        transaction as soon as it contains :py:attr:`batch_pages` pages or
+        :py:attr:`batch_rows` rows.
+
+        :param parsed: an iterable of ``(pageid, revid, entries)`` tuples
+        """
+        batch = []
+        rows = 0
+        for item in parsed:
+            batch.append(item)
+            rows += sum(len(db_entries) for db_entries in item[2].values())
+            if len(batch) >= self.batch_pages or rows >= self.batch_rows:
+                self._write_batch(batch)
+                batch = []
+                rows = 0
+        if batch:
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        tables = {}
+        sync_entries = []
+        for pageid, revid, entries in batch:
+            for table, db_entries in entries.items():
+                tables.setdefault(table, []).extend(db_entries)
+            sync_entries.append({
+                "wspc_page_id": pageid,
+                "wspc_rev_id": revid,
+            })
+
+        with self.db.engine.begin() as conn:
+            for table, db_entries in tables.items():
+                bulk_insert(conn, self.db.metadata.tables[table], db_entries)
+            conn.execute(self.sql_inserts["ws_parser_cache_sync"].values(sync_entries))
+
+    def update(self, *, workers=1):
+        """
+        Update the parser cache tables.
+
+        :param int workers:
+            Number of worker processes used for parsing the pages. With the
+            default value of 1, the pages are parsed in the current process.
+            Otherwise, the pages are distributed to a pool of worker processes
+            (each with its own database connection) which return the extracted
+            entries, and the current process writes them into the database.
+        """
+        if workers < 1:
+            raise ValueError("the number of workers must be positive")
 
-    def update(self):
         self.invalidated_pageids = set()
-        namespaces = get_namespaces(self.db)
+        namespaces = self.db.title_context.namespaces
 
         logger.info("ParserCache: Invalidating old entries...")
         with self.db.engine.begin() as conn:
@@ -452,25 +488,61 @@ class ParserCache:
 
         logger.info("ParserCache: Parsing new content...")
 
-        def parse_namespace(ns):
+        def gen_pages(ns):
             for page in self.db.query(generator="allpages", gapnamespace=ns, prop="latestrevisions", rvprop={"content", "ids"}):
-                # one transaction per page
-                with self.db.engine.begin() as conn:
-                    if "*" in page["revisions"][0]:
-                        if page["pageid"] in self.invalidated_pageids:
-                            self._parse_page(conn, page["pageid"], page["title"], page["revisions"][0]["*"])
-                            self._set_sync_revid(conn, page["pageid"], page["revisions"][0]["revid"])
-                    else:
-                        logger.error("ParserCache: no latest revision found for page [[{}]]".format(page["title"]))
-
-        # parse templates before the main namespace so that we can interrupt afterwards
-        parse_namespace(10)
-
-        for ns in sorted(namespaces.keys()):
-            if ns < 0 or ns == 10:
-                continue
-            parse_namespace(ns)
+                if "*" in page["revisions"][0]:
+                    if page["pageid"] in self.invalidated_pageids:
+                        yield page["pageid"], page["revisions"][0]["revid"], page["title"], page["revisions"][0]["*"]
+                else:
+                    logger.error("ParserCache: no latest revision found for page [[{}]]".format(page["title"]))
+
+        def parse_namespace(ns, pool=None):
+            if pool is None:
+                parsed = (self._parse_page_task(task) for task in gen_pages(ns))
+            else:
+                parsed = pool.imap_unordered(_parse_page_in_worker, gen_pages(ns), chunksize=self.worker_chunksize)
+            self._write_pages(parsed)
+
+        def parse_all(pool=None):
+            # parse templates before the main namespace so that we can interrupt afterwards
+            parse_namespace(10, pool)
+
+            for ns in sorted(namespaces.keys()):
+                if ns < 0 or ns == 10:
+                    continue
+                parse_namespace(ns, pool)
+
+        if workers == 1:
+            parse_all()
+        else:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self.db.engine.url, self.cache_dir)) as pool:
+                parse_all(pool)
+
+    def _parse_page_task(self, task):
+        """
+        Wrapper around :py:meth:`_parse_page` for the tasks generated in
+        :py:meth:`update`.
+        """
+        pageid, revid, title, content = task
+        return pageid, revid, self._parse_page(pageid, title, content)
 
     def invalidate_all(self):
         with self.db.engine.begin() as conn:
             conn.execute(self.db.ws_parser_cache_sync.delete())
+
+
+# parser cache instance of the worker process
+_worker_cache = None
+
+def _init_worker(url, cache_dir):
+    """
+    Initializer for the worker processes used by :py:meth:`ParserCache.update`.
+    Each worker needs its own database connection.
+    """
+    global _worker_cache
+    # lazy import due to circular dependency
+    from .database import Database
+    _worker_cache = ParserCache(Database(url), cache_dir=cache_dir)
+
+def _parse_page_in_worker(task):
+    return _worker_cache._parse_page_task(task)
@@ -32,8 +32,9 @@ Known incompatibilities from MediaWiki schema:
     - The change_tag table was split into tagged_recentchange, tagged_logevent,
       tagged_revision and tagged_archived_revision. Foreign keys on the other
       tables are enforced.
-    - The equivalent of the tag_summary table does not exist, we can live with
-      the GROUP BY queries.
+    - The equivalent of the tag_summary table is split into
+      tagged_recentchange_tgname and tagged_revision_tgname, which hold the
+      aggregated tag names and are refreshed by the grabbers.
 - Various notes on tables used by MediaWiki, but not wiki-scripts:
     - site_stats: we don't sync the site stats because the values are
       inconsistent even in MediaWiki
@@ -51,7 +52,7 @@ from sqlalchemy import \
         Table, Column, ForeignKey, Index, PrimaryKeyConstraint, ForeignKeyConstraint, CheckConstraint
 from sqlalchemy.types import \
         Boolean, SmallInteger, Integer, Float, \
-        UnicodeText, Enum, DateTime, ARRAY
+        UnicodeText, LargeBinary, Enum, DateTime, ARRAY
 
 from .sql_types import \
         MWTimestamp, SHA1, JSONEncodedDict
@@ -102,7 +103,10 @@ def create_custom_tables(metadata):
     ws_sync = Table("ws_sync", metadata,
         Column("wss_key", UnicodeText, nullable=False, primary_key=True),
         # timestamp of the last successful sync of the table
-        Column("wss_timestamp", DateTime, nullable=False)
+        Column("wss_timestamp", DateTime, nullable=False),
+        # API continuation parameters of an unfinished resumable import
+        # (NULL if the last sync has finished)
+        Column("wss_continue", JSONEncodedDict)
     )
 
 
@@ -223,8 +227,15 @@ def create_recentchanges_tables(metadata):
         PrimaryKeyConstraint("tgle_tag_id", "tgle_log_id")
     )
 
-    # TODO: create materialized views tagged_recentchange_tgname, tagged_logevent_tgname
-    # (basically 'SELECT tgrc_rc_id, array_agg(tag_name) FROM tag JOIN tagged_recentchange GROUP BY tgrc_rc_id')
+    # aggregated tag names of each recent change, i.e. the result of
+    # 'SELECT tgrc_rc_id, array_agg(tag_name) FROM tag JOIN tagged_recentchange GROUP BY tgrc_rc_id'
+    # (refreshed by the grabbers at the end of each sync)
+    tagged_recentchange_tgname = Table("tagged_recentchange_tgname", metadata,
+        Column("tgrc_rc_id", Integer, ForeignKey("recentchanges.rc_id", ondelete="CASCADE", deferrable=True, initially="DEFERRED"), primary_key=True),
+        Column("tag_names", ARRAY(UnicodeText), nullable=False)
+    )
+
+    # TODO: create materialized view tagged_logevent_tgname
 
 
 def create_users_tables(metadata):
@@ -368,13 +379,19 @@ def create_revisions_tables(metadata):
     Index("rev_user_timestamp", revision.c.rev_user, revision.c.rev_timestamp)
     Index("rev_usertext_timestamp", revision.c.rev_user_text, revision.c.rev_timestamp)
     Index("rev_page_user_timestamp", revision.c.rev_page, revision.c.rev_user, revision.c.rev_timestamp)
+    # for sharing the content of revisions with the same hash
+    Index("rev_sha1", revision.c.rev_sha1)
 
     text = Table("text", metadata,
         Column("old_id", Integer, primary_key=True, nullable=False),
-        Column("old_text", UnicodeText, nullable=False),
-        # MW incompatibility: there is no old_flags column because it is useless for us
-        # (everything is utf-8, compression is done transparently by PostgreSQL, PHP
-        # objects are not supported and we will never support external storage)
+        # MW incompatibility: the content is stored either as plain text in old_text, or
+        # compressed in old_blob, see ws.db.compression (everything is utf-8, PHP objects
+        # are not supported and we will never support external storage)
+        Column("old_text", UnicodeText),
+        Column("old_blob", LargeBinary),
+        # the compression method of old_blob, empty for plain text
+        Column("old_flags", UnicodeText, nullable=False, server_default=""),
+        CheckConstraint("(old_text IS NULL) <> (old_blob IS NULL)", name="check_content"),
     )
 
     tagged_revision = Table("tagged_revision", metadata,
@@ -389,8 +406,15 @@ def create_revisions_tables(metadata):
         PrimaryKeyConstraint("tgar_tag_id", "tgar_rev_id")
     )
 
-    # TODO: create materialized views tagged_revision_tgname, tagged_archived_revision_tgname
-    # (basically 'SELECT tgrev_rev_id, array_agg(tag_name) FROM tag JOIN tagged_revision GROUP BY tgrev_rev_id')
+    # aggregated tag names of each revision, i.e. the result of
+    # 'SELECT tgrev_rev_id, array_agg(tag_name) FROM tag JOIN tagged_revision GROUP BY tgrev_rev_id'
+    # (refreshed by the grabbers at the end of each sync)
+    tagged_revision_tgname = Table("tagged_revision_tgname", metadata,
+        Column("tgrev_rev_id", Integer, ForeignKey("revision.rev_id", ondelete="CASCADE", deferrable=True, initially="DEFERRED"), primary_key=True),
+        Column("tag_names", ARRAY(UnicodeText), nullable=False)
+    )
+
+    # TODO: create materialized view tagged_archived_revision_tgname
 
 
 def create_pages_tables(metadata):
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+
+import sqlalchemy as sa
+
+from ..utils import LRUCache
+
+__all__ = ["SectionCache"]
+
+class SectionCache:
+    """
+    Cache for the sections of pages, which are stored in the ``section`` table
+    by :py:class:`ws.db.parser_cache.ParserCache`.
+
+    The entries are keyed by the page ID and the revision ID recorded in the
+    ``ws_parser_cache_sync`` table, so they become invalid as soon as the page
+    is parsed again. The revision IDs of the requested pages are looked up on
+    each call with a single query, the sections are fetched only for the pages
+    which are not cached.
+
+    :param db: a :py:class:`ws.db.database.Database` instance
+    :param int max_size: maximum number of pages in the cache
+    """
+
+    def __init__(self, db, *, max_size=10000):
+        self.db = db
+        self.memory = LRUCache(max_size)
+
+        page = db.page
+        wspc = db.ws_parser_cache_sync
+        sec = db.section
+        self.sql_pages = sa.select([page.c.page_namespace, page.c.page_title, page.c.page_id, wspc.c.wspc_rev_id]) \
+                .select_from(page.outerjoin(wspc, page.c.page_id == wspc.c.wspc_page_id)) \
+                .where(sa.tuple_(page.c.page_namespace, page.c.page_title).in_(sa.bindparam("titles", expanding=True)))
+        self.sql_sections = sa.select([sec.c.sec_page, sec.c.sec_number, sec.c.sec_level, sec.c.sec_title, sec.c.sec_anchor]) \
+                .where(sec.c.sec_page.in_(sa.bindparam("pageids", expanding=True))) \
+                .order_by(sec.c.sec_page.asc(), sec.c.sec_number.asc())
+
+    def _execute(self, query, params):
+        engine = self.db.engine.execution_options(compiled_cache=self.db.compiled_cache)
+        return engine.execute(query, params)
+
+    def get(self, titles):
+        """
+        Returns the sections of the given pages.
+
+        :param titles: an iterable of page titles (:py:class:`str`)
+        :returns: a dict mapping the given titles to tuples of sections, or to
+            ``None`` for missing pages. The sections are dicts with the
+            ``number``, ``level``, ``title`` and ``anchor`` keys, like in the
+            result of ``db.query(prop="sections")``. They are shared by the
+            cache and must not be modified.
+        """
+        parsed = {}
+        for title in titles:
+            t = self.db.Title(title)
+            parsed[title] = (t.namespacenumber, t.dbtitle())
+        if not parsed:
+            return {}
+
+        # (page_id, wspc_rev_id) pairs of the existing pages
+        pages = {}
+        result = self._execute(self.sql_pages, {"titles": sorted(set(parsed.values()))})
+        for row in result:
+            pages[row.page_namespace, row.page_title] = (row.page_id, row.wspc_rev_id)
+
+        sections = {}
+        for key in set(pages.values()):
+            cached = self.memory.get(key)
+            if cached is not None:
+                sections[key] = cached
+
+        missing = dict(key for key in pages.values() if key not in sections)
+        if missing:
+            fetched = {pageid: [] for pageid in missing}
+            result = self._execute(self.sql_sections, {"pageids": sorted(missing)})
+            for row in result:
+                fetched[row.sec_page].append({
+                    "number": row.sec_number,
+                    "level": row.sec_level,
+                    "title": row.sec_title,
+                    "anchor": row.sec_anchor,
+                })
+            for pageid, revid in missing.items():
+                key = (pageid, revid)
+                sections[key] = self.memory[key] = tuple(fetched[pageid])
+
+        return {title: sections[pages[key]] if key in pages else None
+                for title, key in parsed.items()}
+
+    def cache_info(self):
+        """
+        Returns the statistics of the in-memory cache, see
+        :py:meth:`ws.utils.LRUCache.cache_info`.
+        """
+        return self.memory.cache_info()
@@ -5,6 +5,13 @@ class SelectBase:
     API_PREFIX = None
     DB_PREFIX = None
 
+    # mapping of database columns to API keys, used by convert_flags
+    FLAGS = {}
+    # mapping of boolean database columns to API keys whose value is ""
+    BOOL_FLAGS = {}
+    # subset of FLAGS for which 0 should be used instead of None
+    ZEROABLE_FLAGS = set()
+
     def __init__(self, db):
         self.db = db
 
@@ -29,6 +36,62 @@ class SelectBase:
         """
         raise NotImplementedError
 
+    @classmethod
+    def _compile_converter(klass, keys):
+        """
+        Generates a function converting the columns listed in ``FLAGS`` and
+        ``BOOL_FLAGS`` from a row with the given column names, which is
+        accessed by position.
+        """
+        lines = ["def convert(row):", "    api_entry = {}"]
+        for i, key in enumerate(keys):
+            if key in klass.FLAGS:
+                api_key = klass.FLAGS[key]
+                lines.append("    value = row[{}]".format(i))
+                # some keys produce 0 instead of None
+                if key in klass.ZEROABLE_FLAGS:
+                    lines.append("    api_entry[{!r}] = 0 if value is None else value".format(api_key))
+                # normal keys are not added if the value is None
+                else:
+                    lines.append("    if value is not None:")
+                    lines.append("        api_entry[{!r}] = value".format(api_key))
+            elif key in klass.BOOL_FLAGS:
+                lines.append("    if row[{}]:".format(i))
+                lines.append("        api_entry[{!r}] = \"\"".format(klass.BOOL_FLAGS[key]))
+        lines.append("    return api_entry")
+        namespace = {}
+        exec("\n".join(lines), namespace)
+        return namespace["convert"]
+
+    @classmethod
+    def convert_flags(klass, row):
+        """
+        Converts the columns listed in ``FLAGS`` and ``BOOL_FLAGS`` into a new
+        API entry. This is the common part of :py:meth:`db_to_api`.
+
+        The converter is compiled once for each list of columns and cached on
+        the class, the rows of one result share the list of columns so the
+        lookup is just an identity check.
+
+        :param row: a result row or a :py:class:`dict`
+        """
+        keys = row.keys()
+        # each class has its own cache, subclasses may override the flags
+        last = klass.__dict__.get("_last_converter")
+        if last is not None and last[0] is keys:
+            convert = last[1]
+        else:
+            if "_converters" not in klass.__dict__:
+                klass._converters = {}
+            keys_tuple = tuple(keys)
+            convert = klass._converters.get(keys_tuple)
+            if convert is None:
+                convert = klass._converters[keys_tuple] = klass._compile_converter(keys_tuple)
+            klass._last_converter = (keys, convert)
+        if isinstance(row, dict):
+            row = tuple(row.values())
+        return convert(row)
+
     @classmethod
     def filter_params(klass, params, *, generator=False):
         new_params = {}
@@ -41,12 +104,29 @@ class SelectBase:
                 new_params[new_key] = value
         return new_params
 
-    def execute_sql(self, query, *, explain=False):
+    def execute_sql(self, query, params=None, *, explain=False, cached=False):
+        """
+        Executes a query and returns the result.
+
+        :param dict params: values of the bound parameters
+        :param bool explain: whether to print the query plan
+        :param bool cached:
+            whether the compiled form of the query should be cached in
+            :py:attr:`Database.compiled_cache`. Only statements which are
+            executed repeatedly (e.g. those kept in
+            :py:attr:`Database.query_cache`) should be cached, the values
+            have to be passed as bound parameters.
+        """
+        args = (params,) if params else ()
+
         if explain is True:
             from ws.db.database import explain
-            result = self.db.engine.execute(explain(query))
+            result = self.db.engine.execute(explain(query), *args)
             print(query)
             for row in result:
                 print(row[0])
 
-        return self.db.engine.execute(query)
+        if cached is True:
+            engine = self.db.engine.execution_options(compiled_cache=self.db.compiled_cache)
+            return engine.execute(query, *args)
+        return self.db.engine.execute(query, *args)
@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+import sqlalchemy as sa
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
 
 from .namespaces import *
 from .interwiki import *
@@ -72,7 +77,122 @@ __classes_props = {
     "sections": Sections,  # custom module
 }
 
-def list(db, params):
+# formats of the results of the query function
+RESULT_FORMATS = {"api", "tuples", "columns"}
+
+@lru_cache(maxsize=128)
+def _get_row_type(keys):
+    """
+    Returns a named tuple type for rows with the given column names.
+    """
+    return namedtuple("Row", keys, rename=True)
+
+def _to_columns(keys, rows):
+    """
+    Transposes a list of rows into a dict mapping column names to tuples of
+    values.
+    """
+    if rows:
+        return dict(zip(keys, zip(*rows)))
+    return {key: () for key in keys}
+
+class _KeysetQuery:
+    """
+    Executes a select statement in chunks with keyset pagination: each chunk
+    is selected by a separate statement which continues after the sort key of
+    the last row of the previous chunk, so no cursor or transaction is held
+    open while the caller processes the rows.
+
+    The sort key is given by the ``ORDER BY`` clause of the statement,
+    optionally followed by a ``tiebreaker`` column which makes it unique. Rows
+    with the same sort key as the last row of a chunk are skipped, so the sort
+    key should be unique up to duplicate rows. The sort key columns must not
+    be ``NULL``.
+
+    :param query: the select statement
+    :param tiebreaker:
+        a column appended to the sort key, in the direction of the last
+        ``ORDER BY`` column
+    """
+
+    def __init__(self, query, tiebreaker=None):
+        order = []
+        for clause in query._order_by_clause.clauses:
+            if isinstance(clause, UnaryExpression) and clause.modifier in {operators.asc_op, operators.desc_op}:
+                order.append((clause.element, clause.modifier is operators.desc_op))
+            else:
+                order.append((clause, False))
+        if tiebreaker is not None and all(column is not tiebreaker for column, _ in order):
+            # follow the direction of the other columns to keep the comparison uniform
+            desc = bool(order) and order[-1][1]
+            order.append((tiebreaker, desc))
+            query = query.order_by(tiebreaker.desc() if desc else tiebreaker.asc())
+        if not order:
+            raise ValueError("keyset pagination requires an ordered query")
+        self.num_keys = len(order)
+
+        # the sort key of the last row is selected with extra columns
+        query = query.limit(sa.bindparam("b_keyset_limit"))
+        for i, (column, _) in enumerate(order):
+            query = query.column(column.label("keyset_{}".format(i)))
+        self.first = query
+
+        # lexicographic comparison with the sort key of the last row
+        columns = [column for column, _ in order]
+        values = [sa.bindparam("b_keyset_{}".format(i)) for i in range(len(order))]
+        directions = {desc for _, desc in order}
+        if len(directions) == 1:
+            # row-value comparison, which PostgreSQL uses as an index bound
+            if directions.pop():
+                condition = sa.tuple_(*columns) < sa.tuple_(*values)
+            else:
+                condition = sa.tuple_(*columns) > sa.tuple_(*values)
+        else:
+            condition = None
+            for column, value, (_, desc) in reversed(tuple(zip(columns, values, order))):
+                after = column < value if desc else column > value
+                if condition is None:
+                    condition = after
+                else:
+                    condition = sa.or_(after, sa.and_(column == value, condition))
+            # the bound of the leading column can be used by an index scan
+            if order[0][1]:
+                condition = sa.and_(columns[0] <= values[0], condition)
+            else:
+                condition = sa.and_(columns[0] >= values[0], condition)
+        self.next = query.where(condition)
+
+    def execute(self, s, params, chunk_size, *, cached=False):
+        """
+        Executes the statement with the given select module.
+
+        :param s: the select module (see :py:meth:`SelectBase.execute_sql`)
+        :param dict params: values of the bound parameters
+        :param int chunk_size: number of rows per chunk
+        :param bool cached: whether the compiled statements should be cached
+        :yields: ``(keys, rows)`` tuples, where ``keys`` are the column names
+            without the sort key columns, which are appended to the rows
+        """
+        params = dict(params, b_keyset_limit=chunk_size)
+        query = self.first
+        while True:
+            result = s.execute_sql(query, params, cached=cached)
+            try:
+                keys = result.keys()
+                rows = result.fetchall()
+            finally:
+                result.close()
+            if not rows:
+                return
+            yield keys[:-self.num_keys], rows
+            if len(rows) < chunk_size:
+                return
+            last = rows[-1]
+            for i in range(self.num_keys):
+                params["b_keyset_{}".format(i)] = last[len(keys) - self.num_keys + i]
+            query = self.next
+
+def list(db, params, *, result_format="api"):
     assert "list" in params
     list = params.pop("list")
     if list not in __classes_lists:
@@ -85,18 +205,29 @@ def list(db, params):
     query = s.get_select(list_params)
 
     # TODO: some lists like allrevisions should group the results per page like MediaWiki
-    result = s.execute_sql(query)
-    for row in result:
-        yield s.db_to_api(row)
-    result.close()
+    for keys, rows in _KeysetQuery(query).execute(s, {}, db.chunk_size):
+        if result_format == "api":
+            for row in rows:
+                yield s.db_to_api(row)
+        elif result_format == "tuples":
+            Row = _get_row_type(tuple(keys))
+            for row in rows:
+                yield Row._make(tuple(row)[:len(keys)])
+        else:
+            yield _to_columns(keys, [tuple(row)[:len(keys)] for row in rows])
 
-def get_pageset(db, titles=None, pageids=None):
+def get_pageset(db, *, titles=False, pageids=False):
     """
-    :param list titles: list of :py:class:`ws.parser_helpers.title.Title` objects
-    :param list pageids: list of :py:obj:`int` objects
+    Returns the ``(tail, pageset, ex)`` statements for a set of pages given by
+    titles or IDs. The values are passed as bound parameters when the
+    statements are executed: ``titles`` is a list of ``(namespace, dbtitle)``
+    pairs and ``pageids`` is a list of :py:obj:`int` objects.
+
+    :param bool titles: whether the pages are selected by titles
+    :param bool pageids: whether the pages are selected by IDs
     """
-    assert titles is not None or pageids is not None
-    assert titles is None or pageids is None
+    assert titles is True or pageids is True
+    assert titles is False or pageids is False
 
     # join to get the namespace prefix
     page = db.page
@@ -105,42 +236,66 @@ def get_pageset(db, titles=None, pageids=None):
 
     s = sa.select([page.c.page_id, page.c.page_namespace, page.c.page_title, nss.c.nss_name])
 
-    if titles is not None:
-        ns_title_pairs = [(t.namespacenumber, t.dbtitle()) for t in titles]
+    if titles is True:
+        ns_title_pairs = sa.bindparam("titles", expanding=True)
         s = s.where(sa.tuple_(page.c.page_namespace, page.c.page_title).in_(ns_title_pairs))
         s = s.order_by(page.c.page_namespace.asc(), page.c.page_title.asc())
 
         ex = sa.select([page.c.page_namespace, page.c.page_title])
         ex = ex.where(sa.tuple_(page.c.page_namespace, page.c.page_title).in_(ns_title_pairs))
-    elif pageids is not None:
-        s = s.where(page.c.page_id.in_(pageids))
+    else:
+        s = s.where(page.c.page_id.in_(sa.bindparam("pageids", expanding=True)))
         s = s.order_by(page.c.page_id.asc())
 
         ex = sa.select([page.c.page_id])
-        ex = ex.where(page.c.page_id.in_(pageids))
+        ex = ex.where(page.c.page_id.in_(sa.bindparam("pageids", expanding=True)))
 
     return tail, s, ex
 
-def query_pageset(db, params):
+def _get_cache_key(params):
+    """
+    Returns a hashable key describing the shape of the query parameters, or
+    ``None`` if the parameters cannot be hashed. The values of ``titles`` and
+    ``pageids`` are bound parameters, so they are not part of the key.
+    """
+    key = []
+    for name, value in sorted(params.items()):
+        if name in {"titles", "pageids"}:
+            value = None
+        elif isinstance(value, set):
+            value = frozenset(value)
+        key.append((name, value))
+    key = tuple(key)
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def _build_pageset_query(db, params):
+    """
+    Builds the statements for :py:func:`query_pageset`. They depend only on
+    the shape of the parameters, see :py:func:`_get_cache_key`.
+
+    :returns: a ``(s, query, ex, props)`` tuple, where ``s`` is the select
+        module executing the pageset ``query`` (a :py:class:`_KeysetQuery`),
+        ``ex`` selects the existing
+        pages (``None`` for generators) and ``props`` is a list of
+        ``(name, module, query)`` tuples for the props. The prop queries take
+        the IDs of a chunk of pages as the ``chunk_pageids`` parameter.
+    """
     params_copy = params.copy()
 
     # TODO: for the lack of better structure, we abuse the AllPages class for execution of titles= and pageids= queries
     s = AllPages(db)
+    ex = None
 
-    assert "titles" in params or "pageids" in params or "generator" in params
     if "titles" in params:
-        titles = params_copy.pop("titles")
-        if isinstance(titles, str):
-            titles = {titles}
-        assert isinstance(titles, set)
-        titles = [db.Title(t) for t in titles]
-        tail, pageset, ex = get_pageset(db, titles=titles)
+        params_copy.pop("titles")
+        tail, pageset, ex = get_pageset(db, titles=True)
     elif "pageids" in params:
-        pageids = params_copy.pop("pageids")
-        if isinstance(pageids, int):
-            pageids = {pageids}
-        assert isinstance(pageids, set)
-        tail, pageset, ex = get_pageset(db, pageids=pageids)
+        params_copy.pop("pageids")
+        tail, pageset, ex = get_pageset(db, pageids=True)
     elif "generator" in params:
         generator = params_copy.pop("generator")
         if generator not in __classes_generators:
@@ -152,10 +307,69 @@ def query_pageset(db, params):
         s.sanitize_params(generator_params)
         pageset, tail = s.get_pageset(generator_params)
 
+    props = []
+    if "prop" in params:
+        prop = params_copy.pop("prop")
+        if isinstance(prop, str):
+            prop = {prop}
+        assert isinstance(prop, set)
+
+        for p in prop:
+            if p not in __classes_props:
+                raise NotImplementedError("Module prop={} is not implemented yet.".format(p))
+            _s = __classes_props[p](db)
+
+            if p == "latestrevisions":
+                prop_tail = _s.join_with_pageset(tail, enum_rev_mode=False)
+            else:
+                prop_tail = _s.join_with_pageset(tail)
+            prop_params = _s.filter_params(params_copy)
+            _s.set_defaults(prop_params)
+            prop_select, prop_tail = _s.get_select_prop(pageset, prop_tail, prop_params)
+            prop_query = prop_select.select_from(prop_tail)
+            prop_query = prop_query.where(db.page.c.page_id.in_(sa.bindparam("chunk_pageids", expanding=True)))
+            props.append((p, _s, prop_query))
+
+    # the page ID makes the sort key unique, except for duplicate rows
+    # produced by joins in the pageset
+    query = _KeysetQuery(pageset.select_from(tail), tiebreaker=db.page.c.page_id)
+    return s, query, ex, props
+
+def query_pageset(db, params, *, result_format="api"):
+    assert "titles" in params or "pageids" in params or "generator" in params
+
+    # The statements are built once for each shape of the parameters and
+    # executed with bound parameters, so that their compiled form can be
+    # reused as well (see Database.compiled_cache).
+    key = _get_cache_key(params)
+    statements = db.query_cache.get(key) if key is not None else None
+    if statements is None:
+        statements = _build_pageset_query(db, params)
+        if key is not None:
+            db.query_cache[key] = statements
+    s, query, ex, props = statements
+    # statements which are not kept would only evict the others
+    cached = key is not None
+
+    bind_params = {}
+    if "titles" in params:
+        titles = params["titles"]
+        if isinstance(titles, str):
+            titles = {titles}
+        assert isinstance(titles, set)
+        titles = db.Titles(titles)
+        bind_params["titles"] = [(t.namespacenumber, t.dbtitle()) for t in titles]
+    elif "pageids" in params:
+        pageids = params["pageids"]
+        if isinstance(pageids, int):
+            pageids = {pageids}
+        assert isinstance(pageids, set)
+        bind_params["pageids"] = sorted(pageids)
+
     # report missing pages (does not make sense for generators)
-    if "generator" not in params:
+    if ex is not None and result_format == "api":
         existing_pages = set()
-        result = s.execute_sql(ex)
+        result = s.execute_sql(ex, bind_params, cached=cached)
         for row in result:
             if "titles" in params:
                 existing_pages.add((row.page_namespace, row.page_title))
@@ -170,45 +384,86 @@ def query_pageset(db, params):
                 if p not in existing_pages:
                     yield {"missing": "", "pageid": p}
 
-    # fetch the pageset into an intermediate list
-    # TODO: query-continuation is probably needed for better efficiency
-    query = pageset.select_from(tail)
-    pages = OrderedDict()  # for indexed access, like in MediaWiki
-    result = s.execute_sql(query)
-    for row in result:
-        entry = s.db_to_api(row)
-        pages[entry["pageid"]] = entry
-    result.close()
+    # The pageset is paginated with a keyset and the props are attached to
+    # chunks of pages, which are selected by their IDs, so that only one chunk
+    # is held in memory.
+    # Joins in the pageset may produce duplicate rows, which share the page ID
+    # tiebreaker of the sort key, so they are skipped within each chunk and
+    # against the last page of the previous chunk.
+    last_pageid = None
+    for keys, rows in query.execute(s, bind_params, db.chunk_size, cached=cached):
+        pageid_index = keys.index("page_id")
+        seen_pageids = {last_pageid}
+        last_pageid = rows[-1][pageid_index]
+        if result_format == "api":
+            pages = OrderedDict()  # for indexed access, like in MediaWiki
+            for row in rows:
+                if row[pageid_index] not in seen_pageids:
+                    seen_pageids.add(row[pageid_index])
+                    entry = s.db_to_api(row)
+                    pages[entry["pageid"]] = entry
+            pageids = tuple(pages)
+        else:
+            page_rows = []
+            for row in rows:
+                if row[pageid_index] not in seen_pageids:
+                    seen_pageids.add(row[pageid_index])
+                    page_rows.append(tuple(row)[:len(keys)])
+            pageids = tuple(row[pageid_index] for row in page_rows)
+        if not pageids:
+            continue
 
-    if "prop" in params:
-        prop = params_copy.pop("prop")
-        if isinstance(prop, str):
-            prop = {prop}
-        assert isinstance(prop, set)
+        # rows of the props for the raw formats
+        prop_rows = OrderedDict()
+        for p, _s, prop_query in props:
+            prop_result = _s.execute_sql(prop_query, dict(bind_params, chunk_pageids=pageids), cached=cached)
+            if result_format == "api":
+                for row in prop_result:
+                    page = pages[row["page_id"]]
+                    _s.db_to_api_subentry(page, row)
+            else:
+                prop_rows[p] = (prop_result.keys(), prop_result.fetchall())
+            prop_result.close()
 
-        for p in prop:
-            if p not in __classes_props:
-                raise NotImplementedError("Module prop={} is not implemented yet.".format(p))
-            _s = __classes_props[p](db)
+        if result_format == "api":
+            yield from pages.values()
+        elif result_format == "tuples":
+            Row = _get_row_type(tuple(keys))
+            page_props = {pageid: {p: [] for p in prop_rows} for pageid in pageids}
+            for p, (prop_keys, rows) in prop_rows.items():
+                PropRow = _get_row_type(tuple(prop_keys))
+                prop_pageid_index = prop_keys.index("page_id")
+                for row in rows:
+                    page_props[row[prop_pageid_index]][p].append(PropRow._make(row))
+            for row in page_rows:
+                yield Row._make(row), page_props[row[pageid_index]]
+        else:
+            yield _to_columns(keys, page_rows), \
+                  {p: _to_columns(prop_keys, rows) for p, (prop_keys, rows) in prop_rows.items()}
 
-            if p == "latestrevisions":
-                prop_tail = _s.join_with_pageset(tail, enum_rev_mode=False)
-            else:
-                prop_tail = _s.join_with_pageset(tail)
-            prop_params = _s.filter_params(params_copy)
-            _s.set_defaults(prop_params)
-            prop_select, prop_tail = _s.get_select_prop(pageset, prop_tail, prop_params)
+def query(db, params=None, *, result_format="api", **kwargs):
+    """
+    Executes a MediaWiki-like query.
 
-            query = prop_select.select_from(prop_tail)
-            result = _s.execute_sql(query)
-            for row in result:
-                page = pages[row["page_id"]]
-                _s.db_to_api_subentry(page, row)
-            result.close()
+    The ``result_format`` parameter selects the format of the results:
 
-    yield from pages.values()
+    - ``"api"``: a dict similar to the MediaWiki API for each item
+    - ``"tuples"``: a named tuple of the database columns for each item. For
+      queries with ``titles``, ``pageids`` or ``generator``, the items are
+      ``(page, props)`` pairs where ``props`` maps the names of the ``prop``
+      modules to lists of named tuples.
+    - ``"columns"``: a dict mapping the names of the database columns to
+      tuples of values for each chunk of :py:attr:`Database.chunk_size` items.
+      For queries with ``titles``, ``pageids`` or ``generator``, the items are
+      ``(pages, props)`` pairs where ``props`` maps the names of the ``prop``
+      modules to such dicts.
 
-def query(db, params=None, **kwargs):
+    The raw formats skip the conversion to the API format, which dominates the
+    time of large queries. Missing pages are reported only in the ``"api"``
+    format.
+    """
+    if result_format not in RESULT_FORMATS:
+        raise ValueError("Unknown result format: {}".format(result_format))
     if params is None:
         params = kwargs
     elif not isinstance(params, dict):
@@ -217,7 +472,7 @@ def query(db, params=None, **kwargs):
         raise ValueError("specifying 'params' and 'kwargs' at the same time is not supported")
 
     if "list" in params:
-        return list(db, params)
+        return list(db, params, result_format=result_format)
     elif "titles" in params or "pageids" in params or "generator" in params:
-        return query_pageset(db, params)
+        return query_pageset(db, params, result_format=result_format)
     raise NotImplementedError("Unknown query: no recognizable parameter ({}).".format(params))
@@ -15,6 +15,11 @@ class AllPages(GeneratorBase):
     API_PREFIX = "ap"
     DB_PREFIX = "page_"
 
+    FLAGS = {
+        "page_id": "pageid",
+        "page_namespace": "ns",
+    }
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "ascending")
@@ -129,29 +134,7 @@ class AllPages(GeneratorBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "page_id": "pageid",
-            "page_namespace": "ns",
-        }
-        bool_flags = {
-        }
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
 
         # add special values
         if "nss_name" in row:
@@ -13,6 +13,22 @@ class AllUsers(ListBase):
     API_PREFIX = "au"
     DB_PREFIX = "user_"
 
+    FLAGS = {
+        "user_id": "userid",
+        "user_name": "name",
+        "user_editcount": "editcount",
+        "user_registration": "registration",
+        "user_groups": "groups",
+        "ipb_id": "blockid",
+        "ipb_by": "blockedbyid",
+        "ipb_by_text": "blockedby",
+        "ipb_timestamp": "blockedtimestamp",
+        "ipb_expiry": "blockexpiry",
+        "ipb_reason": "blockreason",
+    }
+    BOOL_FLAGS = {"ipb_deleted": "hidden"}
+    ZEROABLE_FLAGS = {"user_editcount"}
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "ascending")
@@ -110,37 +126,7 @@ class AllUsers(ListBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "user_id": "userid",
-            "user_name": "name",
-            "user_editcount": "editcount",
-            "user_registration": "registration",
-            "user_groups": "groups",
-            "ipb_id": "blockid",
-            "ipb_by": "blockedbyid",
-            "ipb_by_text": "blockedby",
-            "ipb_timestamp": "blockedtimestamp",
-            "ipb_expiry": "blockexpiry",
-            "ipb_reason": "blockreason",
-        }
-        bool_flags = {"ipb_deleted": "hidden"}
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {"user_editcount"}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
 
         if "user_groups" in row:
             groups = api_entry["groups"]
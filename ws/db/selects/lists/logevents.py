@@ -13,6 +13,21 @@ class LogEvents(ListBase):
     API_PREFIX = "le"
     DB_PREFIX = "log_"
 
+    FLAGS = {
+        "log_id": "logid",
+        "log_type": "type",
+        "log_action": "action",
+        "log_timestamp": "timestamp",
+        "log_user": "userid",
+        "log_user_text": "user",
+        "log_namespace": "ns",
+        "log_page": "logpage",
+        "log_comment": "comment",
+        "log_params": "params",
+        "page_id": "pageid",
+    }
+    ZEROABLE_FLAGS = {"log_user", "log_page", "page_id"}
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "older")
@@ -141,37 +156,7 @@ class LogEvents(ListBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "log_id": "logid",
-            "log_type": "type",
-            "log_action": "action",
-            "log_timestamp": "timestamp",
-            "log_user": "userid",
-            "log_user_text": "user",
-            "log_namespace": "ns",
-            "log_page": "logpage",
-            "log_comment": "comment",
-            "log_params": "params",
-            "page_id": "pageid",
-        }
-        bool_flags = {}
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {"log_user", "log_page", "page_id"}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
 
         # add special values
         if "nss_name" in row:
@@ -185,13 +170,14 @@ class LogEvents(ListBase):
         if api_entry.get("userid") == 0:
             api_entry["anon"] = ""
         # parse log_deleted
-        if row["log_deleted"] & mwconst.DELETED_ACTION:
+        deleted = row["log_deleted"]
+        if deleted & mwconst.DELETED_ACTION:
             api_entry["actionhidden"] = ""
-        if row["log_deleted"] & mwconst.DELETED_COMMENT:
+        if deleted & mwconst.DELETED_COMMENT:
             api_entry["commenthidden"] = ""
-        if row["log_deleted"] & mwconst.DELETED_USER:
+        if deleted & mwconst.DELETED_USER:
             api_entry["userhidden"] = ""
-        if row["log_deleted"] & mwconst.DELETED_RESTRICTED:
+        if deleted & mwconst.DELETED_RESTRICTED:
             api_entry["suppressed"] = ""
         # set tags to [] instead of None
         if "tag_names" in row:
@@ -13,6 +13,16 @@ class ProtectedTitles(GeneratorBase):
     API_PREFIX = "pt"
     DB_PREFIX = "pt_"
 
+    FLAGS = {
+        "pt_namespace": "ns",
+        "log_timestamp": "timestamp",
+        "log_user_text": "user",
+        "log_user": "userid",
+        "log_comment": "comment",
+        "pt_expiry": "expiry",
+        "pt_level": "level",
+    }
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "older")
@@ -118,34 +128,7 @@ class ProtectedTitles(GeneratorBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "pt_namespace": "ns",
-            "log_timestamp": "timestamp",
-            "log_user_text": "user",
-            "log_user": "userid",
-            "log_comment": "comment",
-            "pt_expiry": "expiry",
-            "pt_level": "level",
-        }
-        bool_flags = {
-        }
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
 
         # add special values
         if "nss_name" in row:
@@ -13,6 +13,34 @@ class RecentChanges(GeneratorBase):
     API_PREFIX = "rc"
     DB_PREFIX = "rc_"
 
+    FLAGS = {
+        "rc_id": "rcid",
+        "rc_timestamp": "timestamp",
+        "rc_user": "userid",
+        "rc_user_text": "user",
+        "rc_namespace": "ns",
+        "rc_comment": "comment",
+        "rc_cur_id": "pageid",
+        "rc_this_oldid": "revid",
+        "rc_last_oldid": "old_revid",
+        "rc_type": "type",
+        "rc_old_len": "oldlen",
+        "rc_new_len": "newlen",
+        "rc_logid": "logid",
+        "rc_log_type": "logtype",
+        "rc_log_action": "logaction",
+        "rc_params": "logparams",
+        "rev_sha1": "sha1",
+    }
+    BOOL_FLAGS = {
+        "rc_minor": "minor",
+        "rc_bot": "bot",
+        "rc_new": "new",
+        "rc_patrolled": "patrolled",
+        "page_is_redirect": "redirect",
+    }
+    ZEROABLE_FLAGS = {"rc_user", "rc_cur_id", "rc_this_oldid", "rc_last_oldid"}
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "older")
@@ -119,16 +147,8 @@ class RecentChanges(GeneratorBase):
                                         (rc.c.rc_title == page.c.page_title))
             s.append_column(page.c.page_is_redirect)
         if "tags" in prop:
-            tag = self.db.tag
-            tgrc = self.db.tagged_recentchange
-            # aggregate all tag names corresponding to the same revision into an array
-            # (basically 'SELECT tgrc_rc_id, array_agg(tag_name) FROM tag JOIN tagged_recentchange GROUP BY tgrc_rc_id')
-            # TODO: make a materialized view for this
-            tag_names = sa.select([tgrc.c.tgrc_rc_id,
-                                   sa.func.array_agg(tag.c.tag_name).label("tag_names")]) \
-                            .select_from(tag.join(tgrc, tag.c.tag_id == tgrc.c.tgrc_tag_id)) \
-                            .group_by(tgrc.c.tgrc_rc_id) \
-                            .cte("tag_names")
+            # tag names aggregated into an array, maintained by the grabbers
+            tag_names = self.db.tagged_recentchange_tgname
             tail = tail.outerjoin(tag_names, rc.c.rc_id == tag_names.c.tgrc_rc_id)
             s.append_column(tag_names.c.tag_names)
         if "tag" in params:
@@ -195,49 +215,7 @@ class RecentChanges(GeneratorBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "rc_id": "rcid",
-            "rc_timestamp": "timestamp",
-            "rc_user": "userid",
-            "rc_user_text": "user",
-            "rc_namespace": "ns",
-            "rc_comment": "comment",
-            "rc_cur_id": "pageid",
-            "rc_this_oldid": "revid",
-            "rc_last_oldid": "old_revid",
-            "rc_type": "type",
-            "rc_old_len": "oldlen",
-            "rc_new_len": "newlen",
-            "rc_logid": "logid",
-            "rc_log_type": "logtype",
-            "rc_log_action": "logaction",
-            "rc_params": "logparams",
-            "rev_sha1": "sha1",
-        }
-        bool_flags = {
-            "rc_minor": "minor",
-            "rc_bot": "bot",
-            "rc_new": "new",
-            "rc_patrolled": "patrolled",
-            "page_is_redirect": "redirect",
-        }
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {"rc_user", "rc_cur_id", "rc_this_oldid", "rc_last_oldid"}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
 
         # add special values
         if "nss_name" in row:
@@ -248,15 +226,16 @@ class RecentChanges(GeneratorBase):
         if api_entry.get("userid") == 0:
             api_entry["anon"] = ""
         # parse rc_deleted
-        if row["rc_deleted"] & mwconst.DELETED_TEXT and row["rc_type"] != "log":
+        deleted = row["rc_deleted"]
+        if deleted & mwconst.DELETED_TEXT and row["rc_type"] != "log":
             api_entry["sha1hidden"] = ""
-        if row["rc_deleted"] & mwconst.DELETED_ACTION and row["rc_type"] == "log":
+        if deleted & mwconst.DELETED_ACTION and row["rc_type"] == "log":
             api_entry["actionhidden"] = ""
-        if row["rc_deleted"] & mwconst.DELETED_COMMENT:
+        if deleted & mwconst.DELETED_COMMENT:
             api_entry["commenthidden"] = ""
-        if row["rc_deleted"] & mwconst.DELETED_USER:
+        if deleted & mwconst.DELETED_USER:
             api_entry["userhidden"] = ""
-        if row["rc_deleted"] & mwconst.DELETED_RESTRICTED:
+        if deleted & mwconst.DELETED_RESTRICTED:
             api_entry["suppressed"] = ""
         # set tags to [] instead of None
         if "tag_names" in row:
@@ -3,6 +3,7 @@
 import sqlalchemy as sa
 
 import ws.db.mw_constants as mwconst
+from ws.db.compression import decompress_text
 
 from ..SelectBase import SelectBase
 
@@ -13,6 +14,26 @@ class DeletedRevisions(SelectBase):
     API_PREFIX = "drv"
     DB_PREFIX = "ar_"
 
+    FLAGS = {
+        "ar_rev_id": "revid",
+        "ar_parent_id": "parentid",
+        "ar_timestamp": "timestamp",
+        "ar_user": "userid",
+        "ar_user_text": "user",
+        "ar_comment": "comment",
+        "ar_sha1": "sha1",
+        "ar_len": "size",
+        "ar_content_model": "contentmodel",
+        "ar_content_format": "contentformat",
+        "old_text": "*",
+        "ar_page_id": "pageid",
+        "ar_namespace": "ns",
+    }
+    BOOL_FLAGS = {
+        "ar_minor_edit": "minor",
+    }
+    ZEROABLE_FLAGS = {"ar_user", "ar_parent_id", "ar_page_id"}
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "older")
@@ -83,6 +104,8 @@ class DeletedRevisions(SelectBase):
         if "content" in prop:
             tail = tail.outerjoin(self.db.text, ar.c.ar_text_id == self.db.text.c.old_id)
             s = s.column(self.db.text.c.old_text)
+            s = s.column(self.db.text.c.old_blob)
+            s = s.column(self.db.text.c.old_flags)
         if "tags" in prop:
             tag = self.db.tag
             tgar = self.db.tagged_archived_revision
@@ -132,41 +155,10 @@ class DeletedRevisions(SelectBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "ar_rev_id": "revid",
-            "ar_parent_id": "parentid",
-            "ar_timestamp": "timestamp",
-            "ar_user": "userid",
-            "ar_user_text": "user",
-            "ar_comment": "comment",
-            "ar_sha1": "sha1",
-            "ar_len": "size",
-            "ar_content_model": "contentmodel",
-            "ar_content_format": "contentformat",
-            "old_text": "*",
-            "ar_page_id": "pageid",
-            "ar_namespace": "ns",
-        }
-        bool_flags = {
-            "ar_minor_edit": "minor",
-        }
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {"ar_user", "ar_parent_id", "ar_page_id"}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
+        # decompress the content transparently
+        if "old_blob" in row and row["old_blob"] is not None:
+            api_entry["*"] = decompress_text(row["old_blob"], row["old_flags"])
 
         # add special values
         if row["nss_name"]:
@@ -176,13 +168,14 @@ class DeletedRevisions(SelectBase):
         if api_entry.get("userid") == 0:
             api_entry["anon"] = ""
         # parse ar_deleted
-        if row["ar_deleted"] & mwconst.DELETED_TEXT:
+        deleted = row["ar_deleted"]
+        if deleted & mwconst.DELETED_TEXT:
             api_entry["sha1hidden"] = ""
-        if row["ar_deleted"] & mwconst.DELETED_COMMENT:
+        if deleted & mwconst.DELETED_COMMENT:
             api_entry["commenthidden"] = ""
-        if row["ar_deleted"] & mwconst.DELETED_USER:
+        if deleted & mwconst.DELETED_USER:
             api_entry["userhidden"] = ""
-        if row["ar_deleted"] & mwconst.DELETED_RESTRICTED:
+        if deleted & mwconst.DELETED_RESTRICTED:
             api_entry["suppressed"] = ""
         # set tags to [] instead of None
         if "tag_names" in row:
@@ -3,6 +3,7 @@
 import sqlalchemy as sa
 
 import ws.db.mw_constants as mwconst
+from ws.db.compression import decompress_text
 
 from ..SelectBase import SelectBase
 
@@ -13,6 +14,26 @@ class Revisions(SelectBase):
     API_PREFIX = "rv"
     DB_PREFIX = "rev_"
 
+    FLAGS = {
+        "rev_id": "revid",
+        "rev_parent_id": "parentid",
+        "rev_timestamp": "timestamp",
+        "rev_user": "userid",
+        "rev_user_text": "user",
+        "rev_comment": "comment",
+        "rev_sha1": "sha1",
+        "rev_len": "size",
+        "rev_content_model": "contentmodel",
+        "rev_content_format": "contentformat",
+        "old_text": "*",
+        "page_id": "pageid",
+        "page_namespace": "ns",
+    }
+    BOOL_FLAGS = {
+        "rev_minor_edit": "minor",
+    }
+    ZEROABLE_FLAGS = {"rev_user", "rev_parent_id"}
+
     @classmethod
     def set_defaults(klass, params):
         params.setdefault("dir", "older")
@@ -87,17 +108,11 @@ class Revisions(SelectBase):
         if "content" in prop:
             tail = tail.outerjoin(self.db.text, rev.c.rev_text_id == self.db.text.c.old_id)
             s = s.column(self.db.text.c.old_text)
+            s = s.column(self.db.text.c.old_blob)
+            s = s.column(self.db.text.c.old_flags)
         if "tags" in prop:
-            tag = self.db.tag
-            tgrev = self.db.tagged_revision
-            # aggregate all tag names corresponding to the same revision into an array
-            # (basically 'SELECT tgrev_rev_id, array_agg(tag_name) FROM tag JOIN tagged_recentchange GROUP BY tgrev_rev_id')
-            # TODO: make a materialized view for this
-            tag_names = sa.select([tgrev.c.tgrev_rev_id,
-                                   sa.func.array_agg(tag.c.tag_name).label("tag_names")]) \
-                            .select_from(tag.join(tgrev, tag.c.tag_id == tgrev.c.tgrev_tag_id)) \
-                            .group_by(tgrev.c.tgrev_rev_id) \
-                            .cte("tag_names")
+            # tag names aggregated into an array, maintained by the grabbers
+            tag_names = self.db.tagged_revision_tgname
             tail = tail.outerjoin(tag_names, rev.c.rev_id == tag_names.c.tgrev_rev_id)
             s = s.column(tag_names.c.tag_names)
 
@@ -127,41 +142,10 @@ class Revisions(SelectBase):
 
     @classmethod
     def db_to_api(klass, row):
-        flags = {
-            "rev_id": "revid",
-            "rev_parent_id": "parentid",
-            "rev_timestamp": "timestamp",
-            "rev_user": "userid",
-            "rev_user_text": "user",
-            "rev_comment": "comment",
-            "rev_sha1": "sha1",
-            "rev_len": "size",
-            "rev_content_model": "contentmodel",
-            "rev_content_format": "contentformat",
-            "old_text": "*",
-            "page_id": "pageid",
-            "page_namespace": "ns",
-        }
-        bool_flags = {
-            "rev_minor_edit": "minor",
-        }
-        # subset of flags for which 0 should be used instead of None
-        zeroable_flags = {"rev_user", "rev_parent_id"}
-
-        api_entry = {}
-        for key, value in row.items():
-            if key in flags:
-                api_key = flags[key]
-                # normal keys are not added if the value is None
-                if value is not None:
-                    api_entry[api_key] = value
-                # some keys produce 0 instead of None
-                elif key in zeroable_flags:
-                    api_entry[api_key] = 0
-            elif key in bool_flags:
-                if value:
-                    api_key = bool_flags[key]
-                    api_entry[api_key] = ""
+        api_entry = klass.convert_flags(row)
+        # decompress the content transparently
+        if "old_blob" in row and row["old_blob"] is not None:
+            api_entry["*"] = decompress_text(row["old_blob"], row["old_flags"])
 
         # add special values
         if row["nss_name"]:
@@ -172,15 +156,16 @@ class Revisions(SelectBase):
             api_entry["anon"] = ""
         # parse rev_deleted
         if "rev_deleted" in row:
-            if row["rev_deleted"] & mwconst.DELETED_TEXT:
+            deleted = row["rev_deleted"]
+            if deleted & mwconst.DELETED_TEXT:
                 api_entry["sha1hidden"] = ""
                 # TODO: when should texthidden be added? only when content is requested?
 #                api_entry["texthidden"] = ""
-            if row["rev_deleted"] & mwconst.DELETED_COMMENT:
+            if deleted & mwconst.DELETED_COMMENT:
                 api_entry["commenthidden"] = ""
-            if row["rev_deleted"] & mwconst.DELETED_USER:
+            if deleted & mwconst.DELETED_USER:
                 api_entry["userhidden"] = ""
-            if row["rev_deleted"] & mwconst.DELETED_RESTRICTED:
+            if deleted & mwconst.DELETED_RESTRICTED:
                 api_entry["suppressed"] = ""
         # set tags to [] instead of None
         if "tag_names" in row:
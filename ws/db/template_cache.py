@@ -0,0 +1,162 @@
+#! /usr/bin/env python3
+
+import gzip
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+
+import sqlalchemy as sa
+import mwparserfromhell
+
+from ..parser_helpers.template_expansion import prepare_content_for_transclusion
+from ..parser_helpers.wikicode import is_redirect
+from ..utils import LRUCache
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["TemplateCache"]
+
+class TemplateCache:
+    """
+    Cache for the content of pages transcluded on the pages parsed by
+    :py:class:`ws.db.parser_cache.ParserCache`.
+
+    The entries are keyed by the page title and the ID of its latest revision,
+    so they never become stale. The cached value is the content already
+    prepared by
+    :py:func:`ws.parser_helpers.template_expansion.prepare_content_for_transclusion`,
+    i.e. without the documentation which is usually wrapped in ``<noinclude>``
+    tags. The content is cached as text rather than as parsed wikicode, because
+    re-parsing it is cheaper than making a deep copy of the parsed tree for
+    each transclusion.
+
+    :param db: a :py:class:`ws.db.database.Database` instance
+    :param int max_size: maximum size (in bytes) of the in-memory cache
+    :param int max_revids:
+        maximum number of cached lookups of the latest revision IDs
+    :param str cache_dir:
+        If not ``None``, the entries are also stored in files under this
+        directory, so they can be reused by worker processes and subsequent
+        runs.
+    """
+
+    def __init__(self, db, *, max_size=64 * 1024**2, max_revids=65536, cache_dir=None):
+        self.db = db
+        self.memory = LRUCache(max_size, sizeof=sys.getsizeof)
+        if cache_dir is not None:
+            dbname = db.engine.url.database or "default"
+            self.cache_dir = os.path.join(cache_dir, "ParserCache", dbname, "templates")
+            os.makedirs(self.cache_dir, exist_ok=True)
+        else:
+            self.cache_dir = None
+        # the pages are not modified while the parser cache is updated, so the
+        # lookup of the latest revision IDs is evicted only to bound the memory
+        self._latest_revids = LRUCache(max_revids)
+
+    def _get_latest_revid(self, title):
+        try:
+            return self._latest_revids[title]
+        except KeyError:
+            pass
+
+        t = self.db.Title(title)
+        page = self.db.page
+        query = sa.select([page.c.page_latest]).where(
+                    (page.c.page_namespace == t.namespacenumber) &
+                    (page.c.page_title == t.dbtitle(t.namespacenumber))
+                )
+        revid = self.db.engine.execute(query).scalar()
+        self._latest_revids[title] = revid
+        return revid
+
+    def _fetch_content(self, title):
+        pages_gen = self.db.query(titles=title, prop="latestrevisions", rvprop="content")
+        page = next(pages_gen)
+
+        if "revisions" in page:
+            if "*" in page["revisions"][0]:
+                return page["revisions"][0]["*"]
+            else:
+                logger.error("ParserCache: no latest revision found for page [[{}]]".format(page["title"]))
+                raise ValueError
+        else:
+            # no revision => page does not exist
+            logger.warn("ParserCache: page not found: {{" + title + "}}")
+            raise ValueError
+
+    @staticmethod
+    def _prepare(content):
+        wikicode = mwparserfromhell.parse(content)
+        prepare_content_for_transclusion(wikicode)
+        prepared = str(wikicode)
+        # expand_templates follows redirects in the returned content, so the
+        # preparation must not create or break a redirect (e.g. in
+        # "<includeonly>#REDIRECT [[Foo]]</includeonly>")
+        if is_redirect(content) or is_redirect(prepared):
+            return content
+        return prepared
+
+    def _get_path(self, title, revid):
+        key = "{}\n{}".format(revid, title).encode("utf-8")
+        return os.path.join(self.cache_dir, hashlib.sha1(key).hexdigest() + ".gz")
+
+    def _load(self, title, revid):
+        if self.cache_dir is None:
+            return None
+        try:
+            with gzip.open(self._get_path(title, revid), "rt", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, UnicodeDecodeError):
+            logger.warning("ParserCache: ignoring corrupted cache entry for page [[{}]], revision {}".format(title, revid))
+            return None
+
+    def _save(self, title, revid, content):
+        if self.cache_dir is None:
+            return
+        # write into a temporary file and atomically move it into place,
+        # other processes may read the same entry concurrently
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp_path, self._get_path(title, revid))
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def get(self, title):
+        """
+        Returns the content of the latest revision of a page, prepared for
+        transclusion.
+
+        :param str title: the title of the transcluded page
+        :raises ValueError: if the page does not exist
+        """
+        revid = self._get_latest_revid(title)
+        if revid is None:
+            logger.warn("ParserCache: page not found: {{" + title + "}}")
+            raise ValueError
+
+        key = (title, revid)
+        try:
+            return self.memory[key]
+        except KeyError:
+            pass
+
+        content = self._load(title, revid)
+        if content is None:
+            content = self._prepare(self._fetch_content(title))
+            self._save(title, revid, content)
+        self.memory[key] = content
+        return content
+
+    def cache_info(self):
+        """
+        Returns the statistics of the in-memory cache, see
+        :py:meth:`ws.utils.LRUCache.cache_info`.
+        """
+        return self.memory.cache_info()
@@ -74,16 +74,16 @@ class InterlanguageLinks:
         # not necessary to wrap in each iteration since lists are mutable
         wrapped_titles = ws.utils.ListOfDictsAttrWrapper(allpages, "title")
 
-        for ns in self.content_namespaces:
-            g = self.api.generator(generator="allpages", gapfilterredir="nonredirects", gapnamespace=ns, gaplimit="max", prop="langlinks", lllimit="max")
-            for page in g:
-                # the same page may be yielded multiple times with different pieces
-                # of the information, hence the ws.utils.dmerge
-                try:
-                    db_page = ws.utils.bisect_find(allpages, page["title"], index_list=wrapped_titles)
-                    ws.utils.dmerge(page, db_page)
-                except IndexError:
-                    ws.utils.bisect_insert_or_replace(allpages, page["title"], data_element=page, index_list=wrapped_titles)
+        params_list = [dict(generator="allpages", gapfilterredir="nonredirects", gapnamespace=ns, gaplimit="max", prop="langlinks", lllimit="max")
+                       for ns in self.content_namespaces]
+        for page in self.api.generator_parallel(params_list):
+            # the same page may be yielded multiple times with different pieces
+            # of the information, hence the ws.utils.dmerge
+            try:
+                db_page = ws.utils.bisect_find(allpages, page["title"], index_list=wrapped_titles)
+                ws.utils.dmerge(page, db_page)
+            except IndexError:
+                ws.utils.bisect_insert_or_replace(allpages, page["title"], data_element=page, index_list=wrapped_titles)
 
         # sort by title
         allpages.sort(key=lambda page: page["title"])
@@ -1,5 +1,6 @@
 #! /usr/bin/env python3
 
+from copy import deepcopy
 import logging
 
 import mwparserfromhell
@@ -7,12 +8,14 @@ import mwparserfromhell
 from . import encodings
 from .title import Title, TitleError
 from .wikicode import parented_ifilter, is_redirect
+from ..utils import LRUCache
 
 logger = logging.getLogger(__name__)
 
 __all__ = [
-    "MagicWords", "prepare_content_for_rendering", "prepare_template_for_transclusion",
-    "expand_templates",
+    "MagicWords", "prepare_content_for_rendering", "prepare_content_for_transclusion",
+    "prepare_template_for_transclusion", "substitute_template_arguments",
+    "ExpansionCache", "expand_templates",
 ]
 
 class MagicWords:
@@ -321,17 +324,16 @@ def prepare_content_for_rendering(wikicode):
                 # this may happen for nested tags which were previously removed/replaced
                 pass
 
-def prepare_template_for_transclusion(wikicode, template):
+def prepare_content_for_transclusion(wikicode):
     """
-    Prepares the wikicode of a template for transclusion:
+    Handles the `partial transclusion`_ tags ``<noinclude>``, ``<includeonly>``
+    and ``<onlyinclude>`` in the wikicode of a transcluded page.
 
-    - the `partial transclusion`_ tags ``<noinclude>``, ``<includeonly>``
-      and ``<onlyinclude>`` are handled
-    - template arguments (``{{{foo}}}`` etc.) are substituted with the supplied
-      parameters as specified on the target page
+    This is the part of :py:func:`prepare_template_for_transclusion` which
+    does not depend on the template parameters, so its result can be cached
+    for each revision of the transcluded page.
 
-    :param wikicode: the wikicode of the template
-    :param template: the template object holding parameters for substitution
+    :param wikicode: the wikicode of the transcluded page
     :returns: ``None``, the wikicode is modified in place.
 
     .. _`partial transclusion`: https://www.mediawiki.org/wiki/Transclusion#Partial_transclusion
@@ -361,6 +363,39 @@ def prepare_template_for_transclusion(wikicode, template):
                 # this may happen for nested tags which were previously removed/replaced
                 pass
 
+def prepare_template_for_transclusion(wikicode, template):
+    """
+    Prepares the wikicode of a template for transclusion:
+
+    - the `partial transclusion`_ tags ``<noinclude>``, ``<includeonly>``
+      and ``<onlyinclude>`` are handled (see
+      :py:func:`prepare_content_for_transclusion`)
+    - template arguments (``{{{foo}}}`` etc.) are substituted with the supplied
+      parameters as specified on the target page
+
+    :param wikicode: the wikicode of the template
+    :param template: the template object holding parameters for substitution
+    :returns: ``None``, the wikicode is modified in place.
+
+    .. _`partial transclusion`: https://www.mediawiki.org/wiki/Transclusion#Partial_transclusion
+    """
+    prepare_content_for_transclusion(wikicode)
+    substitute_template_arguments(wikicode, template)
+
+def substitute_template_arguments(wikicode, template):
+    """
+    Substitutes template arguments (``{{{foo}}}`` etc.) in the wikicode of a
+    template with the supplied parameters as specified on the target page.
+
+    This is the part of :py:func:`prepare_template_for_transclusion` which
+    depends on the template parameters. It should be used instead of
+    :py:func:`prepare_template_for_transclusion` for content which was already
+    passed to :py:func:`prepare_content_for_transclusion`.
+
+    :param wikicode: the wikicode of the template
+    :param template: the template object holding parameters for substitution
+    :returns: ``None``, the wikicode is modified in place.
+    """
     # wrapper function with protection against infinite recursion
     def substitute(wikicode, template, substituted_args):
         for arg in wikicode.ifilter_arguments(recursive=wikicode.RECURSE_OTHERS):
@@ -385,8 +420,79 @@ def prepare_template_for_transclusion(wikicode, template):
     # substitute template arguments
     substitute(wikicode, template, set())
 
+class _ExpansionRecord:
+    """
+    Collects the information needed to reuse the expansion of a template
+    invocation, see :py:class:`ExpansionCache`.
+    """
+    __slots__ = ("titles", "keys", "title_dependent", "cacheable")
+
+    def __init__(self):
+        # titles passed to the content getter function
+        self.titles = {}
+        # keys added to the set of visited templates
+        self.keys = set()
+        self.title_dependent = False
+        self.cacheable = True
+
+    def merge(self, other):
+        self.titles.update(other.titles)
+        self.keys.update(other.keys)
+        self.title_dependent = self.title_dependent or other.title_dependent
+        self.cacheable = self.cacheable and other.cacheable
+
+class ExpansionCache:
+    """
+    Cache for the results of template expansion, which can be passed to
+    :py:func:`expand_templates` to expand each template invocation only once.
+
+    The cache is keyed by the text of the template invocation. If the
+    expansion depends on the title of the page where the template is expanded
+    (e.g. via magic words like ``{{PAGENAME}}`` or relative transclusions), the
+    title is added to the key. Expansions affected by the infinite loop
+    protection are not cached. The cached wikicode is deep-copied for each use.
+
+    Note that the cached expansions depend on the content getter function
+    passed to :py:func:`expand_templates`, so an instance should be used only
+    with content getters returning the same content for the same title. The
+    cache is cleared automatically when it is used with a different title
+    context.
+
+    :param int max_size: maximum number of cached expansions
+    """
+
+    def __init__(self, max_size=1024):
+        self.context = None
+        self.entries = LRUCache(max_size)
+
+    def clear(self):
+        self.entries.clear()
+
+    def cache_info(self):
+        """
+        Returns the cache statistics, see
+        :py:meth:`ws.utils.LRUCache.cache_info`.
+        """
+        return self.entries.cache_info()
+
+    def _get(self, title, key):
+        if title.context is not self.context:
+            self.clear()
+            self.context = title.context
+        independent_key = (None,) + key
+        if independent_key in self.entries:
+            return self.entries[independent_key]
+        return self.entries.get((str(title),) + key)
+
+    def _set(self, title, key, record, wikicode):
+        if record.title_dependent:
+            key = (str(title),) + key
+        else:
+            key = (None,) + key
+        self.entries[key] = (record, wikicode)
+
 def expand_templates(title, wikicode, content_getter_func, *,
-                     substitute_magic_words=True):
+                     substitute_magic_words=True, cache=None, content_is_prepared=False):
     """
     Recursively expands all templates on a MediaWiki page.
 
@@ -406,6 +512,15 @@ def expand_templates(title, wikicode, content_getter_func, *,
     :param bool substitute_magic_words:
         Whether to substitute `magic words`_. Note that only a couple of
         interesting/important cases are actually handled.
+    :param ExpansionCache cache:
+        An optional cache of expanded templates, which can be shared across
+        multiple calls. When a cached expansion is used, the content getter
+        function is still called for all pages transcluded by the original
+        expansion.
+    :param bool content_is_prepared:
+        Whether the content getter function returns content which was already
+        passed to :py:func:`prepare_content_for_transclusion`. In that case
+        only the template arguments are substituted on each transclusion.
     :returns: ``None``, the wikicode is modified in place.
 
     .. _`magic words`: https://www.mediawiki.org/wiki/Help:Magic_words
@@ -413,6 +528,17 @@ def expand_templates(title, wikicode, content_getter_func, *,
     if not isinstance(wikicode, mwparserfromhell.wikicode.Wikicode):
         raise TypeError("wikicode is of type {} instead of mwparserfromhell.wikicode.Wikicode".format(type(wikicode)))
 
+    # stack of records for the expansions which are currently in progress
+    # (used only with the cache)
+    records = []
+
+    if cache is not None:
+        _content_getter_func = content_getter_func
+        def content_getter_func(title):
+            if records:
+                records[-1].titles[str(title)] = title
+            return _content_getter_func(title)
+
     def get_target_title(src_title, title):
         target = Title(src_title.context, title)
         if title.startswith("/"):
@@ -424,6 +550,113 @@ def expand_templates(title, wikicode, content_getter_func, *,
             target.namespace = target.context.namespaces[10]["*"]
         return target
 
+    def transclude(title, template, name, modifier, original_name, content_getter_func, visited_templates):
+        """
+        Returns the expanded content of the transcluded page, the replacement
+        for a missing page or ``None`` if the template should not be replaced.
+        """
+        try:
+            target_title = get_target_title(title, name)
+        except TitleError:
+            logger.error("Invalid transclusion on page [[{}]]: {}".format(title, template))
+            return None
+
+        try:
+            content = content_getter_func(target_title)
+        except ValueError:
+            if not modifier:
+                # If the target page does not exist, MediaWiki just skips the expansion,
+                # but it renders a wikilink to the non-existing page.
+                return "[[{}]]".format(target_title)
+            else:
+                # Restore the modifier, but don't render a wikilink.
+                template.name = original_name
+                return None
+
+        # handle transclusion of redirects, protecting against infinite loops
+        _requested_pages = set()
+        # Fortunately, even MediaWiki is not that crazy to treat things like "#{{echo|redirect}} [[foo]]",
+        # "#redirect {{echo|[[foo]]}}" or "#redirect [[{{echo|foo}}]]" as redirects.
+        while is_redirect(content):
+            _wikicode = mwparserfromhell.parse(content)
+            # the redirect target is just the first wikilink
+            _redirect_target = _wikicode.filter_wikilinks()[0]
+            _redirect_target = str(_redirect_target.title)
+            try:
+                content = content_getter_func(Title(title.context, _redirect_target))
+            except ValueError:
+                # if the redirect does not point to a valid page, MediaWiki just renders
+                # "#redirect [[Foo]]" as a normal wikicode
+                pass
+            # protect against infinite redirect loop
+            if _redirect_target in _requested_pages:
+                break
+            _requested_pages.add(_redirect_target)
+
+        # Note:
+        # MW has a special case when the first character produced by the template is one of ":;*#", MediaWiki inserts a linebreak
+        # reference: https://en.wikipedia.org/wiki/Help:Template#Problems_and_workarounds
+        # TODO: check what happens in our case
+        # the content of a redirect which could not be followed is not prepared
+        # (see ws.db.template_cache.TemplateCache)
+        prepared = content_is_prepared and not is_redirect(content)
+        content = mwparserfromhell.parse(content)
+        if prepared:
+            substitute_template_arguments(content, template)
+        else:
+            prepare_template_for_transclusion(content, template)
+
+        # expand only if the infinite loop checker does not kick in
+        _key = str(template)
+        if records:
+            records[-1].keys.add(_key)
+        if _key not in visited_templates:
+            visited_templates.add(_key)
+            expand(title, content, content_getter_func, visited_templates)
+            visited_templates.remove(_key)
+        else:
+            if records:
+                records[-1].cacheable = False
+            # MediaWiki fallback message
+            content = "<span class=\"error\">Template loop detected: [[{}]]</span>".format(target_title)
+
+        return content
+
+    def cached_transclude(title, template, name, modifier, original_name, content_getter_func, visited_templates):
+        """
+        Wrapper around :py:func:`transclude` using the cache.
+        """
+        key = (str(template), substitute_magic_words)
+        entry = cache._get(title, key)
+        # the cached expansion is valid only if the infinite loop checker would not kick in
+        if entry is not None and entry[0].keys.isdisjoint(visited_templates):
+            record, content = entry
+            # call the content getter for its side effects (e.g. tracking of transclusions)
+            for target_title in record.titles.values():
+                try:
+                    content_getter_func(target_title)
+                except ValueError:
+                    pass
+            if records:
+                records[-1].merge(record)
+            return deepcopy(content)
+
+        record = _ExpansionRecord()
+        # relative transclusions depend on the title of the page
+        if name.startswith("/"):
+            record.title_dependent = True
+        records.append(record)
+        try:
+            content = transclude(title, template, name, modifier, original_name, content_getter_func, visited_templates)
+        finally:
+            records.pop()
+
+        if isinstance(content, mwparserfromhell.wikicode.Wikicode) and record.cacheable:
+            cache._set(title, key, record, deepcopy(content))
+        if records:
+            records[-1].merge(record)
+        return content
+
     def expand(title, wikicode, content_getter_func, visited_templates):
         """
         Adds infinite loop protection to the functionality declared by :py:func:`expand_templates`.
@@ -455,6 +688,9 @@ def expand_templates(title, wikicode, content_getter_func, *,
             # handle magic words
             if MagicWords.is_magic_word(name):
                 if substitute_magic_words is True:
+                    # variables like {{PAGENAME}} depend on the title of the page
+                    if records and name in MagicWords.VARIABLES:
+                        records[-1].title_dependent = True
                     # MW incompatibility: in some cases, MediaWiki tries to transclude a template
                     # if the parser function failed (e.g. "{{ns:Foo}}" -> "{{Template:Ns:Foo}}")
                     mw = MagicWords(title)
@@ -466,64 +702,13 @@ def expand_templates(title, wikicode, content_getter_func, *,
 #                        wikicode.replace(template, replacement)
                         parent.replace(template, replacement, recursive=False)
             else:
-                try:
-                    target_title = get_target_title(title, name)
-                except TitleError:
-                    logger.error("Invalid transclusion on page [[{}]]: {}".format(title, template))
-                    continue
-
-                try:
-                    content = content_getter_func(target_title)
-                except ValueError:
-                    if not modifier:
-                        # If the target page does not exist, MediaWiki just skips the expansion,
-                        # but it renders a wikilink to the non-existing page.
-#                        wikicode.replace(template, "[[{}]]".format(target_title))
-                        parent.replace(template, "[[{}]]".format(target_title), recursive=False)
-                    else:
-                        # Restore the modifier, but don't render a wikilink.
-                        template.name = original_name
-                    continue
-
-                # handle transclusion of redirects, protecting against infinite loops
-                _requested_pages = set()
-                # Fortunately, even MediaWiki is not that crazy to treat things like "#{{echo|redirect}} [[foo]]",
-                # "#redirect {{echo|[[foo]]}}" or "#redirect [[{{echo|foo}}]]" as redirects.
-                while is_redirect(content):
-                    _wikicode = mwparserfromhell.parse(content)
-                    # the redirect target is just the first wikilink
-                    _redirect_target = _wikicode.filter_wikilinks()[0]
-                    _redirect_target = str(_redirect_target.title)
-                    try:
-                        content = content_getter_func(Title(title.context, _redirect_target))
-                    except ValueError:
-                        # if the redirect does not point to a valid page, MediaWiki just renders
-                        # "#redirect [[Foo]]" as a normal wikicode
-                        pass
-                    # protect against infinite redirect loop
-                    if _redirect_target in _requested_pages:
-                        break
-                    _requested_pages.add(_redirect_target)
-
-                # Note:
-                # MW has a special case when the first character produced by the template is one of ":;*#", MediaWiki inserts a linebreak
-                # reference: https://en.wikipedia.org/wiki/Help:Template#Problems_and_workarounds
-                # TODO: check what happens in our case
-                content = mwparserfromhell.parse(content)
-                prepare_template_for_transclusion(content, template)
-
-                # expand only if the infinite loop checker does not kick in
-                _key = str(template)
-                if _key not in visited_templates:
-                    visited_templates.add(_key)
-                    expand(title, content, content_getter_func, visited_templates)
-                    visited_templates.remove(_key)
+                if cache is None:
+                    content = transclude(title, template, name, modifier, original_name, content_getter_func, visited_templates)
                 else:
-                    # MediaWiki fallback message
-                    content = "<span class=\"error\">Template loop detected: [[{}]]</span>".format(target_title)
-
-#                wikicode.replace(template, content)
-                parent.replace(template, content, recursive=False)
+                    content = cached_transclude(title, template, name, modifier, original_name, content_getter_func, visited_templates)
+                if content is not None:
+#                    wikicode.replace(template, content)
+                    parent.replace(template, content, recursive=False)
 
     prepare_content_for_rendering(wikicode)
     expand(title, wikicode, content_getter_func, set())
@@ -96,6 +96,8 @@ class Context:
         Standard equality comparison operator. Comparing API-based and
         Database-based contexts is possible.
         """
+        if self is other:
+            return True
         return self.interwikimap == other.interwikimap and \
                self.namespacenames == other.namespacenames and \
                self.namespaces == other.namespaces and \
@@ -6,8 +6,11 @@ from .base_enc import *
 from .containers import *
 from .datetime_ import *
 from .json import *
+from .json_stream import *
 from .lazy import *
+from .lru import *
 from .OrderedSet import *
+from .parallel import *
 from .rate import *
 
 # test if given string is ASCII
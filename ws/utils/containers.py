@@ -104,48 +104,151 @@ def gen_nested_values(indict, keys=None):
     else:
         yield keys, indict
 
+# Names of the timestamp fields in the MediaWiki API responses. The keys not
+# listed here are classified by _is_timestamp_key on first use and the result
+# is stored in this table (up to _TIMESTAMP_KEYS_MAX_SIZE entries, because
+# some responses use e.g. page IDs as keys), so each key name is examined
+# only once.
+_TIMESTAMP_KEYS = {
+    key: True for key in [
+        # prop=revisions, list=allrevisions, list=recentchanges, list=logevents,
+        # list=usercontribs, list=deletedrevs, prop=deletedrevisions, ...
+        "timestamp",
+        # prop=info
+        "touched", "starttimestamp", "notificationtimestamp",
+        # list=allusers, list=users, meta=userinfo
+        "registration", "blockedtimestamp", "blockexpiry",
+        # list=blocks, prop=info (inprop=protection), list=protectedtitles
+        "expiry",
+        # edit and other actions
+        "newtimestamp", "curtimestamp",
+    ]
+}
+_TIMESTAMP_KEYS.update({
+    key: False for key in [
+        "title", "ns", "pageid", "revid", "parentid", "user", "userid", "comment",
+        "parsedcomment", "size", "sha1", "contentformat", "contentmodel", "*",
+        "type", "level", "minor", "tags", "query", "pages", "continue",
+    ]
+})
+_TIMESTAMP_KEYS_MAX_SIZE = 4096
+
+def _is_timestamp_key(key):
+    try:
+        return _TIMESTAMP_KEYS[key]
+    except KeyError:
+        pass
+    result = False
+    if isinstance(key, str):
+        result = ("timestamp" in key or "registration" in key or
+                  "expiry" in key or "touched" in key)
+    if len(_TIMESTAMP_KEYS) < _TIMESTAMP_KEYS_MAX_SIZE:
+        _TIMESTAMP_KEYS[key] = result
+    return result
+
+def _parse_timestamp_value(value):
+    """
+    Returns the parsed timestamp, or ``value`` if it is not a timestamp.
+    """
+    if len(value) == 20:
+        if (value[4] == "-" and value[7] == "-" and value[10] == "T" and
+                value[13] == ":" and value[16] == ":" and value[19] == "Z"):
+            try:
+                return parse_date(value)
+            except ValueError:
+                pass
+        return value
+    lower = value.lower()
+    if lower == "infinity":
+        return datetime.datetime.max
+    elif lower == "-infinity":
+        return datetime.datetime.min
+    elif lower == "indefinite":
+        return None
+    return value
+
 def parse_timestamps_in_struct(struct):
     """
     Convert all timestamps in a nested structure from str to
     datetime.datetime.
+
+    A string is considered to be a timestamp if the key of any enclosing
+    dictionary contains ``timestamp``, ``registration``, ``expiry`` or
+    ``touched`` (e.g. ``rc["timestamp"]`` or ``user["blockexpiry"]``) and the
+    value has the ISO 8601 format used by MediaWiki or is one of the special
+    values ``infinity``, ``-infinity`` and ``indefinite``.
+
+    The structure is walked in a single pass and the key names are classified
+    using a lookup table, see ``_TIMESTAMP_KEYS``.
     """
-    def set_ts(struct, keys, value):
-        for k in keys[:-1]:
-            struct = struct[k]
-        struct[keys[-1]] = value
-
-    for keys, value in gen_nested_values(struct):
-        if isinstance(value, str):
-            # skip fields which are not timestamps (e.g. user=infinity)
-            _strkeys = "".join(str(k) for k in keys)
-            if "timestamp" not in _strkeys and "registration" not in _strkeys and "expiry" not in _strkeys and "touched" not in _strkeys:
-                continue
-
-            if value.lower() == "infinity":
-                set_ts(struct, keys, datetime.datetime.max)
-            elif value.lower() == "-infinity":
-                set_ts(struct, keys, datetime.datetime.min)
-            elif value.lower() == "indefinite":
-                set_ts(struct, keys, None)
-            elif (len(value) == 20 and value[4] == "-" and value[7] == "-" and
-                    value[10] == "T" and value[13] == ":" and value[16] == ":"
-                    and value[19] == "Z"):
-                try:
-                    ts = parse_date(value)
-                except ValueError:
-                    continue
-                set_ts(struct, keys, ts)
+    get_key = _TIMESTAMP_KEYS.get
+    # explicit stack of (container, is_timestamp) pairs instead of recursion
+    stack = [(struct, False)]
+    while stack:
+        container, in_timestamp = stack.pop()
+        if isinstance(container, dict):
+            for key, value in container.items():
+                is_timestamp = in_timestamp
+                if not is_timestamp:
+                    is_timestamp = get_key(key)
+                    if is_timestamp is None:
+                        is_timestamp = _is_timestamp_key(key)
+                if isinstance(value, str):
+                    if is_timestamp:
+                        parsed = _parse_timestamp_value(value)
+                        if parsed is not value:
+                            container[key] = parsed
+                elif isinstance(value, (dict, list, tuple)):
+                    stack.append((value, is_timestamp))
+        elif isinstance(container, list):
+            # list items inherit the classification of the list
+            for i, value in enumerate(container):
+                if isinstance(value, str):
+                    if in_timestamp:
+                        parsed = _parse_timestamp_value(value)
+                        if parsed is not value:
+                            container[i] = parsed
+                elif isinstance(value, (dict, list, tuple)):
+                    stack.append((value, in_timestamp))
+        else:
+            # tuples are immutable, but they may contain mutable containers
+            for value in container:
+                if isinstance(value, (dict, list, tuple)):
+                    stack.append((value, in_timestamp))
 
 def serialize_timestamps_in_struct(struct):
     """
-    Convert all timestamps in a nested structure from str to
-    datetime.datetime.
+    Convert all timestamps in a nested structure from datetime.datetime to
+    str.
     """
-    def set_ts(struct, keys, value):
-        for k in keys[:-1]:
-            struct = struct[k]
-        struct[keys[-1]] = value
-
-    for keys, value in gen_nested_values(struct):
-        if isinstance(value, datetime.datetime):
-            set_ts(struct, keys, format_date(value))
+    stack = [struct]
+    while stack:
+        container = stack.pop()
+        if isinstance(container, dict):
+            items = container.items()
+        else:
+            items = enumerate(container)
+        for key, value in items:
+            if isinstance(value, datetime.datetime):
+                container[key] = format_date(value)
+            elif isinstance(value, (dict, list)):
+                stack.append(value)
+            elif isinstance(value, tuple):
+                for item in value:
+                    if isinstance(item, (dict, list)):
+                        stack.append(item)
+
+def serialize_timestamps(struct):
+    """
+    Like :py:func:`serialize_timestamps_in_struct`, but the structure is not
+    modified. Returns a copy of the structure where the timestamps are
+    converted to str. Only the containers (dicts, lists, tuples and sets) are
+    copied, the other values are shared with the original structure.
+    """
+    if isinstance(struct, datetime.datetime):
+        return format_date(struct)
+    elif isinstance(struct, dict):
+        return {key: serialize_timestamps(value) for key, value in struct.items()}
+    elif isinstance(struct, (list, tuple, set)):
+        return type(struct)(serialize_timestamps(value) for value in struct)
+    return struct
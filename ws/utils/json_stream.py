@@ -0,0 +1,179 @@
+#! /usr/bin/env python3
+
+import json
+import re
+
+__all__ = ["iter_json_stream"]
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+class _Reader:
+    """
+    Reads JSON values from a stream of text chunks. Only the unconsumed part
+    of the stream is kept in the buffer.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """
+        Appends the next chunk to the buffer, returns ``False`` at the end of
+        the stream.
+        """
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.eof = True
+        return False
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self.buffer, self.pos)
+
+    def peek(self):
+        """
+        Skips whitespace and returns the next character.
+        """
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise self._error("Unexpected end of data")
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error("Expecting '{}'".format(char))
+        self.pos += 1
+
+    def value(self):
+        """
+        Decodes the next complete value.
+        """
+        self.peek()
+        # length of the data needed for the next attempt, it is doubled after
+        # each failed attempt to avoid quadratic complexity for huge values
+        needed = 0
+        while True:
+            if len(self.buffer) - self.pos < needed and self._fill():
+                continue
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value may be incomplete
+                if self.eof:
+                    raise
+                needed = 2 * (len(self.buffer) - self.pos) + 1
+                continue
+            # a number or literal at the end of the buffer may be incomplete
+            if end == len(self.buffer) and not self.eof:
+                needed = end - self.pos + 1
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self):
+        """
+        Yields the keys of the next object. The caller has to consume the value
+        after each key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != "\"":
+                raise self._error("Expecting property name enclosed in double quotes")
+            key = self.value()
+            self.expect(":")
+            yield key
+            c = self.peek()
+            self.pos += 1
+            if c == "}":
+                return
+            elif c != ",":
+                self.pos -= 1
+                raise self._error("Expecting ',' delimiter")
+
+    def iter_array(self):
+        """
+        Yields the indexes of the next array. The caller has to consume the
+        value after each index.
+        """
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        i = 0
+        while True:
+            yield i
+            c = self.peek()
+            self.pos += 1
+            if c == "]":
+                return
+            elif c != ",":
+                self.pos -= 1
+                raise self._error("Expecting ',' delimiter")
+            i += 1
+
+def iter_json_stream(chunks, paths):
+    """
+    Incrementally decodes a JSON document whose top-level value is an object.
+
+    The members of the containers at the given ``paths`` are decoded and
+    yielded one by one, so that the memory usage is bounded by the size of the
+    largest member rather than by the size of the document. The other values
+    are decoded as a whole. Every value in the document is yielded exactly once
+    as a ``(path, key, value)`` tuple, where ``key`` is the key (or the index)
+    of ``value`` in the container at ``path``. For example, for
+    ``paths={("query", "pages")}`` the document
+
+    .. code-block:: json
+
+        {"continue": {"rvcontinue": "123"}, "query": {"pages": {"1": {...}, "2": {...}}}}
+
+    produces ``((), "continue", {"rvcontinue": "123"})``, then
+    ``(("query", "pages"), "1", {...})`` and ``(("query", "pages"), "2", {...})``.
+    If a value at the given path is not an object or array, it is yielded as
+    a whole.
+
+    :param chunks: an iterable of :py:class:`str` chunks of the document
+    :param paths: a set of tuples of object keys
+    :raises json.JSONDecodeError: when the document is invalid
+    """
+    paths = set(paths)
+    prefixes = {path[:i] for path in paths for i in range(len(path))}
+    reader = _Reader(chunks)
+
+    def walk(path):
+        c = reader.peek()
+        streamed = path in paths
+        if c == "{":
+            for key in reader.iter_object():
+                child = path + (key,)
+                if not streamed and (child in paths or child in prefixes):
+                    yield from walk(child)
+                else:
+                    yield path, key, reader.value()
+        elif c == "[" and streamed:
+            for i in reader.iter_array():
+                yield path, i, reader.value()
+        else:
+            yield path[:-1], path[-1], reader.value()
+
+    if reader.peek() != "{":
+        raise reader._error("Expecting '{'")
+    yield from walk(())
+
+    # only whitespace can follow the top-level object
+    reader.pos = _whitespace.match(reader.buffer, reader.pos).end()
+    while reader.pos == len(reader.buffer) and reader._fill():
+        reader.pos = _whitespace.match(reader.buffer, reader.pos).end()
+    if reader.pos < len(reader.buffer):
+        raise reader._error("Extra data")
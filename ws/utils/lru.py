@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+
+import collections
+import threading
+
+__all__ = ["LRUCache"]
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+class LRUCache:
+    """
+    A dict-like container which keeps the most recently used items. When the
+    total size of the stored values exceeds the limit, the least recently used
+    items are discarded.
+
+    :param int max_size: maximum total size of the stored values
+    :param sizeof:
+        a function returning the size of a value. By default each value has
+        size 1, i.e. ``max_size`` limits the number of items. Values larger
+        than ``max_size`` are never stored.
+
+    The cache is thread-safe, so it can be shared e.g. by grabbers running
+    concurrently on the same database.
+    """
+
+    def __init__(self, max_size, sizeof=None):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.sizeof = sizeof if sizeof is not None else lambda value: 1
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self._discard(key)
+            if size > self.max_size:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.size += size
+            while self.size > self.max_size:
+                self._discard(next(iter(self._data)))
+
+    def _discard(self, key):
+        # must be called with self._lock held
+        del self._data[key]
+        self.size -= self._sizes.pop(key)
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.size = 0
+
+    def cache_info(self):
+        """
+        Returns a named tuple with the cache statistics, similarly to
+        :py:func:`functools.lru_cache`.
+        """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.max_size, self.size)
@@ -0,0 +1,88 @@
+#! /usr/bin/env python3
+
+import collections
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = ["parallel_chain"]
+
+def parallel_chain(iterables, *, max_workers=4, buffer_size=16):
+    """
+    Similar to :py:func:`itertools.chain`, but the iterables are consumed
+    concurrently in a pool of threads. The items are yielded in the same order
+    as by :py:func:`itertools.chain`, regardless of the order in which the
+    threads produce them.
+
+    At most ``max_workers`` iterables are consumed at the same time and each of
+    them can get ahead of the caller by at most ``buffer_size`` items. The
+    iterable whose items are currently yielded always has a running thread, so
+    the chain cannot deadlock. Exceptions raised by the iterables are
+    re-raised in the caller when their position in the chain is reached.
+
+    :param iterables:
+        An iterable of iterables. It is consumed lazily in the caller's thread,
+        at most ``max_workers`` iterables ahead. The iterables themselves are
+        advanced only in the worker threads, so they should not share state
+        which is not thread-safe.
+    :param int max_workers: maximum number of concurrently consumed iterables
+    :param int buffer_size: maximum number of buffered items per iterable
+    """
+    if max_workers < 1:
+        raise ValueError("max_workers must be positive")
+
+    stop = threading.Event()
+
+    def put(q, item):
+        # returns False if the consumer has stopped
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(iterable, q):
+        try:
+            for item in iterable:
+                if not put(q, (True, item)):
+                    return
+        except BaseException as e:
+            put(q, (False, e))
+        else:
+            put(q, (False, None))
+
+    executor = ThreadPoolExecutor(max_workers)
+    iterables = iter(iterables)
+    # (future, queue) pairs of the iterables which are being consumed
+    pending = collections.deque()
+
+    def submit():
+        # take the iterables lazily to avoid exhausting e.g. a generator of chunks
+        while len(pending) < max_workers:
+            try:
+                iterable = next(iterables)
+            except StopIteration:
+                return
+            q = queue.Queue(buffer_size)
+            pending.append((executor.submit(produce, iterable, q), q))
+
+    try:
+        submit()
+        while pending:
+            _, q = pending[0]
+            while True:
+                is_item, value = q.get()
+                if not is_item:
+                    if value is not None:
+                        raise value
+                    break
+                yield value
+            pending.popleft()
+            submit()
+    finally:
+        stop.set()
+        for future, _ in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
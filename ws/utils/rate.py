@@ -2,6 +2,8 @@
 
 """
 :py:func:`RateLimited` is a rate limiting algorithm implemented as Python decorator.
+:py:class:`TokenBucket` and :py:class:`RateLimiter` are rate limiting objects,
+which are used for the requests made by :py:class:`ws.client.connection.Connection`.
 
 The original algorithm comes from this `StackOverflow answer`_ and has been modified
 to apply longer timeout when the rate limit is exceeded.
@@ -27,14 +29,16 @@ Or at runtime by wrapping the function call:
 """
 
 from functools import wraps
+import asyncio
 import time
 import logging
+import threading
 
 import ws
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["RateLimited"]
+__all__ = ["RateLimited", "TokenBucket", "RateLimiter"]
 
 def RateLimited(rate, per):
     def decorator(func):
@@ -42,6 +46,8 @@ def RateLimited(rate, per):
         # defined as lists to avoid problems with the 'global' keyword
         allowance = [rate]
         last_check = [time.time()]
+        # the decorated function may be called from multiple threads
+        lock = threading.Lock()
 
         @wraps(func)
         def rate_limit_func(*args, **kargs):
@@ -49,23 +55,24 @@ def RateLimited(rate, per):
             if hasattr(ws, "_tests_are_running"):
                 return func(*args, **kargs)
 
-            current = time.time()
-            time_passed = current - last_check[0]
-            last_check[0] = current
-            allowance[0] += time_passed * (rate / per)
-            if allowance[0] > rate:
-                allowance[0] = rate    # throttle
-            if allowance[0] < 1.0:
-                # the original used    to_sleep = (1 - allowance[0]) * (per / rate)
-                # but we want longer timeout after burst limit is exceeded
-                to_sleep = (1 - allowance[0]) * per
-                logger.info("rate limit for function {} exceeded, sleeping for {:0.3f} seconds".format(func.__qualname__, to_sleep))
-                time.sleep(to_sleep)
-                ret = func(*args, **kargs)
-                allowance[0] = rate
-            else:
-                ret = func(*args, **kargs)
-                allowance[0] -= 1.0
+            with lock:
+                current = time.time()
+                time_passed = current - last_check[0]
+                last_check[0] = current
+                allowance[0] += time_passed * (rate / per)
+                if allowance[0] > rate:
+                    allowance[0] = rate    # throttle
+                if allowance[0] < 1.0:
+                    # the original used    to_sleep = (1 - allowance[0]) * (per / rate)
+                    # but we want longer timeout after burst limit is exceeded
+                    to_sleep = (1 - allowance[0]) * per
+                    logger.info("rate limit for function {} exceeded, sleeping for {:0.3f} seconds".format(func.__qualname__, to_sleep))
+                    # other threads have to wait as well
+                    time.sleep(to_sleep)
+                    allowance[0] = rate
+                else:
+                    allowance[0] -= 1.0
+            ret = func(*args, **kargs)
             return ret
 
         return rate_limit_func
@@ -73,6 +80,197 @@ def RateLimited(rate, per):
     return decorator
 
 
+class TokenBucket:
+    """
+    Thread-safe implementation of the `token bucket`_ algorithm.
+
+    The bucket holds at most ``burst`` tokens and it is refilled with ``rate``
+    tokens per second. Each acquisition takes one token. When the bucket is
+    empty, the token is reserved in advance and the caller has to wait until
+    it is refilled, so the callers are served in the order of their arrival
+    and the lock is never held while waiting.
+
+    :param float rate: number of tokens added per second
+    :param float burst: capacity of the bucket
+
+    .. _`token bucket`: https://en.wikipedia.org/wiki/Token_bucket
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst must be at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+        # metrics
+        self.throttled_count = 0
+        self.throttled_time = 0
+
+    def _refill(self):
+        # must be called with self._lock held
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+        return now
+
+    def _reserve(self):
+        """
+        Takes one token and returns the number of seconds the caller has to
+        wait before proceeding.
+        """
+        with self._lock:
+            now = self._refill()
+            self._tokens -= 1
+            delay = max(-self._tokens / self.rate, self._blocked_until - now, 0)
+            if delay > 0:
+                self.throttled_count += 1
+                self.throttled_time += delay
+            return delay
+
+    def acquire(self):
+        """
+        Takes one token, sleeping if necessary.
+
+        :returns: the number of seconds spent sleeping
+        """
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        """
+        Same as :py:meth:`acquire`, but waits with :py:func:`asyncio.sleep`.
+        """
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def set_rate(self, rate):
+        """
+        Changes the rate of the bucket. The tokens added since the last
+        acquisition are settled at the old rate.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def block(self, seconds):
+        """
+        Makes all subsequent acquisitions wait at least ``seconds`` from now.
+        """
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+class RateLimiter:
+    """
+    Rate limiter with separate token buckets for reading and writing requests
+    and a backoff triggered by the server (e.g. MediaWiki's ``maxlag`` errors
+    or ``Retry-After`` headers).
+
+    The backoff is adaptive: each backoff halves the rates of both buckets
+    (at most to 1/16 of the configured rates) and each subsequent
+    successful request recovers 1% of the configured rates.
+
+    :param float read_rate: number of reading requests per second
+    :param float read_burst: maximum burst of reading requests
+    :param float write_rate: number of writing requests per second
+    :param float write_burst: maximum burst of writing requests
+    """
+
+    # default delay for backoffs without Retry-After
+    default_backoff = 5
+    # minimum fraction of the configured rates after backoffs
+    min_rate_factor = 1 / 16
+
+    def __init__(self, read_rate=10/3, read_burst=10, write_rate=10/3, write_burst=10):
+        self.buckets = {
+            "read": TokenBucket(read_rate, read_burst),
+            "write": TokenBucket(write_rate, write_burst),
+        }
+        self._rates = {kind: bucket.rate for kind, bucket in self.buckets.items()}
+        self._factor = 1
+        self._lock = threading.Lock()
+        self.backoff_count = 0
+        self.backoff_time = 0
+
+    @staticmethod
+    def _disabled():
+        # no rate-limiting inside tests
+        return hasattr(ws, "_tests_are_running")
+
+    def acquire(self, kind):
+        """
+        Waits until a request of the given kind (``"read"`` or ``"write"``)
+        can be made.
+
+        :returns: the number of seconds spent sleeping
+        """
+        if self._disabled():
+            return 0
+        delay = self.buckets[kind].acquire()
+        if delay > 0.5:
+            logger.info("rate limit for {} requests exceeded, slept for {:0.3f} seconds".format(kind, delay))
+        return delay
+
+    async def acquire_async(self, kind):
+        """
+        Same as :py:meth:`acquire`, but waits with :py:func:`asyncio.sleep`.
+        """
+        if self._disabled():
+            return 0
+        return await self.buckets[kind].acquire_async()
+
+    def _set_factor(self, factor):
+        # must be called with self._lock held
+        self._factor = min(1, max(self.min_rate_factor, factor))
+        for kind, bucket in self.buckets.items():
+            bucket.set_rate(self._rates[kind] * self._factor)
+
+    def backoff(self, seconds=None):
+        """
+        Blocks all requests for ``seconds`` (:py:attr:`default_backoff` by
+        default) and decreases the rates.
+        """
+        if seconds is None:
+            seconds = self.default_backoff
+        logger.warning("the server requested a backoff, waiting for {:0.1f} seconds".format(seconds))
+        with self._lock:
+            self.backoff_count += 1
+            self.backoff_time += seconds
+            self._set_factor(self._factor / 2)
+        for bucket in self.buckets.values():
+            bucket.block(seconds)
+
+    def success(self):
+        """
+        Notifies the limiter about a successful request, which gradually
+        restores the rates decreased by :py:meth:`backoff`.
+        """
+        if self._factor < 1:
+            with self._lock:
+                self._set_factor(self._factor + 0.01)
+
+    def stats(self):
+        """
+        Returns a dictionary with the metrics of the time spent throttled.
+        """
+        stats = {
+            "backoff_count": self.backoff_count,
+            "backoff_time": self.backoff_time,
+        }
+        for kind, bucket in self.buckets.items():
+            stats[kind + "_throttled_count"] = bucket.throttled_count
+            stats[kind + "_throttled_time"] = bucket.throttled_time
+        return stats
+
+
 if __name__ == "__main__":
     # wrap 'print' in rate limiting
     wrapped = RateLimited(10, 2)(print)